@@ -0,0 +1,381 @@
+"""
+Benchmarks for the screener hot paths on a synthetic filing corpus.
+
+Generates an `xbrl_data_json` tree in the same shape as `save_financials_as_json`
+output (plus `company_tickers.json` and the filing index), replays Yahoo / EDGAR /
+HTTP from fixtures (data_sources.ReplaySource) so nothing touches the network and
+timings are reproducible, and times:
+  - load_summary_table
+  - generate_graph for N companies x M variables
+  - compute_ratios per filing
+  - find_variables_and_sheets_by_concepts per filing
+  - get_variables_from_json_dict per filing
+
+Results are printed (or written with --out) as JSON, tagged with the git commit,
+so regressions can be tracked across commits.
+
+Usage:
+    python benchmark.py                          # 500 filings
+    python benchmark.py --filings 500 5000 50000 --out bench.json
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+REPO_DIR = os.path.dirname(os.path.abspath(__file__))
+
+FILINGS_PER_COMPANY = 20          # 5 years of quarterly filings
+FIRST_YEAR = 2019
+CORPUS_VERSION = 2                # bump when the generated shape changes
+
+# SIC codes handed out round-robin (fixture for company_metadata)
+_SIC_CODES = [3571, 7372, 2834, 6021, 1311, 4911, 5311, 3674, 2080, 4512]
+
+# (label, concept) rows with a meaning for the screener; the rest is filler so
+# statements have a realistic size (~40 rows each).
+_BALANCE_ROWS = [
+    ("Cash and cash equivalents", "us-gaap_CashAndCashEquivalentsAtCarryingValue"),
+    ("Total assets", "us-gaap_Assets"),
+    ("Total liabilities", "us-gaap_Liabilities"),
+    ("Commercial paper", "us-gaap_CommercialPaper"),
+    ("Term debt, current", "us-gaap_LongTermDebtCurrent"),
+    ("Term debt, non-current", "us-gaap_LongTermDebtNoncurrent"),
+    ("Total shareholders’ equity", "us-gaap_StockholdersEquity"),
+]
+_INCOME_ROWS = [
+    ("Total net sales", "us-gaap_RevenueFromContractWithCustomerExcludingAssessedTax"),
+    ("Income before provision for income taxes",
+     "us-gaap_IncomeLossFromContinuingOperationsBeforeIncomeTaxesExtraordinaryItemsNoncontrollingInterest"),
+    ("Net income", "us-gaap_NetIncomeLoss"),
+    ("Basic (in dollars per share)", "us-gaap_EarningsPerShareBasic"),
+    ("Diluted (in dollars per share)", "us-gaap_EarningsPerShareDiluted"),
+    ("Basic (in shares)", "us-gaap_WeightedAverageNumberOfSharesOutstandingBasic"),
+    ("Diluted (in shares)", "us-gaap_WeightedAverageNumberOfDilutedSharesOutstanding"),
+]
+_CASHFLOW_ROWS = [
+    ("Cash generated by operating activities", "us-gaap_NetCashProvidedByUsedInOperatingActivities"),
+    ("Payments for acquisition of property, plant and equipment",
+     "us-gaap_PaymentsToAcquirePropertyPlantAndEquipment"),
+]
+_ROWS_PER_SHEET = 40
+
+
+# ----------------------------- CORPUS ---------------------------------------
+def _quarter_ends(n: int):
+    ends = pd.date_range(f"{FIRST_YEAR}-01-01", periods=n, freq="QE")
+    return [d.to_pydatetime() for d in ends]
+
+
+def _sheet(rows, values, periods, rng):
+    """Statement dict-of-dicts: {period_label: {label: value}, 'concept': {...}, format columns}."""
+    labels = [label for label, _ in rows]
+    concepts = {label: concept for label, concept in rows}
+    for k in range(len(rows), _ROWS_PER_SHEET):
+        label = f"Other line item {k}"
+        labels.append(label)
+        concepts[label] = f"us-gaap_OtherLineItem{k}"
+        values[label] = float(rng.integers(1_000_000, 5_000_000_000))
+
+    sheet = {}
+    for i, period in enumerate(periods):
+        # comparative columns drift a bit from the current one
+        factor = 1.0 - 0.05 * i
+        sheet[period] = {label: str(round(values[label] * factor, 2)) for label in labels}
+    sheet["concept"] = concepts
+    sheet["level"] = {label: 1 for label in labels}
+    sheet["abstract"] = {label: False for label in labels}
+    sheet["units"] = {label: "usd" for label in labels}
+    sheet["decimals"] = {label: "-6" for label in labels}
+    return sheet
+
+
+def _filing_json(ticker, report_dt, index, rng, mapping_variables, ratio_names):
+    is_annual = report_dt.month == 12
+    if is_annual:
+        periods = [str(report_dt.year), str(report_dt.year - 1), str(report_dt.year - 2)]
+    else:
+        label = report_dt.strftime("%b %d, %Y")
+        periods = [label, report_dt.replace(year=report_dt.year - 1).strftime("%b %d, %Y")]
+
+    scale = float(rng.uniform(1e8, 5e11))
+    shares = float(rng.uniform(1e7, 1e10))
+    net_income = scale * float(rng.uniform(-0.05, 0.25))
+    values = {
+        "Cash and cash equivalents": scale * 0.1,
+        "Total assets": scale,
+        "Total liabilities": scale * 0.6,
+        "Commercial paper": scale * 0.01,
+        "Term debt, current": scale * 0.02,
+        "Term debt, non-current": scale * 0.2,
+        "Total shareholders’ equity": scale * 0.4,
+        "Total net sales": scale * 0.3,
+        "Income before provision for income taxes": net_income * 1.2,
+        "Net income": net_income,
+        "Basic (in dollars per share)": net_income / shares,
+        "Diluted (in dollars per share)": net_income / shares * 0.98,
+        "Basic (in shares)": shares,
+        "Diluted (in shares)": shares * 1.02,
+        "Cash generated by operating activities": net_income * 1.3,
+        "Payments for acquisition of property, plant and equipment": scale * 0.02,
+    }
+    price = float(rng.uniform(5, 500))
+    date = report_dt.strftime("%Y-%m-%d")
+    filed = (report_dt + pd.Timedelta(days=35 if not is_annual else 60)).strftime("%Y-%m-%d")
+
+    code_values = {}
+    for rows in (_BALANCE_ROWS, _INCOME_ROWS, _CASHFLOW_ROWS):
+        for label, concept in rows:
+            code_values[concept] = values[label]
+
+    return {
+        "balance_sheet": _sheet(_BALANCE_ROWS, dict(values), periods, rng),
+        "income": _sheet(_INCOME_ROWS, dict(values), periods, rng),
+        "cashflow": _sheet(_CASHFLOW_ROWS, dict(values), periods, rng),
+        "date": date,
+        "ticker": ticker,
+        "accession_no": f"{9000000000 + index:010d}-{report_dt.year % 100:02d}-{index % 1000000:06d}",
+        "filing_date": filed,
+        "form": "10-K" if is_annual else "10-Q",
+        "yf_value": price,
+        "yf_value_date": date,
+        # base/computed are synthesized directly: running compute_ratios for 50k files would
+        # dominate generation time (compute_ratios itself is benchmarked below)
+        "base": {code: code_values.get(code) for code in set(mapping_variables.values()) | set(code_values)},
+        "computed": {name: float(rng.uniform(-50, 80)) for name in ratio_names},
+    }
+
+
+def generate_corpus(root: str, n_filings: int, seed: int = 42) -> dict:
+    """Write company_tickers.json, xbrl_data_json/<T>/<T>_<date>.json and the filing index."""
+    from indicators import MAPPING_VARIABLE
+    ratio_names = ["ROE", "P/E", "P/FCF", "P/CF", "D/E", "Pretax Profit Margin"]
+
+    marker = os.path.join(root, "corpus.json")
+    meta = {"version": CORPUS_VERSION, "filings": n_filings, "seed": seed,
+            "filings_per_company": FILINGS_PER_COMPANY}
+    if os.path.exists(marker):
+        with open(marker, "r", encoding="utf-8") as f:
+            if json.load(f) == meta:
+                return meta
+
+    rng = np.random.default_rng(seed)
+    n_companies = max(1, n_filings // FILINGS_PER_COMPANY)
+    quarter_ends = _quarter_ends(FILINGS_PER_COMPANY)
+    tickers = {}
+    os.makedirs(os.path.join(root, "xbrl_data_json", "_index"), exist_ok=True)
+
+    written = 0
+    for c in range(n_companies):
+        cik = str(1_000_000 + c)
+        ticker = f"SYN{c:05d}"
+        tickers[cik] = {"cik": cik, "ticker": ticker, "title": f"Synthetic Company {c}"}
+        out_dir = os.path.join(root, "xbrl_data_json", ticker)
+        os.makedirs(out_dir, exist_ok=True)
+        index = {}
+        for report_dt in quarter_ends:
+            if written >= n_filings:
+                break
+            data = _filing_json(ticker, report_dt, written, rng, MAPPING_VARIABLE, ratio_names)
+            path = os.path.join(out_dir, f"{ticker}_{data['date']}.json")
+            with open(path, "w", encoding="utf-8") as f:
+                json.dump(data, f, indent=4)
+            index[data["accession_no"]] = {"date": data["date"], "filing_date": data["filing_date"],
+                                           "form": data["form"], "file": path}
+            written += 1
+        with open(os.path.join(root, "xbrl_data_json", "_index", f"{ticker}.json"), "w", encoding="utf-8") as f:
+            json.dump(index, f, indent=2)
+
+    with open(os.path.join(root, "company_tickers.json"), "w", encoding="utf-8") as f:
+        json.dump(tickers, f, indent=4)
+    with open(os.path.join(root, "company_metadata.json"), "w", encoding="utf-8") as f:
+        json.dump({cik: {"sic": str(_SIC_CODES[i % len(_SIC_CODES)]), "sicDescription": ""}
+                   for i, cik in enumerate(tickers)}, f)
+    shutil.rmtree(os.path.join(root, ".cache_metadata"), ignore_errors=True)
+    with open(marker, "w", encoding="utf-8") as f:
+        json.dump(meta, f)
+    return meta
+
+
+# ----------------------------- FIXTURES -------------------------------------
+def write_fixtures(root: str) -> str:
+    """Replay fixtures of the corpus (the SEC company list); returns the fixture directory."""
+    from data_sources import SEC_TICKERS_URL, FixtureStore
+
+    with open(os.path.join(root, "company_tickers.json"), "r", encoding="utf-8") as f:
+        universe = json.load(f)
+    fixtures_dir = os.path.join(root, "fixtures")
+    FixtureStore(fixtures_dir).save_text(SEC_TICKERS_URL, json.dumps(
+        {k: {"cik_str": int(v["cik"]), "ticker": v["ticker"], "title": v["title"]} for k, v in universe.items()}))
+    return fixtures_dir
+
+
+def install_stubs(root: str, fixtures_dir: str = None):
+    """
+    Serve all external data (SEC / Wikipedia HTTP, EDGAR, Yahoo) from fixtures, so
+    nothing touches the network: the corpus fixtures, or `fixtures_dir` recorded
+    with SCREENER_DATA_SOURCE=record:<dir>.
+    """
+    import data_sources
+
+    if fixtures_dir is None:
+        fixtures_dir = write_fixtures(root)
+    data_sources.set_source(data_sources.ReplaySource(fixtures_dir))
+
+
+# ----------------------------- TIMING ---------------------------------------
+def _timeit(fn, repeat: int) -> dict:
+    samples = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - t0)
+    return {
+        "repeat": repeat,
+        "min_s": min(samples),
+        "median_s": statistics.median(samples),
+        "mean_s": statistics.fmean(samples),
+    }
+
+
+def _per_item(result: dict, n: int) -> dict:
+    result = dict(result)
+    result["items"] = n
+    result["per_item_ms"] = result["median_s"] / n * 1000 if n else None
+    return result
+
+
+def run_benchmarks(root: str, n_filings: int, companies: int, variables: int, repeat: int,
+                   sample: int, seed: int, fixtures_dir: str = None) -> dict:
+    t0 = time.perf_counter()
+    meta = generate_corpus(root, n_filings, seed=seed)
+    generate_s = time.perf_counter() - t0
+
+    os.chdir(root)
+    install_stubs(root, fixtures_dir)
+    sys.path.insert(0, REPO_DIR)
+    from contextlib import redirect_stdout
+    import io
+
+    with redirect_stdout(io.StringIO()):
+        import visualizer
+        from helper import find_variables_and_sheets_by_concepts, get_variables_from_json_dict
+        from indicators import _REQUIRED_FOR_COMPUTED, compute_ratios
+
+    ciks = list(visualizer.companies.companies)[:companies]
+    graph_vars = (list(visualizer.MAPPING_VARIABLE) + visualizer.RATIO_VARIABLES +
+                  visualizer.SPECIAL_VARIABLES)[:variables]
+    end_year = FIRST_YEAR + (FILINGS_PER_COMPANY - 1) // 4
+
+    # Sample of filings (as loaded dicts) for the per-filing benchmarks
+    rng = random.Random(seed)
+    paths = []
+    for cik in list(visualizer.companies.companies):
+        ticker = visualizer.companies.companies[cik].ticker
+        folder = os.path.join("xbrl_data_json", ticker)
+        paths.extend(os.path.join(folder, f) for f in os.listdir(folder) if f.endswith(".json"))
+    paths = rng.sample(paths, min(sample, len(paths)))
+    filings = []
+    for path in paths:
+        with open(path, "r", encoding="utf-8") as f:
+            filings.append(json.load(f))
+    concepts = sorted(set(visualizer.MAPPING_VARIABLE.values()) | _REQUIRED_FOR_COMPUTED)
+    resolved = [find_variables_and_sheets_by_concepts(d, concepts) for d in filings]
+
+    results = {}
+    with redirect_stdout(io.StringIO()):
+        results["load_summary_table"] = _timeit(lambda: visualizer.load_summary_table(), repeat)
+        results["generate_graph"] = _timeit(
+            lambda: visualizer.generate_graph(ciks, graph_vars, [], FIRST_YEAR, end_year, False), repeat)
+        results["generate_graph"].update({"companies": len(ciks), "variables": len(graph_vars)})
+        results["compute_ratios"] = _per_item(_timeit(
+            lambda: [compute_ratios(d, visualizer.MAPPING_VARIABLE, stock_price=d.get("yf_value"))
+                     for d in filings], repeat), len(filings))
+        results["find_variables_and_sheets_by_concepts"] = _per_item(_timeit(
+            lambda: [find_variables_and_sheets_by_concepts(d, concepts) for d in filings], repeat), len(filings))
+        results["get_variables_from_json_dict"] = _per_item(_timeit(
+            lambda: [get_variables_from_json_dict(d, r) for d, r in zip(filings, resolved)], repeat), len(filings))
+
+    import metrics
+    return {
+        "filings": meta["filings"],
+        "companies_in_corpus": max(1, n_filings // FILINGS_PER_COMPANY),
+        "corpus_generation_s": generate_s,
+        "results": results,
+        "metrics": metrics.snapshot(),
+    }
+
+
+def _git_commit() -> str:
+    try:
+        return subprocess.check_output(["git", "rev-parse", "HEAD"], cwd=REPO_DIR, text=True).strip()
+    except Exception:
+        return "unknown"
+
+
+# ----------------------------- CLI ------------------------------------------
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the screener hot paths on a synthetic corpus.")
+    parser.add_argument("--filings", type=int, nargs="+", default=[500], help="Corpus sizes (number of filings)")
+    parser.add_argument("--companies", type=int, default=10, help="Companies drawn by generate_graph")
+    parser.add_argument("--variables", type=int, default=3, help="Variables drawn by generate_graph")
+    parser.add_argument("--repeat", type=int, default=3, help="Repetitions per benchmark")
+    parser.add_argument("--sample", type=int, default=100, help="Filings used by the per-filing benchmarks")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--corpus-dir", default=os.path.join(tempfile.gettempdir(), "screener_bench"),
+                        help="Where synthetic corpora are generated (reused across runs)")
+    parser.add_argument("--fixtures", help="Replay recorded data (SCREENER_DATA_SOURCE=record:<dir>) "
+                                           "instead of the corpus fixtures")
+    parser.add_argument("--out", help="Write the JSON report here instead of stdout")
+    parser.add_argument("--single", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.single:
+        # Child process: one corpus size (visualizer keeps module-level state per corpus)
+        root = os.path.join(args.corpus_dir, f"filings_{args.filings[0]}")
+        os.makedirs(root, exist_ok=True)
+        report = run_benchmarks(root, args.filings[0], args.companies, args.variables,
+                                args.repeat, args.sample, args.seed,
+                                os.path.abspath(args.fixtures) if args.fixtures else None)
+        sys.__stdout__.write(json.dumps(report) + "\n")
+        return
+
+    runs = []
+    for n in args.filings:
+        cmd = [sys.executable, os.path.abspath(__file__), "--single", "--filings", str(n),
+               "--companies", str(args.companies), "--variables", str(args.variables),
+               "--repeat", str(args.repeat), "--sample", str(args.sample), "--seed", str(args.seed),
+               "--corpus-dir", args.corpus_dir]
+        if args.fixtures:
+            cmd += ["--fixtures", args.fixtures]
+        out = subprocess.run(cmd, check=True, capture_output=True, text=True).stdout
+        runs.append(json.loads(out.strip().splitlines()[-1]))
+
+    report = {
+        "commit": _git_commit(),
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "runs": runs,
+    }
+    text = json.dumps(report, indent=2)
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            f.write(text)
+    else:
+        print(text)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,143 @@
+"""
+SIC code / sector metadata of the company universe.
+
+Sources (first found wins), loaded once and cached in .cache_metadata/:
+  - SEC submissions bulk file (submissions.zip, https://www.sec.gov/Archives/edgar/daily-index/bulkdata/submissions.zip):
+    one CIK##########.json per filer with "sic" and "sicDescription"; only the CIKs of the
+    universe are read from the archive
+  - a fixture JSON {cik: {"sic": "3571", "sicDescription": "..."}}
+
+The result is a DataFrame indexed by CIK (sic, sic_description, sector). Sectors come
+from a 10k-entry SIC lookup array, so mapping a whole column is one numpy take.
+"""
+import json
+import os
+import zipfile
+from typing import Dict, Iterable, Optional
+
+import numpy as np
+import pandas as pd
+
+METADATA_CACHE_DIR = ".cache_metadata"
+METADATA_CACHE_FILE = os.path.join(METADATA_CACHE_DIR, "company_metadata.json")
+
+# Candidate sources, checked in order when no explicit path is given
+SUBMISSIONS_BULK_FILE = os.environ.get("SEC_SUBMISSIONS_BULK", "submissions.zip")
+METADATA_FIXTURE_FILE = "company_metadata.json"
+
+UNKNOWN_SECTOR = "Unknown"
+
+# (first SIC, last SIC, sector). Specific industries first, SIC divisions as fallback.
+SIC_SECTOR_RANGES = [
+    (1300, 1399, "Energy"),                       # oil & gas extraction
+    (2900, 2999, "Energy"),                       # petroleum refining
+    (2830, 2836, "Health Care"),                  # pharmaceuticals
+    (3840, 3851, "Health Care"),                  # medical instruments
+    (8000, 8099, "Health Care"),                  # health services
+    (3570, 3579, "Technology"),                   # computers
+    (3600, 3699, "Technology"),                   # electronic equipment, semiconductors
+    (7370, 7379, "Technology"),                   # software & IT services
+    (4800, 4899, "Communication Services"),
+    (4900, 4999, "Utilities"),
+    (6500, 6553, "Real Estate"),
+    (6798, 6798, "Real Estate"),                  # REITs
+    (6000, 6799, "Financials"),
+    (100, 999, "Agriculture"),
+    (1000, 1499, "Materials"),                    # mining
+    (1500, 1799, "Industrials"),                  # construction
+    (2000, 2399, "Consumer Staples"),             # food, tobacco, textiles
+    (2400, 3999, "Industrials"),                  # other manufacturing
+    (4000, 4799, "Industrials"),                  # transportation
+    (5000, 5199, "Industrials"),                  # wholesale
+    (5200, 5999, "Consumer Discretionary"),       # retail
+    (7000, 8999, "Services"),
+    (9100, 9999, "Public Administration"),
+]
+
+
+def _build_sector_lookup() -> np.ndarray:
+    lookup = np.full(10000, UNKNOWN_SECTOR, dtype=object)
+    # Apply broad ranges first so the specific ones (listed first) win
+    for lo, hi, sector in reversed(SIC_SECTOR_RANGES):
+        lookup[lo:hi + 1] = sector
+    return lookup
+
+
+_SECTOR_BY_SIC = _build_sector_lookup()
+
+
+def sectors_for_sic(sic: pd.Series) -> pd.Series:
+    """Vectorized SIC -> sector name (Unknown for missing / invalid codes)."""
+    codes = pd.to_numeric(sic, errors="coerce")
+    valid = codes.notna() & (codes >= 0) & (codes < len(_SECTOR_BY_SIC))
+    out = np.full(len(codes), UNKNOWN_SECTOR, dtype=object)
+    out[valid.to_numpy()] = _SECTOR_BY_SIC[codes[valid].astype(int).to_numpy()]
+    return pd.Series(out, index=sic.index, name="sector")
+
+
+# ----------------------------- LOADERS --------------------------------------
+def _read_bulk_submissions(path: str, ciks: Iterable[str]) -> Dict[str, dict]:
+    """Read sic / sicDescription of `ciks` from the SEC submissions.zip."""
+    records: Dict[str, dict] = {}
+    with zipfile.ZipFile(path) as archive:
+        names = set(archive.namelist())
+        for cik in ciks:
+            name = f"CIK{int(cik):010d}.json"
+            if name not in names:
+                continue
+            try:
+                with archive.open(name) as f:
+                    data = json.load(f)
+            except Exception as e:
+                print(f"[ERROR] Failed to read {name} from {path}: {e}")
+                continue
+            records[str(int(cik))] = {"sic": data.get("sic"), "sicDescription": data.get("sicDescription")}
+    return records
+
+
+def _read_fixture(path: str) -> Dict[str, dict]:
+    with open(path, "r", encoding="utf-8") as f:
+        data = json.load(f)
+    if isinstance(data, list):
+        data = {str(item.get("cik")): item for item in data}
+    return {str(int(k)): {"sic": v.get("sic"), "sicDescription": v.get("sicDescription")} for k, v in data.items()}
+
+
+def load_company_metadata(ciks: Iterable[str], source: Optional[str] = None, refresh: bool = False) -> pd.DataFrame:
+    """
+    Metadata of `ciks` as a DataFrame indexed by CIK (str): sic, sic_description, sector.
+    Uses the cache unless `refresh`; otherwise reads `source` (bulk zip or fixture JSON).
+    """
+    ciks = [str(c) for c in ciks]
+    records: Optional[Dict[str, dict]] = None
+
+    if not refresh and source is None and os.path.exists(METADATA_CACHE_FILE):
+        try:
+            with open(METADATA_CACHE_FILE, "r", encoding="utf-8") as f:
+                records = json.load(f)
+        except Exception as e:
+            print(f"[ERROR] Failed to read metadata cache {METADATA_CACHE_FILE}: {e}")
+
+    if records is None:
+        candidates = [source] if source else [SUBMISSIONS_BULK_FILE, METADATA_FIXTURE_FILE]
+        for path in candidates:
+            if not path or not os.path.exists(path):
+                continue
+            try:
+                records = _read_bulk_submissions(path, ciks) if zipfile.is_zipfile(path) else _read_fixture(path)
+            except Exception as e:
+                print(f"[ERROR] Failed to load company metadata from {path}: {e}")
+                continue
+            os.makedirs(METADATA_CACHE_DIR, exist_ok=True)
+            with open(METADATA_CACHE_FILE, "w", encoding="utf-8") as f:
+                json.dump(records, f)
+            print(f"[INFO] Loaded SIC metadata of {len(records)} companies from {path}.")
+            break
+
+    frame = pd.DataFrame.from_dict(records or {}, orient="index", columns=["sic", "sicDescription"])
+    frame = frame.rename(columns={"sicDescription": "sic_description"})
+    frame = frame.reindex(ciks)
+    frame.index.name = "CIK"
+    frame["sic"] = pd.to_numeric(frame["sic"], errors="coerce").astype("Int64")
+    frame["sector"] = sectors_for_sic(frame["sic"])
+    return frame
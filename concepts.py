@@ -0,0 +1,245 @@
+"""
+Compiled concept resolution: canonical metric -> priority-ordered XBRL tags and
+statement row label aliases.
+
+CONCEPT_ALIASES is the single definition; `ConceptTable` compiles it once into
+  - a hash of tags (normalized 'us-gaap_Assets', case-insensitive) -> (metric, priority)
+  - a hash of exact row labels -> (metric, priority)
+  - a character trie of the labels, which finds every alias contained in a row
+    label in one pass over that label
+so resolving a metric costs O(#aliases) dictionary lookups plus one pass over the
+table rows, instead of comparing every row with every alias.
+
+Only tags with a prefix in `prefixes` (indicators.GAAP_PREFIXES) are compiled:
+adding "ifrs-full_" there makes the IFRS tags below part of every fallback chain.
+"""
+from typing import Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+from helper import first_numeric
+
+# metric -> {"tags": [...], "labels": [...]}, both in priority order
+CONCEPT_ALIASES: Dict[str, Dict[str, List[str]]] = {
+    "total assets": {
+        "tags": ["us-gaap_Assets", "ifrs-full_Assets"],
+        "labels": ["total assets", "assets"],
+    },
+    "total liabilities": {
+        "tags": ["us-gaap_Liabilities", "ifrs-full_Liabilities"],
+        "labels": ["total liabilities", "liabilities"],
+    },
+    "cash": {
+        "tags": ["us-gaap_CashAndCashEquivalentsAtCarryingValue", "ifrs-full_CashAndCashEquivalents"],
+        "labels": ["cash", "cash and cash equivalents at carrying value", "cash and cash equivalents"],
+    },
+    "net income": {
+        "tags": ["us-gaap_NetIncomeLoss", "ifrs-full_ProfitLossAttributableToOwnersOfParent",
+                 "ifrs-full_ProfitLoss"],
+        "labels": ["net income", "net income (loss)", "profit for the year"],
+    },
+    "shareholders equity": {
+        "tags": ["us-gaap_StockholdersEquity", "ifrs-full_EquityAttributableToOwnersOfParent",
+                 "ifrs-full_Equity"],
+        "labels": ["total shareholders’ equity", "total shareholders' equity", "total stockholders’ equity",
+                   "total stockholders' equity", "total equity"],
+    },
+    # Reported EPS first, then continuing-ops variants as fallback
+    "eps": {
+        "tags": ["us-gaap_EarningsPerShareDiluted", "us-gaap_EarningsPerShareBasic",
+                 "us-gaap_IncomeLossFromContinuingOperationsPerDilutedShare",
+                 "us-gaap_IncomeLossFromContinuingOperationsPerBasicShare",
+                 "ifrs-full_DilutedEarningsLossPerShare", "ifrs-full_BasicEarningsLossPerShare"],
+        "labels": [],
+    },
+    # Weighted-average share count — multiple common variants
+    "shares diluted": {
+        "tags": ["us-gaap_WeightedAverageNumberOfDilutedSharesOutstanding",
+                 "us-gaap_WeightedAverageNumberOfSharesOutstandingDiluted",
+                 "ifrs-full_AdjustedWeightedAverageShares"],
+        "labels": ["weighted average number of diluted shares outstanding"],
+    },
+    "shares basic": {
+        "tags": ["us-gaap_WeightedAverageNumberOfSharesOutstandingBasic",
+                 "us-gaap_WeightedAverageNumberOfSharesOutstanding",
+                 "ifrs-full_WeightedAverageShares"],
+        "labels": ["weighted average number of shares outstanding basic"],
+    },
+    "cfo": {
+        "tags": ["us-gaap_NetCashProvidedByUsedInOperatingActivitiesContinuingOperations",
+                 "us-gaap_NetCashProvidedByUsedInOperatingActivities",
+                 "ifrs-full_CashFlowsFromUsedInOperatingActivities"],
+        "labels": ["cash generated by operating activities", "net cash provided by operating activities"],
+    },
+    "capex": {
+        "tags": ["us-gaap_PaymentsToAcquirePropertyPlantAndEquipment",
+                 "ifrs-full_PurchaseOfPropertyPlantAndEquipmentClassifiedAsInvestingActivities"],
+        "labels": ["payments for acquisition of property, plant and equipment"],
+    },
+    "debt total": {
+        "tags": ["us-gaap_Debt", "us-gaap_DebtAndCapitalLeaseObligations", "ifrs-full_Borrowings"],
+        "labels": ["total debt"],
+    },
+    "debt current": {
+        "tags": ["us-gaap_DebtCurrent", "us-gaap_ShortTermBorrowings", "us-gaap_CommercialPaper",
+                 "us-gaap_LongTermDebtCurrent", "ifrs-full_ShorttermBorrowings",
+                 "ifrs-full_CurrentPortionOfLongtermBorrowings"],
+        "labels": [],
+    },
+    "debt noncurrent": {
+        "tags": ["us-gaap_DebtNoncurrent", "us-gaap_LongTermDebtNoncurrent", "ifrs-full_LongtermBorrowings"],
+        "labels": [],
+    },
+    "pretax income": {
+        "tags": ["us-gaap_IncomeLossFromContinuingOperationsBeforeIncomeTaxesExtraordinaryItemsNoncontrollingInterest",
+                 "us-gaap_IncomeBeforeEquityMethodInvestmentsIncomeTaxesExtraordinaryItemsNoncontrollingInterest",
+                 "ifrs-full_ProfitLossBeforeTax"],
+        "labels": ["income before provision for income taxes", "income before income taxes"],
+    },
+    "revenue": {
+        "tags": ["us-gaap_SalesRevenueNet", "us-gaap_Revenues",
+                 "us-gaap_RevenueFromContractWithCustomerExcludingAssessedTax",
+                 "ifrs-full_Revenue", "ifrs-full_RevenueFromContractsWithCustomers"],
+        "labels": ["total net sales", "total revenues", "total revenue", "net sales", "revenues", "revenue"],
+    },
+    "shares outstanding": {
+        "tags": ["us-gaap_WeightedAverageNumberOfSharesOutstandingBasic"],
+        "labels": ["weighted average number of shares outstanding basic"],
+    },
+}
+
+_END = "\0"
+
+
+def normalize_tag(tag: str) -> str:
+    """'us-gaap:Assets' / 'US-GAAP_Assets' -> 'us-gaap_assets' (hash key)."""
+    return str(tag).strip().replace(":", "_", 1).lower()
+
+
+def normalize_label(label: str) -> str:
+    return str(label).strip().lower()
+
+
+class _LabelTrie:
+    """Alias labels in a character trie; `find_in` yields every alias contained in a text."""
+
+    def __init__(self):
+        self.root: dict = {}
+
+    def add(self, label: str, value) -> None:
+        node = self.root
+        for ch in label:
+            node = node.setdefault(ch, {})
+        node.setdefault(_END, []).append(value)
+
+    def find_in(self, text: str) -> Iterator:
+        root = self.root
+        for i in range(len(text)):
+            node = root.get(text[i])
+            j = i + 1
+            while node is not None:
+                if _END in node:
+                    yield from node[_END]
+                if j == len(text):
+                    break
+                node = node.get(text[j])
+                j += 1
+
+
+class ConceptTable:
+    """CONCEPT_ALIASES compiled for constant-time tag / label resolution."""
+
+    def __init__(self, aliases: Dict[str, Dict[str, List[str]]], prefixes: Sequence[str]):
+        prefixes = tuple(p.lower() for p in prefixes)
+        self._tags: Dict[str, List[str]] = {}
+        self._labels: Dict[str, List[str]] = {}
+        self._by_tag: Dict[str, Tuple[str, int]] = {}
+        self._by_label: Dict[str, List[Tuple[str, int]]] = {}
+        self._trie = _LabelTrie()
+        for metric, spec in aliases.items():
+            metric = normalize_label(metric)
+            tags = [t for t in dict.fromkeys(spec.get("tags", [])) if t.lower().startswith(prefixes)]
+            labels = list(dict.fromkeys(normalize_label(l) for l in spec.get("labels", [])))
+            self._tags[metric] = tags
+            self._labels[metric] = labels
+            for priority, tag in enumerate(tags):
+                self._by_tag.setdefault(normalize_tag(tag), (metric, priority))
+            for priority, label in enumerate(labels):
+                self._by_label.setdefault(label, []).append((metric, priority))
+                self._trie.add(label, (metric, priority))
+
+    def metrics(self) -> List[str]:
+        return list(self._tags)
+
+    def tags(self, metric: str) -> List[str]:
+        """Priority-ordered tags of a metric (the fallback chain)."""
+        return list(self._tags.get(normalize_label(metric), []))
+
+    def labels(self, metric: str) -> List[str]:
+        return list(self._labels.get(normalize_label(metric), []))
+
+    def metric(self, key: str) -> Optional[str]:
+        """Canonical metric of a metric name, tag or exact row label (None if unknown)."""
+        label = normalize_label(key)
+        if label in self._tags:
+            return label
+        hit = self._by_tag.get(normalize_tag(key))
+        if hit:
+            return hit[0]
+        hits = self._by_label.get(label)
+        return hits[0][0] if hits else None
+
+    def chain(self, key: str) -> List[str]:
+        """Tags to try for `key`: its metric's chain, else `key` itself."""
+        metric = self.metric(key)
+        return self.tags(metric) if metric else [key]
+
+    def equivalents(self, tag: str) -> List[str]:
+        """`tag` followed by the tags of its metric in other taxonomies (e.g. the IFRS counterpart)."""
+        prefix = normalize_tag(tag).split("_", 1)[0]
+        metric = self.metric(tag)
+        others = [t for t in self.tags(metric) if normalize_tag(t).split("_", 1)[0] != prefix] if metric else []
+        return [tag] + others
+
+    def first_value(self, values: Dict[str, object], key: str) -> Optional[float]:
+        """First numeric value along the chain of `key` in a {tag: value} dict (e.g. 'base')."""
+        return first_numeric(values, self.chain(key))
+
+    def find_row(self, labels: Sequence[str], key: str, concepts: Optional[Sequence[str]] = None) -> Optional[int]:
+        """
+        Position of the row holding `key` in a statement table: tag of the 'concept'
+        column first, then an exact alias label, then the row whose label contains the
+        highest-priority alias (earliest row on ties).
+        """
+        metric = self.metric(key)
+        if concepts is not None:
+            by_concept: Dict[str, int] = {}
+            for pos, concept in enumerate(concepts):
+                if concept:
+                    by_concept.setdefault(normalize_tag(concept), pos)
+            for tag in (self.tags(metric) if metric else [key]):
+                pos = by_concept.get(normalize_tag(tag))
+                if pos is not None:
+                    return pos
+
+        aliases = self.labels(metric) if metric else [normalize_label(key)]
+        normalized = [normalize_label(l) for l in labels]
+        by_label: Dict[str, int] = {}
+        for pos, label in enumerate(normalized):
+            by_label.setdefault(label, pos)
+        for alias in aliases:
+            if alias in by_label:
+                return by_label[alias]
+
+        if metric is None:
+            # Unknown key: plain substring search for the key itself
+            alias = aliases[0]
+            return next((pos for pos, label in enumerate(normalized) if alias in label), None)
+        best: Optional[Tuple[int, int]] = None
+        for pos, label in enumerate(normalized):
+            for hit_metric, priority in self._trie.find_in(label):
+                if hit_metric == metric and (best is None or priority < best[0]):
+                    best = (priority, pos)
+        return best[1] if best else None
+
+
+def compile_concepts(prefixes: Iterable[str], aliases: Optional[Dict[str, Dict[str, List[str]]]] = None) -> ConceptTable:
+    return ConceptTable(aliases if aliases is not None else CONCEPT_ALIASES, tuple(prefixes))
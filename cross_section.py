@@ -0,0 +1,139 @@
+"""
+Cross-sectional statistics of the summary table per report period.
+
+For every (period, variable) the screener keeps, per filing:
+  - pct(VAR)     percentile rank within the period (0..1, ties averaged)
+  - z(VAR)       z-score within the period
+  - median(VAR)  median of the period (per sector when a 'Sector' column exists)
+
+Periods are calendar quarters of the report date ("2023Q3"). Everything is a
+vectorized groupby over the columnar summary. `CrossSectionStats` recomputes only
+the (period, variable) groups whose rows changed since the last update (order
+independent fingerprint of CIK, Date and value), so a table refresh after a few new
+filings touches just the periods they fall in.
+
+The same names are usable in the summary filter, e.g. `pct(ROE) > 0.9`, see
+`rewrite_filter`.
+"""
+import re
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+import metrics
+
+PERIOD_COL = "Period"
+GROUP_COL = "Sector"
+KEY_COLS = ["CIK", "Date"]
+
+# pct(ROE), z( P/E ), median(`Net income`)
+_DSL_FUNC = re.compile(r"\b(pct|z|median)\(\s*`?([^()`]+?)`?\s*\)")
+
+
+def stat_column(func: str, variable: str) -> str:
+    return f"{func}({variable})"
+
+
+def period_of(dates) -> pd.Series:
+    """Calendar quarter label ("2023Q3") of report dates."""
+    return pd.to_datetime(pd.Series(dates), errors="coerce").dt.to_period("Q").astype(str)
+
+
+def _period_stats(frame: pd.DataFrame, variable: str, group_col: Optional[str]) -> pd.DataFrame:
+    values = pd.to_numeric(frame[variable], errors="coerce")
+    by_period = values.groupby(frame[PERIOD_COL])
+    mean = by_period.transform("mean")
+    std = by_period.transform("std", ddof=0)
+
+    keys = [frame[PERIOD_COL]]
+    if group_col and group_col in frame.columns:
+        keys.append(frame[group_col].fillna(""))
+
+    return pd.DataFrame({
+        stat_column("pct", variable): by_period.rank(pct=True),
+        stat_column("z", variable): (values - mean) / std.replace(0, np.nan),
+        stat_column("median", variable): values.groupby(keys).transform("median"),
+    }, index=frame.index)
+
+
+def compute_cross_section(df: pd.DataFrame, variables: Iterable[str], group_col: Optional[str] = GROUP_COL) -> pd.DataFrame:
+    """One-shot (non incremental) stats of `variables`, aligned with df.index."""
+    frame = df.assign(**{PERIOD_COL: period_of(df["Date"]).values})
+    parts = [_period_stats(frame, v, group_col) for v in variables if v in frame.columns]
+    if not parts:
+        return pd.DataFrame(index=df.index)
+    return pd.concat(parts, axis=1)
+
+
+class CrossSectionStats:
+    """Incrementally maintained cross-sectional stats, keyed by (period, variable)."""
+
+    def __init__(self, group_col: Optional[str] = GROUP_COL):
+        self.group_col = group_col
+        self._fingerprints: Dict[Tuple[str, str], Tuple[int, int]] = {}
+        self._stats: Dict[str, pd.DataFrame] = {}   # variable -> stats indexed by (CIK, Date)
+        self.last_recomputed = 0                     # (period, variable) groups recomputed by the last update
+
+    def _fingerprint(self, frame: pd.DataFrame, variable: str) -> Dict[str, Tuple[int, int]]:
+        cols = KEY_COLS + [variable]
+        if self.group_col and self.group_col in frame.columns:
+            cols.append(self.group_col)
+        row_hash = pd.util.hash_pandas_object(frame[cols], index=False)
+        grouped = row_hash.groupby(frame[PERIOD_COL].values)
+        sums, counts = grouped.sum(), grouped.size()
+        return {p: (int(sums[p]), int(counts[p])) for p in sums.index}
+
+    def update(self, df: pd.DataFrame, variables: Iterable[str]) -> pd.DataFrame:
+        """
+        Stats of `variables` for the rows of `df` (summary table: CIK, Date, variables),
+        aligned with df.index. Also returns the Period column.
+        """
+        with metrics.span("cross_section_update"):
+            frame = df.assign(**{PERIOD_COL: period_of(df["Date"]).values})
+            keys = pd.MultiIndex.from_frame(frame[KEY_COLS].astype(str))
+            parts = [frame[[PERIOD_COL]]]
+            self.last_recomputed = 0
+
+            for variable in variables:
+                if variable not in frame.columns:
+                    continue
+                fingerprints = self._fingerprint(frame, variable)
+                changed = [p for p, fp in fingerprints.items() if self._fingerprints.get((p, variable)) != fp]
+                stale = [k for k in self._fingerprints if k[1] == variable and k[0] not in fingerprints]
+                for k in stale:
+                    del self._fingerprints[k]
+
+                stats = self._stats.get(variable)
+                if changed or stale or stats is None:
+                    mask = frame[PERIOD_COL].isin(changed).values
+                    fresh = _period_stats(frame[mask], variable, self.group_col)
+                    fresh.index = keys[mask]
+                    fresh[PERIOD_COL] = frame.loc[mask, PERIOD_COL].values
+                    if stats is not None:
+                        dropped = set(changed) | {p for p, _ in stale}
+                        stats = stats[~stats[PERIOD_COL].isin(dropped)]
+                        fresh = pd.concat([stats, fresh])
+                    self._stats[variable] = fresh[~fresh.index.duplicated(keep="last")]
+                    for p in changed:
+                        self._fingerprints[(p, variable)] = fingerprints[p]
+                    self.last_recomputed += len(changed)
+
+                aligned = self._stats[variable].drop(columns=PERIOD_COL).reindex(keys)
+                aligned.index = df.index
+                parts.append(aligned)
+
+            return pd.concat(parts, axis=1)
+
+
+# ----------------------------- FILTER DSL -----------------------------------
+def referenced_stats(expr: Optional[str]) -> List[Tuple[str, str]]:
+    """[(func, variable)] used in a filter expression, e.g. [("pct", "ROE")]."""
+    if not expr:
+        return []
+    return [(m.group(1), m.group(2)) for m in _DSL_FUNC.finditer(expr)]
+
+
+def rewrite_filter(expr: str) -> str:
+    """Turn `pct(ROE) > 0.9` into a DataFrame.query expression over the stat columns."""
+    return _DSL_FUNC.sub(lambda m: f"`{stat_column(m.group(1), m.group(2))}`", expr)
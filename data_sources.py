@@ -0,0 +1,358 @@
+"""
+External data behind one interface: EDGAR filing lists, raw XBRL, daily closes and
+plain HTTP documents (SEC company list, index constituent pages on Wikipedia).
+
+    source = data_sources.get_source()
+    filings = source.filings(cik, ["10-Q", "10-K"], "2023-12-01", "2025-03-25")
+    raw = source.xbrl(filings[0])
+    closes = source.closes(["AAPL", "MSFT"], "2024-01-01", "2024-12-31")   # dates x tickers
+
+Implementations:
+  - LiveSource: edgar / yfinance / http_client (the network)
+  - RecordingSource: LiveSource whose every answer is also written to a fixture directory
+  - ReplaySource: answers from such a fixture directory only, no network; a request
+    without a fixture is answered like a failed download (None / empty) or, with
+    strict=True, raises FixtureMissingError
+
+The process-wide source comes from SCREENER_DATA_SOURCE: "live" (default),
+"record:<dir>" or "replay:<dir>"; `set_source` replaces it (tests, benchmarks).
+
+Fixture layout (<dir>/<kind>/<key>.<ext>, key = hash of the request):
+    filings/*.json    [{accession_no, filing_date, form, report_date, cik, company}]
+    xbrl/*.json.gz    {doc_type: text}, keyed by accession number
+    closes/*.parquet  dates x tickers closes
+    http/*.json       {"url": ..., "text": ...}
+"""
+import abc
+import gzip
+import hashlib
+import json
+import os
+import threading
+from typing import Dict, Iterable, List, Optional, Sequence
+
+import pandas as pd
+
+import http_client
+import metrics
+
+DATA_SOURCE_ENV = "SCREENER_DATA_SOURCE"
+
+# SEC company list (CIK, ticker, title), the universe of the screener
+SEC_TICKERS_URL = "https://www.sec.gov/files/company_tickers.json"
+
+
+class FixtureMissingError(LookupError):
+    pass
+
+
+class FilingRecord:
+    """Filing metadata as stored in fixtures (the attributes the ingestion reads)."""
+    __slots__ = ("accession_no", "filing_date", "form", "report_date", "cik", "company")
+
+    def __init__(self, accession_no, filing_date, form, report_date=None, cik=None, company=None):
+        self.accession_no = accession_no
+        self.filing_date = filing_date
+        self.form = form
+        self.report_date = report_date
+        self.cik = cik
+        self.company = company
+
+    @classmethod
+    def from_filing(cls, filing) -> "FilingRecord":
+        report_date = getattr(filing, "report_date", None) or getattr(filing, "period_of_report", None)
+        return cls(getattr(filing, "accession_no", None), _date_str(getattr(filing, "filing_date", None)),
+                   getattr(filing, "form", None), _date_str(report_date),
+                   getattr(filing, "cik", None), getattr(filing, "company", None))
+
+    def to_dict(self) -> dict:
+        return {name: getattr(self, name) for name in self.__slots__}
+
+
+def _date_str(value) -> Optional[str]:
+    if value is None:
+        return None
+    try:
+        return pd.Timestamp(value).strftime("%Y-%m-%d")
+    except Exception:
+        return str(value)
+
+
+def close_columns(hist: pd.DataFrame, tickers: Sequence[str]) -> pd.DataFrame:
+    """yf.download result (single or multi-ticker layout) -> dates x tickers closes, tz-naive days."""
+    out: Dict[str, pd.Series] = {}
+    if hist is None or hist.empty:
+        return pd.DataFrame(dtype="float64")
+    if isinstance(hist.columns, pd.MultiIndex):
+        level0 = hist.columns.get_level_values(0)
+        for ticker in tickers:
+            if ("Close", ticker) in hist.columns:
+                out[ticker] = hist[("Close", ticker)]
+            elif ticker in level0 and (ticker, "Close") in hist.columns:
+                out[ticker] = hist[(ticker, "Close")]
+        if not out and len(tickers) == 1 and "Close" in level0:
+            out[tickers[0]] = hist["Close"].iloc[:, 0]
+    elif len(tickers) == 1:
+        out[tickers[0]] = hist.get("Close", hist.iloc[:, 0])
+
+    for ticker, series in out.items():
+        series = pd.to_numeric(series, errors="coerce").dropna()
+        idx = pd.to_datetime(series.index)
+        try:
+            idx = idx.tz_localize(None)
+        except Exception:
+            pass
+        series.index = idx.normalize()
+        out[ticker] = series.astype("float64")
+    return pd.DataFrame(out).sort_index()
+
+
+# ----------------------------- INTERFACE ------------------------------------
+class DataSource(abc.ABC):
+    """Everything the screener reads from outside. Missing data is None / empty."""
+
+    @abc.abstractmethod
+    def filings(self, cik, forms: Sequence[str], start: str, end: str) -> list:
+        """XBRL filings of `forms` filed in [start, end] (objects with accession_no, filing_date, form, ...)."""
+        ...
+
+    @abc.abstractmethod
+    def xbrl(self, filing) -> Optional[Dict[str, str]]:
+        """Raw XBRL documents {doc_type: text} of a filing."""
+        ...
+
+    @abc.abstractmethod
+    def closes(self, tickers: Sequence[str], start, end) -> pd.DataFrame:
+        """Daily adjusted closes in [start, end) as dates x tickers (tickers without data are left out)."""
+        ...
+
+    @abc.abstractmethod
+    def get_text(self, url: str, headers: Optional[Dict[str, str]] = None,
+                 conditional: bool = False) -> Optional[str]:
+        """Body of a GET (SEC company list, Wikipedia constituent pages), None unless HTTP 200."""
+        ...
+
+    def get_json(self, url: str, headers: Optional[Dict[str, str]] = None, conditional: bool = False):
+        text = self.get_text(url, headers=headers, conditional=conditional)
+        if text is None:
+            return None
+        try:
+            return json.loads(text)
+        except ValueError as e:
+            print(f"[ERROR] Invalid JSON from {url}: {e}")
+            return None
+
+
+class LiveSource(DataSource):
+    """EDGAR (edgartools), Yahoo Finance (yfinance) and http_client."""
+
+    def filings(self, cik, forms, start, end) -> list:
+        from edgar import Company
+        with metrics.span("edgar_fetch", kind="filings_index"):
+            return list(Company(cik).get_filings(form=list(forms), is_xbrl=True, date=f"{start}:{end}"))
+
+    def xbrl(self, filing) -> Optional[Dict[str, str]]:
+        from ingest_pipeline import fetch_raw_xbrl
+        return fetch_raw_xbrl(filing)
+
+    def closes(self, tickers, start, end) -> pd.DataFrame:
+        import yfinance as yf
+        # yfinance uses its own curl_cffi session: not routed through http_client
+        tickers = list(tickers)
+        with metrics.span("yahoo_fetch", kind="batch" if len(tickers) > 1 else "single"):
+            hist = yf.download(
+                tickers=tickers if len(tickers) > 1 else tickers[0],
+                start=pd.Timestamp(start),
+                end=pd.Timestamp(end),
+                progress=False,
+                auto_adjust=True,
+                threads=len(tickers) > 1,
+            )
+        return close_columns(hist, tickers)
+
+    def get_text(self, url, headers=None, conditional=False) -> Optional[str]:
+        resp = http_client.get(url, headers=headers, conditional=conditional)
+        if resp.status_code == 200 and resp.text:
+            return resp.text
+        print(f"[ERROR] HTTP {resp.status_code} on {url}")
+        return None
+
+
+# ----------------------------- FIXTURES -------------------------------------
+def _fixture_key(*parts) -> str:
+    blob = json.dumps(parts, sort_keys=True, default=str)
+    return hashlib.sha1(blob.encode("utf-8")).hexdigest()[:20]
+
+
+def _day(value) -> str:
+    return pd.Timestamp(value).strftime("%Y-%m-%d")
+
+
+class FixtureStore:
+    """Fixture files of one directory; the request -> file mapping shared by recording and replay."""
+
+    def __init__(self, root: str):
+        self.root = root
+
+    def _path(self, kind: str, key: str, ext: str) -> str:
+        return os.path.join(self.root, kind, f"{key}.{ext}")
+
+    def filings_path(self, cik, forms, start, end) -> str:
+        return self._path("filings", _fixture_key(int(cik), sorted(forms), _day(start), _day(end)), "json")
+
+    def xbrl_path(self, accession_no) -> str:
+        return self._path("xbrl", str(accession_no), "json.gz")
+
+    def closes_path(self, tickers, start, end) -> str:
+        return self._path("closes", _fixture_key(list(tickers), _day(start), _day(end)), "parquet")
+
+    def http_path(self, url: str) -> str:
+        return self._path("http", _fixture_key(url), "json")
+
+    @staticmethod
+    def _replace(path: str, write) -> None:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.tmp"
+        write(tmp_path)
+        os.replace(tmp_path, path)
+
+    def save_filings(self, cik, forms, start, end, records: Iterable[FilingRecord]) -> None:
+        payload = [r.to_dict() for r in records]
+
+        def write(path):
+            with open(path, "w", encoding="utf-8") as f:
+                json.dump(payload, f, indent=1)
+        self._replace(self.filings_path(cik, forms, start, end), write)
+
+    def save_xbrl(self, accession_no, raw: Dict[str, str]) -> None:
+        def write(path):
+            with gzip.open(path, "wt", encoding="utf-8") as f:
+                json.dump(raw, f)
+        self._replace(self.xbrl_path(accession_no), write)
+
+    def save_closes(self, tickers, start, end, frame: pd.DataFrame) -> None:
+        self._replace(self.closes_path(tickers, start, end), lambda path: frame.to_parquet(path))
+
+    def save_text(self, url: str, text: str) -> None:
+        def write(path):
+            with open(path, "w", encoding="utf-8") as f:
+                json.dump({"url": url, "text": text}, f)
+        self._replace(self.http_path(url), write)
+
+
+class RecordingSource(DataSource):
+    """
+    Answers from `live` and writes each answer to the fixture directory. A fixture that
+    cannot be written is logged; the live answer is still returned.
+    """
+
+    def __init__(self, fixtures_dir: str, live: Optional[DataSource] = None):
+        self.store = FixtureStore(fixtures_dir)
+        self.live = live or LiveSource()
+
+    @staticmethod
+    def _record(what: str, save, *args) -> None:
+        try:
+            save(*args)
+        except Exception as e:
+            metrics.incr("fixture_write_errors")
+            print(f"[ERROR] Failed to record fixture for {what}: {e}")
+
+    def filings(self, cik, forms, start, end) -> list:
+        filings = self.live.filings(cik, forms, start, end)
+        self._record(f"filings of CIK {cik}", self.store.save_filings, cik, forms, start, end,
+                     [FilingRecord.from_filing(f) for f in filings])
+        return filings
+
+    def xbrl(self, filing) -> Optional[Dict[str, str]]:
+        raw = self.live.xbrl(filing)
+        if raw:
+            self._record(f"XBRL of {filing.accession_no}", self.store.save_xbrl, filing.accession_no, raw)
+        return raw
+
+    def closes(self, tickers, start, end) -> pd.DataFrame:
+        frame = self.live.closes(tickers, start, end)
+        self._record(f"closes of {list(tickers)[:3]}", self.store.save_closes, tickers, start, end, frame)
+        return frame
+
+    def get_text(self, url, headers=None, conditional=False) -> Optional[str]:
+        text = self.live.get_text(url, headers=headers, conditional=conditional)
+        if text is not None:
+            self._record(url, self.store.save_text, url, text)
+        return text
+
+
+class ReplaySource(DataSource):
+    """Answers from a fixture directory only (offline, deterministic)."""
+
+    def __init__(self, fixtures_dir: str, strict: bool = False):
+        self.store = FixtureStore(fixtures_dir)
+        self.strict = strict
+
+    def _missing(self, what: str, empty):
+        metrics.incr("fixture_misses")
+        if self.strict:
+            raise FixtureMissingError(f"No fixture for {what} in {self.store.root}")
+        print(f"[WARNING] No fixture for {what}")
+        return empty
+
+    def filings(self, cik, forms, start, end) -> list:
+        path = self.store.filings_path(cik, forms, start, end)
+        if not os.path.exists(path):
+            return self._missing(f"filings of CIK {cik} {start}:{end}", [])
+        with open(path, "r", encoding="utf-8") as f:
+            return [FilingRecord(**item) for item in json.load(f)]
+
+    def xbrl(self, filing) -> Optional[Dict[str, str]]:
+        path = self.store.xbrl_path(getattr(filing, "accession_no", None))
+        if not os.path.exists(path):
+            return self._missing(f"XBRL of {getattr(filing, 'accession_no', None)}", None)
+        with gzip.open(path, "rt", encoding="utf-8") as f:
+            return json.load(f)
+
+    def closes(self, tickers, start, end) -> pd.DataFrame:
+        path = self.store.closes_path(tickers, start, end)
+        if not os.path.exists(path):
+            return self._missing(f"closes of {list(tickers)[:3]} {_day(start)}:{_day(end)}",
+                                 pd.DataFrame(dtype="float64"))
+        return pd.read_parquet(path)
+
+    def get_text(self, url, headers=None, conditional=False) -> Optional[str]:
+        path = self.store.http_path(url)
+        if not os.path.exists(path):
+            return self._missing(url, None)
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)["text"]
+
+
+# ----------------------------- ACTIVE SOURCE --------------------------------
+_source: Optional[DataSource] = None
+_source_lock = threading.Lock()
+
+
+def source_from_spec(spec: Optional[str]) -> DataSource:
+    """'live' | 'record:<dir>' | 'replay:<dir>' -> DataSource."""
+    mode, _, path = (spec or "live").strip().partition(":")
+    mode = mode.lower()
+    if mode == "record" and path:
+        return RecordingSource(path)
+    if mode == "replay" and path:
+        return ReplaySource(path)
+    if mode != "live":
+        print(f"[WARNING] Unknown {DATA_SOURCE_ENV}={spec!r}, using live data.")
+    return LiveSource()
+
+
+def get_source() -> DataSource:
+    global _source
+    with _source_lock:
+        if _source is None:
+            _source = source_from_spec(os.environ.get(DATA_SOURCE_ENV))
+        return _source
+
+
+def set_source(source: Optional[DataSource]) -> None:
+    """Replace the process-wide source (None: back to SCREENER_DATA_SOURCE)."""
+    global _source
+    with _source_lock:
+        _source = source
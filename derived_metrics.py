@@ -0,0 +1,358 @@
+"""
+Derived per-ticker series: trailing-twelve-month (TTM) sums and YoY growth.
+
+Single-filing ratios mislead on 10-Qs (one quarter of earnings against a full
+price), so for every filing we also derive:
+  - TTM Net Income / Revenue / Operating Cash Flow / CapEx / FCF
+  - P/E (TTM) = price * shares / TTM net income
+  - Revenue YoY / Net Income YoY (TTM vs. TTM one year earlier, in %)
+
+Quarterly values are reconstructed per fiscal year (the filings after a 10-K up to
+the next 10-K):
+  - income flows (NI, revenue) are reported per quarter in a 10-Q; Q4 = FY - Q1..Q3
+  - cash flows (CFO, CapEx) are year-to-date in a 10-Q; Q = YTD - previous YTD,
+    Q4 = FY - Q3 YTD
+
+Each ticker keeps a date-sorted series of the few inputs needed
+(xbrl_data_json/_series/<TICKER>.json). A new filing is inserted with bisect and
+only the filings whose derived values can depend on it are recomputed and written
+back into their JSON 'computed' section; history is never rescanned.
+
+Usage (backfill existing JSON filings):
+    python derived_metrics.py
+    python derived_metrics.py --tickers AAPL MSFT
+"""
+import argparse
+import bisect
+import os
+import threading
+from typing import Dict, List, Optional
+
+import pandas as pd
+
+import metrics
+from helper import first_numeric, read_json, safe_div, to_percent, write_json
+from indicators import _CAPEX_KEYS, _CFO_KEYS, _NET_INCOME_KEYS, _REVENUE_KEYS, \
+    _SHARES_BASIC_KEYS, _SHARES_DILUTED_KEYS
+
+# ----------------------------- CONSTANTS ------------------------------------
+JSON_DIR = "xbrl_data_json"
+SERIES_DIR = os.path.join(JSON_DIR, "_series")
+
+# series input -> (base keys, how a 10-Q reports it)
+FLOW_INPUTS = {
+    "net_income": (_NET_INCOME_KEYS, "quarter"),
+    "revenue": (_REVENUE_KEYS, "quarter"),
+    "cfo": (_CFO_KEYS, "ytd"),
+    "capex": (_CAPEX_KEYS, "ytd"),
+}
+
+# Derived variables written into json["computed"] (also listed in visualizer.RATIO_VARIABLES)
+DERIVED_VARIABLES: List[str] = [
+    "TTM Net Income",
+    "TTM Revenue",
+    "TTM Operating Cash Flow",
+    "TTM CapEx",
+    "TTM FCF",
+    "P/E (TTM)",
+    "Revenue YoY",
+    "Net Income YoY",
+]
+
+# Derived variables depending on the filing price (recomputed alone when only prices change)
+PRICE_DERIVED_VARIABLES: List[str] = ["P/E (TTM)"]
+
+# Plausible spacing of consecutive quarter ends / of 4 quarter ends (days)
+QUARTER_GAP_DAYS = (70, 120)
+FOUR_QUARTERS_SPAN_DAYS = (240, 300)
+YEAR_TOLERANCE_DAYS = 20
+
+# A filing influences derived values of at most this many later filings
+# (Q4 of its fiscal year -> TTM over 4 quarters -> YoY one year later)
+AFFECTED_WINDOW = 12
+
+
+# ----------------------------- SERIES STORE ---------------------------------
+_series_cache: Dict[str, List[dict]] = {}
+_series_lock = threading.Lock()
+# Held across load -> mutate -> save of one ticker series (the cached list is shared)
+_ticker_locks: Dict[str, threading.Lock] = {}
+
+
+def _ticker_lock(ticker: str) -> threading.Lock:
+    with _series_lock:
+        return _ticker_locks.setdefault(ticker, threading.Lock())
+
+
+def _series_path(ticker: str) -> str:
+    return os.path.join(SERIES_DIR, f"{ticker}.json")
+
+
+def _is_annual(form: Optional[str]) -> bool:
+    return bool(form) and str(form).upper().startswith("10-K")
+
+
+def _entry_from_json(data: dict, file_path: str) -> Optional[dict]:
+    """The few per-filing inputs the derived series need."""
+    date = data.get("date")
+    if not date:
+        return None
+    base = data.get("base") or {}
+    entry = {
+        "date": str(date),
+        "form": data.get("form"),
+        "file": file_path,
+        "price": data.get("yf_value"),
+        "shares": first_numeric(base, _SHARES_DILUTED_KEYS),
+    }
+    if entry["shares"] is None:  # a reported 0 is a value, not a gap
+        entry["shares"] = first_numeric(base, _SHARES_BASIC_KEYS)
+    for name, (keys, _) in FLOW_INPUTS.items():
+        entry[name] = first_numeric(base, keys)
+    return entry
+
+
+def _build_series_from_dir(ticker: str) -> List[dict]:
+    """One-off migration for tickers ingested before the series existed."""
+    folder = os.path.join(JSON_DIR, ticker)
+    if not os.path.isdir(folder):
+        return []
+    series = []
+    for file in os.listdir(folder):
+        if not file.endswith(".json"):
+            continue
+        path = os.path.join(folder, file)
+        data = read_json(path)
+        entry = _entry_from_json(data, path) if data else None
+        if entry:
+            entry["derived"] = {k: (data.get("computed") or {}).get(k) for k in DERIVED_VARIABLES}
+            series.append(entry)
+    series.sort(key=lambda e: e["date"])
+    return series
+
+
+def load_series(ticker: str) -> List[dict]:
+    """Date-sorted series of a ticker (memory -> _series file -> built from its JSON filings)."""
+    with _series_lock:
+        if ticker in _series_cache:
+            return _series_cache[ticker]
+    path = _series_path(ticker)
+    series = read_json(path) if os.path.exists(path) else None
+    if series is None:
+        series = _build_series_from_dir(ticker)
+    with _series_lock:
+        return _series_cache.setdefault(ticker, series)
+
+
+def save_series(ticker: str, series: List[dict]) -> None:
+    os.makedirs(SERIES_DIR, exist_ok=True)
+    write_json(_series_path(ticker), series, indent=None)
+
+
+# ----------------------------- DERIVATION -----------------------------------
+def _days(series: List[dict], i: int, j: int) -> int:
+    return (pd.Timestamp(series[j]["date"]) - pd.Timestamp(series[i]["date"])).days
+
+
+def _fiscal_year_start(series: List[dict], j: int) -> Optional[int]:
+    """Index of the first filing after the previous 10-K (None if no 10-K precedes j)."""
+    for k in range(j - 1, -1, -1):
+        if _is_annual(series[k].get("form")):
+            return k + 1
+    return None
+
+
+def _quarter_value(series: List[dict], j: int, name: str) -> Optional[float]:
+    """Value of flow `name` for the single quarter ending at series[j]."""
+    value = series[j].get(name)
+    if value is None:
+        return None
+    mode = FLOW_INPUTS[name][1]
+    start = _fiscal_year_start(series, j)
+
+    if not _is_annual(series[j].get("form")):
+        if mode == "quarter":
+            return value
+        # Year-to-date: first quarter after a 10-K is itself, later ones are differences
+        if start is None:
+            return None
+        if j == start:
+            return value if QUARTER_GAP_DAYS[0] <= _days(series, j - 1, j) <= QUARTER_GAP_DAYS[1] else None
+        if not QUARTER_GAP_DAYS[0] <= _days(series, j - 1, j) <= QUARTER_GAP_DAYS[1]:
+            return None
+        previous = series[j - 1].get(name)
+        return None if previous is None else value - previous
+
+    # 10-K: Q4 = FY - Q1..Q3 (exactly three 10-Qs in this fiscal year)
+    first = start if start is not None else 0
+    quarters = list(range(first, j))
+    if len(quarters) != 3 or not FOUR_QUARTERS_SPAN_DAYS[0] <= _days(series, first, j) <= FOUR_QUARTERS_SPAN_DAYS[1]:
+        return None
+    if mode == "ytd":
+        q3_ytd = series[j - 1].get(name)
+        return None if q3_ytd is None else value - q3_ytd
+    parts = [series[k].get(name) for k in quarters]
+    if any(p is None for p in parts):
+        return None
+    return value - sum(parts)
+
+
+def _ttm(series: List[dict], j: int, name: str) -> Optional[float]:
+    if j < 3 or not FOUR_QUARTERS_SPAN_DAYS[0] <= _days(series, j - 3, j) <= FOUR_QUARTERS_SPAN_DAYS[1]:
+        return None
+    parts = [_quarter_value(series, k, name) for k in range(j - 3, j + 1)]
+    if any(p is None for p in parts):
+        return None
+    return float(sum(parts))
+
+
+def _year_ago_index(series: List[dict], dates: List[str], j: int) -> Optional[int]:
+    target = pd.Timestamp(series[j]["date"]) - pd.Timedelta(days=365)
+    k = bisect.bisect_left(dates, (target - pd.Timedelta(days=YEAR_TOLERANCE_DAYS)).strftime("%Y-%m-%d"))
+    if k < j and abs((pd.Timestamp(dates[k]) - target).days) <= YEAR_TOLERANCE_DAYS:
+        return k
+    return None
+
+
+def _growth(now: Optional[float], before: Optional[float]) -> Optional[float]:
+    if now is None or before is None or before == 0:
+        return None
+    return to_percent((now - before) / abs(before))
+
+
+def _pe_ttm(entry: dict, ttm_net_income: Optional[float]) -> Optional[float]:
+    """Price * shares / TTM net income of one series entry."""
+    if entry.get("price") is None or entry.get("shares") is None:
+        return None
+    return safe_div(float(entry["price"]) * float(entry["shares"]), ttm_net_income)
+
+
+def derive(series: List[dict], j: int, dates: Optional[List[str]] = None) -> Dict[str, Optional[float]]:
+    """Derived variables of the filing at position j of a date-sorted series."""
+    dates = dates if dates is not None else [e["date"] for e in series]
+    ttm = {name: _ttm(series, j, name) for name in FLOW_INPUTS}
+    fcf = None if ttm["cfo"] is None or ttm["capex"] is None else ttm["cfo"] - ttm["capex"]
+
+    revenue_yoy = net_income_yoy = None
+    k = _year_ago_index(series, dates, j)
+    if k is not None:
+        revenue_yoy = _growth(ttm["revenue"], _ttm(series, k, "revenue"))
+        net_income_yoy = _growth(ttm["net_income"], _ttm(series, k, "net_income"))
+
+    return {
+        "TTM Net Income": ttm["net_income"],
+        "TTM Revenue": ttm["revenue"],
+        "TTM Operating Cash Flow": ttm["cfo"],
+        "TTM CapEx": ttm["capex"],
+        "TTM FCF": fcf,
+        "P/E (TTM)": _pe_ttm(series[j], ttm["net_income"]),
+        "Revenue YoY": revenue_yoy,
+        "Net Income YoY": net_income_yoy,
+    }
+
+
+def _write_derived(file_path: str, derived: Dict[str, Optional[float]]) -> None:
+    data = read_json(file_path) if file_path and os.path.exists(file_path) else None
+    if data is None:
+        return
+    data.setdefault("computed", {}).update(derived)
+    write_json(file_path, data)
+
+
+def _refresh(series: List[dict], positions, force: bool = False) -> int:
+    """Recompute derived values at `positions`; rewrite JSON files whose values changed."""
+    dates = [e["date"] for e in series]
+    written = 0
+    for j in positions:
+        derived = derive(series, j, dates)
+        if force or derived != series[j].get("derived"):
+            series[j]["derived"] = derived
+            _write_derived(series[j]["file"], derived)
+            written += 1
+    return written
+
+
+# ----------------------------- PUBLIC API -----------------------------------
+def update_filing(ticker: str, file_path: str, data: Optional[dict] = None) -> Dict[str, Optional[float]]:
+    """
+    Insert (or replace) one saved filing in the ticker series and refresh the derived
+    values it can affect. Call after the filing JSON has been written. Returns the
+    derived values of that filing.
+    """
+    data = data if data is not None else read_json(file_path)
+    entry = _entry_from_json(data, file_path) if data else None
+    if entry is None:
+        return {}
+
+    with _ticker_lock(ticker), metrics.span("derived_update"):
+        series = load_series(ticker)
+        dates = [e["date"] for e in series]
+        pos = bisect.bisect_left(dates, entry["date"])
+        if pos < len(series) and series[pos]["date"] == entry["date"]:
+            entry["derived"] = series[pos].get("derived")
+            series[pos] = entry
+        else:
+            series.insert(pos, entry)
+
+        # The JSON was just rewritten (its 'computed' lost the derived keys), so always write it
+        _refresh(series, [pos], force=True)
+        _refresh(series, range(pos + 1, min(len(series), pos + 1 + AFFECTED_WINDOW)))
+        save_series(ticker, series)
+        return series[pos]["derived"]
+
+
+def update_prices(ticker: str, prices: Dict[str, Optional[float]]) -> Dict[str, Dict[str, Optional[float]]]:
+    """
+    New prices of filings ({report date: price}): only the price-dependent derived values
+    (PRICE_DERIVED_VARIABLES) are recomputed, from the stored TTM values - nothing is
+    rescanned. The series is saved once; the JSON files are left to the caller, which
+    gets {report date: changed derived values}.
+    """
+    changed: Dict[str, Dict[str, Optional[float]]] = {}
+    with _ticker_lock(ticker):
+        series = load_series(ticker)
+        dates = [e["date"] for e in series]
+        for date, price in prices.items():
+            pos = bisect.bisect_left(dates, date)
+            if pos >= len(series) or dates[pos] != date:
+                continue
+            entry = series[pos]
+            entry["price"] = price
+            derived = entry.get("derived") or {}
+            values = {"P/E (TTM)": _pe_ttm(entry, derived.get("TTM Net Income"))}
+            derived.update(values)
+            entry["derived"] = derived
+            changed[date] = values
+        if changed:
+            save_series(ticker, series)
+    return changed
+
+
+def rebuild_ticker(ticker: str) -> int:
+    """Rebuild the series of a ticker from its JSON filings and rewrite all derived values."""
+    with _ticker_lock(ticker):
+        series = _build_series_from_dir(ticker)
+        with _series_lock:
+            _series_cache[ticker] = series
+        written = _refresh(series, range(len(series)))
+        save_series(ticker, series)
+    return written
+
+
+# ----------------------------- CLI -----------------------------------------
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Backfill TTM / YoY derived metrics into JSON filings.")
+    parser.add_argument("--tickers", nargs="*", help="Only these tickers (default: all in xbrl_data_json)")
+    args = parser.parse_args(argv)
+
+    tickers = args.tickers
+    if not tickers and os.path.isdir(JSON_DIR):
+        tickers = sorted(d for d in os.listdir(JSON_DIR)
+                         if not d.startswith("_") and os.path.isdir(os.path.join(JSON_DIR, d)))
+    for ticker in tickers or []:
+        written = rebuild_ticker(ticker)
+        print(f"[INFO] {ticker}: derived metrics updated in {written} filings.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,328 @@
+"""
+Incremental EDGAR sync ("what's new since last run").
+
+Keeps a high-water mark per CIK (last filing date + accession seen), asks EDGAR
+only for filings after it and ingests just those. Safe to re-run: filings already
+present in the per-ticker filing index are never downloaded twice.
+
+Usage (nightly job over the whole company_tickers.json universe):
+    python edgar_sync.py
+    python edgar_sync.py --tickers AAPL MSFT --workers 4
+"""
+import argparse
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Dict, List, Optional
+
+import pandas as pd
+import requests
+from edgar import Filing
+
+import data_sources
+import http_client
+import info_picker_2
+import metrics
+from indicators import MAPPING_VARIABLE
+from ingest_pipeline import IngestPipeline, parse_statements
+from xbrl_cache import load_raw_xbrl
+
+# ----------------------------- CONSTANTS ------------------------------------
+SYNC_STATE_DIR = ".cache_sync"
+SYNC_STATE_FILE = os.path.join(SYNC_STATE_DIR, "edgar_sync_state.json")
+
+SEC_SUBMISSIONS_URL = "https://data.sec.gov"
+SEC_HEADERS = {"User-Agent": "EdgarAnalytic/0.1 (contact@example.com)"}
+
+# SEC fair-access policy: max 10 requests per second
+SEC_MAX_REQUESTS_PER_SECOND = 10
+
+SYNC_FORMS = ("10-Q", "10-K")
+
+# Without a high-water mark nor ingested filings, only look this far back
+DEFAULT_LOOKBACK_DAYS = 400
+
+# Persist the state every N processed companies (and always at the end)
+STATE_SAVE_EVERY = 50
+
+
+# ----------------------------- EDGAR CLIENT ---------------------------------
+class RateLimiter:
+    """Spaces calls so that at most `per_second` start within any second (thread-safe)."""
+
+    def __init__(self, per_second: float):
+        self.interval = 1.0 / per_second if per_second else 0.0
+        self._lock = threading.Lock()
+        self._next_slot = 0.0
+
+    def wait(self):
+        with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._next_slot)
+            self._next_slot = slot + self.interval
+        delay = slot - now
+        if delay > 0:
+            time.sleep(delay)
+
+
+class EdgarSubmissionsClient:
+    """
+    Minimal EDGAR client used by the sync.
+
+    - `list_filings(cik)` reads the submissions JSON (one request per CIK) and returns
+      filing metadata dicts: accession_no, filing_date, report_date, form, is_xbrl.
+    - `fetch_raw_xbrl(company, meta)` downloads the raw XBRL documents of one filing.
+
+    Without a `session` the submissions JSON comes from the process-wide data source
+    (data_sources.get_source(): live, recorded or replayed like every other fetch).
+    `base_url` and `session` are injectable, so tests can point the client at a local
+    fixture server (serving /submissions/CIK##########.json) instead of data.sec.gov;
+    an injected session is used directly through http_client.
+    """
+
+    def __init__(self, base_url: str = SEC_SUBMISSIONS_URL, session: Optional[requests.Session] = None,
+                 rate_limiter: Optional[RateLimiter] = None, timeout: float = 20):
+        self.base_url = base_url.rstrip("/")
+        self.http = http_client.HttpClient(session) if session is not None else None
+        self.rate_limiter = rate_limiter or RateLimiter(SEC_MAX_REQUESTS_PER_SECOND)
+        self.timeout = timeout
+
+    def list_filings(self, cik) -> List[dict]:
+        url = f"{self.base_url}/submissions/CIK{int(cik):010d}.json"
+        self.rate_limiter.wait()
+        with metrics.span("edgar_fetch", kind="submissions"):
+            data = self._get_json(url)
+        if not data:
+            return []
+
+        recent = (data.get("filings") or {}).get("recent") or {}
+        accessions = recent.get("accessionNumber") or []
+        n = len(accessions)
+
+        def column(name, default=None):
+            values = recent.get(name) or []
+            return values if len(values) == n else [default] * n
+
+        filing_dates = column("filingDate")
+        report_dates = column("reportDate")
+        forms = column("form")
+        is_xbrl = column("isXBRL", 0)
+
+        return [
+            {
+                "accession_no": accessions[i],
+                "filing_date": filing_dates[i],
+                "report_date": report_dates[i] or None,
+                "form": forms[i],
+                "is_xbrl": bool(is_xbrl[i]),
+            }
+            for i in range(n)
+        ]
+
+    def _get_json(self, url: str) -> Optional[dict]:
+        if self.http is None:
+            return data_sources.get_source().get_json(url, headers=SEC_HEADERS)
+        resp = self.http.get(url, headers=SEC_HEADERS, timeout=self.timeout)
+        if resp.status_code != 200:
+            print(f"[SYNC] HTTP {resp.status_code} on {url}")
+            return None
+        return resp.json()
+
+    def fetch_raw_xbrl(self, company, meta: dict) -> Optional[Dict[str, str]]:
+        cached = load_raw_xbrl(meta["accession_no"])
+        if cached is not None:
+            return cached
+        filing = Filing(
+            cik=int(company.cik),
+            company=company.title,
+            form=meta["form"],
+            filing_date=meta["filing_date"],
+            accession_no=meta["accession_no"],
+        )
+        self.rate_limiter.wait()
+        return data_sources.get_source().xbrl(filing)
+
+
+# ----------------------------- SYNC STATE -----------------------------------
+def load_sync_state(path: str = SYNC_STATE_FILE) -> Dict[str, dict]:
+    """cik -> {"last_filing_date": "YYYY-MM-DD", "last_accession": str, "synced_at": iso}"""
+    if not os.path.exists(path):
+        return {}
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except Exception as e:
+        print(f"[ERROR] Failed to read sync state {path}: {e}")
+        return {}
+
+
+def save_sync_state(state: Dict[str, dict], path: str = SYNC_STATE_FILE) -> None:
+    """Write atomically so an interrupted nightly run never leaves a corrupt state file."""
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(state, f, indent=2)
+    os.replace(tmp_path, path)
+
+
+def _initial_high_water_mark(filing_index: Dict[str, dict]) -> str:
+    """Seed the mark from already ingested filings, else from DEFAULT_LOOKBACK_DAYS."""
+    filed = [e.get("filing_date") for e in filing_index.values() if e.get("filing_date")]
+    if filed:
+        return max(filed)
+    return (pd.Timestamp.today().normalize() - pd.Timedelta(days=DEFAULT_LOOKBACK_DAYS)).strftime("%Y-%m-%d")
+
+
+# ----------------------------- SYNC -----------------------------------------
+def _filings_since_mark(filings: List[dict], mark: Optional[dict], filing_index: Dict[str, dict]) -> List[dict]:
+    """XBRL 10-Q / 10-K filings on or after the high-water mark's date, oldest first."""
+    last_date = (mark or {}).get("last_filing_date") or _initial_high_water_mark(filing_index)
+    since = [
+        meta for meta in filings
+        if meta["form"] in SYNC_FORMS and meta["is_xbrl"]
+        and meta["filing_date"] and meta["filing_date"] >= last_date
+    ]
+    since.sort(key=lambda m: (m["filing_date"], m["accession_no"]))
+    return since
+
+
+def select_new_filings(filings: List[dict], mark: Optional[dict], filing_index: Dict[str, dict]) -> List[dict]:
+    """
+    Filings strictly after the high-water mark (by filing date). Filings on the mark's
+    own date are kept unless already ingested, so a partially synced day is finished
+    on the next run.
+    """
+    return [meta for meta in _filings_since_mark(filings, mark, filing_index)
+            if meta["accession_no"] not in filing_index]
+
+
+def advance_mark(filings: List[dict], mark: Optional[dict], filing_index: Dict[str, dict]) -> Optional[dict]:
+    """
+    Move the mark over the leading run of ingested filings only: a filing that failed
+    (fetch, parse, write or an unparsable report date) stops it, so the next run
+    retries it. Returns the unchanged mark when the oldest pending filing failed.
+    """
+    last = None
+    for meta in _filings_since_mark(filings, mark, filing_index):
+        if meta["accession_no"] not in filing_index:
+            break
+        last = meta
+    if last is None or (mark and last["accession_no"] == mark.get("last_accession")):
+        return mark
+    return {
+        "last_filing_date": last["filing_date"],
+        "last_accession": last["accession_no"],
+        "synced_at": pd.Timestamp.now().isoformat(timespec="seconds"),
+    }
+
+
+def sync_company(company, client: EdgarSubmissionsClient, mark: Optional[dict],
+                 mapping_variables: Optional[Dict[str, str]] = None) -> Optional[dict]:
+    """
+    Ingest the filings of one company newer than its high-water mark.
+    Returns the new mark (see `advance_mark`), or the unchanged one if nothing was new.
+    """
+    filing_index = info_picker_2.load_filing_index(company.ticker)
+    try:
+        filings = client.list_filings(company.cik)
+    except Exception as e:
+        print(f"[SYNC][{company.ticker}] list_filings failed: {e}")
+        return mark
+
+    new_filings = select_new_filings(filings, mark, filing_index)
+    if not new_filings:
+        return mark
+
+    print(f"[SYNC][{company.ticker}] {len(new_filings)} new filing(s) since "
+          f"{(mark or {}).get('last_filing_date', 'start')}")
+
+    items = []
+    for meta in new_filings:
+        report_dt = pd.to_datetime(meta["report_date"] or meta["filing_date"], errors="coerce")
+        if pd.isna(report_dt) and meta["report_date"]:
+            # A malformed reportDate must not stall the mark on this filing forever
+            print(f"[SYNC][{company.ticker}] Unparsable report date {meta['report_date']!r} of "
+                  f"{meta['accession_no']}, using filing date {meta['filing_date']}")
+            report_dt = pd.to_datetime(meta["filing_date"], errors="coerce")
+        if pd.isna(report_dt):
+            print(f"[SYNC][{company.ticker}] Skipping {meta['accession_no']}: no usable date")
+            continue
+        items.append(dict(meta, report_date=report_dt))
+
+    IngestPipeline(
+        fetch_fn=lambda meta: client.fetch_raw_xbrl(company, meta),
+        parse_fn=parse_statements,
+        write_fn=lambda meta, statements: info_picker_2.ingest_financials(
+            company, statements, meta, filing_index, mapping_variables=mapping_variables),
+        fetch_workers=2,
+    ).run(items)
+
+    info_picker_2.save_filing_index(company.ticker, filing_index)
+
+    return advance_mark(filings, mark, filing_index)
+
+
+def sync_universe(companies: Dict[str, "info_picker_2.CompanyIns"],
+                  client: Optional[EdgarSubmissionsClient] = None,
+                  state_path: str = SYNC_STATE_FILE,
+                  mapping_variables: Optional[Dict[str, str]] = None,
+                  workers: int = 8) -> Dict[str, dict]:
+    """
+    Sync every company in `companies` (cik -> CompanyIns). Idempotent: re-running
+    immediately afterwards lists the submissions again but ingests nothing.
+    """
+    client = client or EdgarSubmissionsClient()
+    mapping_variables = mapping_variables if mapping_variables is not None else MAPPING_VARIABLE
+    state = load_sync_state(state_path)
+    started = time.monotonic()
+    done = 0
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        futures = {
+            pool.submit(sync_company, company, client, state.get(str(cik)), mapping_variables): str(cik)
+            for cik, company in companies.items()
+        }
+        for future in as_completed(futures):
+            cik = futures[future]
+            try:
+                new_mark = future.result()
+            except Exception as e:
+                print(f"[SYNC] {cik} failed: {e}")
+                continue
+            if new_mark:
+                state[cik] = new_mark
+            done += 1
+            if done % STATE_SAVE_EVERY == 0:
+                save_sync_state(state, state_path)
+
+    save_sync_state(state, state_path)
+    print(f"[SYNC] {done}/{len(companies)} companies synced in {time.monotonic() - started:.1f}s")
+    if metrics.is_enabled():
+        print(metrics.format_summary())
+    return state
+
+
+# ----------------------------- CLI -----------------------------------------
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Incremental EDGAR sync of 10-Q/10-K filings.")
+    parser.add_argument("--tickers", nargs="*", help="Only sync these tickers (default: whole universe)")
+    parser.add_argument("--workers", type=int, default=8, help="Concurrent companies")
+    parser.add_argument("--base-url", default=SEC_SUBMISSIONS_URL, help="Submissions API base URL")
+    parser.add_argument("--state", default=SYNC_STATE_FILE, help="Path of the high-water-mark state file")
+    args = parser.parse_args(argv)
+
+    data = info_picker_2.CompanyData()
+    data.load_saved_companies()
+    universe = data.companies
+    if args.tickers:
+        wanted = {t.upper() for t in args.tickers}
+        universe = {k: v for k, v in universe.items() if v.ticker.upper() in wanted}
+
+    sync_universe(universe, client=EdgarSubmissionsClient(base_url=args.base_url),
+                  state_path=args.state, workers=args.workers)
+
+
+if __name__ == "__main__":
+    main()
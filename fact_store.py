@@ -0,0 +1,665 @@
+"""
+Per-ticker XBRL fact table: every reported period of every statement row.
+
+A filing carries more than its own period - a 10-K income statement has three
+fiscal years, a 10-Q the comparative quarter of the previous year, balance sheets
+the previous year end. The filing JSON keeps only the statements, and the 'base'
+values only the first column, so those periods used to be thrown away.
+
+Facts are kept in xbrl_data_json/_facts/<TICKER>.parquet, one row per
+    concept, period_start, period_end, duration, value, units, accession_no, filed, form,
+    derived, calendar_period
+deduplicated across filings on (cik, concept, period_start, period_end): the latest
+filed value wins (restatements), its accession number records where it came from.
+
+Every merge re-runs a vectorized post-processing stage over the whole table
+(`derive_periods`): year-to-date cash flows get their fiscal year start, quarters no
+filing reports are derived (Q4 = fiscal year - Q1..Q3, Q2 / Q3 from year-to-date
+differences; derived=True, provenance of the longer period) and each fact is labelled
+with its calendar period ('CY2023Q4I', 'CY2023Q4', 'CY2023'), so fiscal years ending
+in e.g. January or September line up with calendar quarters.
+Tables are sorted by (concept, period_end), so a time series is one contiguous
+slice found by binary search (`FactTable.rows`, `period_series`).
+
+The statement tables of a filing JSON repeat the comparatives of earlier filings;
+once their facts are in the table they can be dropped from the JSON (`backfill_ticker(compact=True)`,
+info_picker_2.STATEMENTS_IN_JSON) - metadata, 'base' and 'computed' stay.
+
+Sources:
+  - facts_from_instance: the XBRL instance facts of a freshly parsed filing (exact
+    start / end dates, restricted to concepts shown in the three statements)
+  - facts_from_statements: the statement tables of a filing JSON (legacy filings,
+    backfill); period ends come from the column labels, durations from the sheet
+    and form (10-Q cash flows are year-to-date of unknown length: duration "ytd")
+
+Usage (backfill from existing JSON filings, optionally compacting them):
+    python fact_store.py
+    python fact_store.py --tickers AAPL MSFT --compact
+"""
+import argparse
+import json
+import os
+import threading
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+import metrics
+from helper import file_lock, read_json, write_json
+
+# ----------------------------- CONSTANTS ------------------------------------
+JSON_DIR = "xbrl_data_json"
+FACT_DIR = os.path.join(JSON_DIR, "_facts")
+
+FACT_COLUMNS = ["cik", "concept", "period_start", "period_end", "duration", "value", "units",
+                "accession_no", "filed", "form", "derived", "calendar_period"]
+FACT_KEY = ["cik", "concept", "period_start", "period_end"]
+# Physical order of a table: the range scan of one concept is a contiguous slice
+SORT_KEY = ["concept", "period_end", "period_start", "cik"]
+
+# Duration preferred when a period end has several (the filing's own period first)
+DURATION_PRIORITY = {"instant": 0, "3 months": 1, "annual": 2, "6 months": 3, "9 months": 4, "ytd": 5}
+
+COMPANY_FILE = "company_tickers.json"
+
+SHEETS = ("balance_sheet", "income", "cashflow")
+STATEMENT_META_COLUMNS = {"concept", "level", "abstract", "units", "decimals"}
+
+# A filing's own period counts as covered when these facts exist for its period end
+COVERAGE_INSTANT_CONCEPTS = ["us-gaap_Assets", "us-gaap_StockholdersEquity"]
+COVERAGE_FLOW_CONCEPTS = ["us-gaap_NetIncomeLoss"]
+
+# Calendar alignment: a quarter belongs to the calendar quarter holding most of it
+CALENDAR_SHIFT = pd.Timedelta(days=45)
+# A year-to-date fact starts after the preceding fiscal year end at most this far back
+MAX_FISCAL_YEAR_DAYS = 380
+# Days after a calendar quarter end by which its filing is due (10-Q; the 10-K for Q4)
+FILING_DUE_DAYS = {1: 45, 2: 45, 3: 45, 4: 90}
+
+_tables: Dict[str, "FactTable"] = {}
+_facts_lock = threading.Lock()
+_cik_by_ticker: Optional[Dict[str, str]] = None
+
+
+def _is_annual(form: Optional[str]) -> bool:
+    return bool(form) and str(form).upper().startswith("10-K")
+
+
+def _empty() -> pd.DataFrame:
+    return pd.DataFrame({
+        "cik": pd.Series(dtype="object"),
+        "concept": pd.Series(dtype="object"),
+        "period_start": pd.Series(dtype="datetime64[ns]"),
+        "period_end": pd.Series(dtype="datetime64[ns]"),
+        "duration": pd.Series(dtype="object"),
+        "value": pd.Series(dtype="float64"),
+        "units": pd.Series(dtype="object"),
+        "accession_no": pd.Series(dtype="object"),
+        "filed": pd.Series(dtype="datetime64[ns]"),
+        "form": pd.Series(dtype="object"),
+        "derived": pd.Series(dtype="bool"),
+        "calendar_period": pd.Series(dtype="object"),
+    })
+
+
+def _with_provenance(facts: pd.DataFrame, accession_no, filed, form, cik=None) -> pd.DataFrame:
+    facts["cik"] = str(cik) if cik else None
+    facts["accession_no"] = str(accession_no) if accession_no else None
+    facts["filed"] = pd.to_datetime(filed, errors="coerce")
+    facts["form"] = form
+    facts["derived"] = False
+    facts["calendar_period"] = None
+    return facts[FACT_COLUMNS]
+
+
+# ----------------------------- EXTRACTION -----------------------------------
+def duration_label(start: pd.Series, end: pd.Series) -> np.ndarray:
+    """edgartools-style duration labels ('instant', '3 months', ..., 'annual') from period dates."""
+    days = (end - start).dt.days.to_numpy(dtype="float64")
+    labels = np.select(
+        [np.isnan(days), days <= 100, days <= 196, days <= 290, days <= 380],
+        ["instant", "3 months", "6 months", "9 months", "annual"],
+        default="multi-year",
+    )
+    return labels
+
+
+def facts_from_instance(instance_facts: pd.DataFrame, concepts: Optional[Iterable[str]] = None) -> pd.DataFrame:
+    """
+    Facts of an edgartools XBRLInstance.facts frame: numeric, without dimensions,
+    optionally restricted to `concepts` (statement concept names, 'us-gaap_Assets').
+    Provenance columns are left empty.
+    """
+    if instance_facts is None or len(instance_facts) == 0:
+        return _empty()
+    frame = pd.DataFrame({
+        "concept": instance_facts["concept"].astype(str).str.replace(":", "_", n=1, regex=False).to_numpy(),
+        "value": pd.to_numeric(instance_facts["value"].astype(str), errors="coerce").to_numpy(dtype="float64"),
+        "units": instance_facts["units"].astype(object).to_numpy(),
+        "period_start": pd.to_datetime(instance_facts["start_date"].astype(object), errors="coerce").to_numpy(),
+        "period_end": pd.to_datetime(instance_facts["end_date"].astype(object), errors="coerce").to_numpy(),
+        "dimensioned": instance_facts["dimensions"].map(bool).to_numpy(dtype=bool),
+    })
+    keep = ~frame["dimensioned"] & frame["value"].notna() & frame["period_end"].notna()
+    if concepts is not None:
+        keep &= frame["concept"].isin(set(concepts))
+    frame = frame[keep].drop(columns="dimensioned")
+    frame["duration"] = duration_label(frame["period_start"], frame["period_end"])
+    frame = frame.drop_duplicates(FACT_KEY[1:], keep="first")
+    return _with_provenance(frame, None, None, None)
+
+
+def statement_concepts(statements: Dict[str, dict]) -> set:
+    """Concept names shown in the three statement tables."""
+    out = set()
+    for sheet in SHEETS:
+        out.update(((statements or {}).get(sheet) or {}).get("concept", {}).values())
+    return {c for c in out if c}
+
+
+def _label_dates(labels: List[str], report_date: pd.Timestamp) -> Dict[str, pd.Timestamp]:
+    """Statement column label -> period end ('Mar 31, 2019'; annual labels '2019' end on the report day)."""
+    out = {}
+    for label in labels:
+        text = str(label).strip()
+        if text.isdigit() and len(text) == 4:
+            year = int(text)
+            day = min(report_date.day, pd.Timestamp(year=year, month=report_date.month, day=1).days_in_month)
+            out[label] = pd.Timestamp(year=year, month=report_date.month, day=day)
+        else:
+            out[label] = pd.to_datetime(text, errors="coerce")
+    return out
+
+
+def facts_from_statements(statements: Dict[str, dict], report_date, form: Optional[str]) -> pd.DataFrame:
+    """All (concept, period) facts of the statement tables of one filing, one melt per sheet."""
+    report_date = pd.Timestamp(report_date).normalize()
+    annual = _is_annual(form)
+    parts = []
+    for sheet in SHEETS:
+        table = (statements or {}).get(sheet) or {}
+        concepts = table.get("concept") or {}
+        period_cols = [c for c in table if c not in STATEMENT_META_COLUMNS]
+        if not concepts or not period_cols:
+            continue
+
+        wide = pd.DataFrame({c: table[c] for c in period_cols})
+        wide["concept"] = pd.Series(concepts)
+        wide["units"] = pd.Series(table.get("units") or {}, dtype="object")
+        long = wide.melt(id_vars=["concept", "units"], var_name="label", value_name="value")
+        long["value"] = pd.to_numeric(long["value"], errors="coerce")
+        long = long[long["value"].notna() & long["concept"].notna()]
+
+        ends = _label_dates(period_cols, report_date)
+        long["period_end"] = pd.to_datetime(long["label"].map(ends))
+        long = long[long["period_end"].notna()]
+
+        if sheet == "balance_sheet":
+            long["duration"] = "instant"
+            long["period_start"] = pd.NaT
+        else:
+            year_label = long["label"].astype(str).str.fullmatch(r"\d{4}")
+            if annual:
+                long["duration"] = "annual"
+            elif sheet == "income":
+                long["duration"] = np.where(year_label, "annual", "3 months")
+            else:
+                long["duration"] = np.where(year_label, "annual", "ytd")
+            # 3 / 12 months back from the day after the period end; year-to-date starts stay unknown (NaT)
+            long["period_start"] = pd.NaT
+            for duration, months in (("3 months", 3), ("annual", 12)):
+                mask = (long["duration"] == duration).to_numpy()
+                if mask.any():
+                    ends = long.loc[mask, "period_end"]
+                    long.loc[mask, "period_start"] = ends + pd.Timedelta(days=1) - pd.DateOffset(months=months)
+        parts.append(long)
+
+    if not parts:
+        return _empty()
+    facts = pd.concat(parts, ignore_index=True)
+    facts["period_start"] = pd.to_datetime(facts["period_start"])
+    # The same concept can appear on two sheets (e.g. net income on income and cash flow)
+    facts = facts.drop_duplicates(FACT_KEY[1:], keep="first")
+    return _with_provenance(facts, None, None, None)
+
+
+# ----------------------------- DERIVED PERIODS ------------------------------
+def calendar_quarters(period_end) -> pd.PeriodIndex:
+    """
+    Calendar quarter of quarterly period ends: the quarter holding most of the three
+    months, i.e. of (end - 45 days) - a fiscal quarter ending Jan 31 is calendar Q4.
+    """
+    return pd.PeriodIndex(pd.DatetimeIndex(period_end) - CALENDAR_SHIFT, freq="Q")
+
+
+def calendar_period(frame: pd.DataFrame) -> np.ndarray:
+    """
+    SEC frame style calendar labels: 'CY2023Q4I' (instants), 'CY2023Q4' (quarters),
+    'CY2023' (fiscal years, by the calendar year holding most of the year); None otherwise.
+    """
+    if frame.empty:
+        return np.array([], dtype=object)
+    ends = pd.DatetimeIndex(frame["period_end"])
+    duration = frame["duration"].to_numpy()
+    quarters = np.asarray(calendar_quarters(ends).astype(str), dtype=object)   # '2023Q4'
+    years = ((ends - pd.Timedelta(days=182)).year).astype(str).to_numpy(dtype=object)
+    labels = np.select(
+        [duration == "instant", duration == "3 months", duration == "annual"],
+        ["CY" + quarters + "I", "CY" + quarters, "CY" + years],
+        default=None,
+    )
+    labels[pd.isna(ends)] = None
+    return labels
+
+
+def _resolve_ytd(frame: pd.DataFrame) -> pd.DataFrame:
+    """
+    Year-to-date facts of unknown start (10-Q cash flows from statement tables) start
+    the day after the preceding fiscal year end, known from the annual facts.
+    """
+    ytd = (frame["duration"] == "ytd").to_numpy() & frame["period_start"].isna().to_numpy()
+    if not ytd.any():
+        return frame
+    fiscal_ends = np.unique(frame.loc[frame["duration"] == "annual", "period_end"].to_numpy(dtype="datetime64[ns]"))
+    if not len(fiscal_ends):
+        return frame
+    ends = frame.loc[ytd, "period_end"].to_numpy(dtype="datetime64[ns]")
+    pos = np.searchsorted(fiscal_ends, ends, side="left") - 1
+    previous = fiscal_ends[np.maximum(pos, 0)]
+    valid = (pos >= 0) & (ends - previous <= np.timedelta64(MAX_FISCAL_YEAR_DAYS, "D"))
+    if not valid.any():
+        return frame
+    frame = frame.copy()
+    rows = np.flatnonzero(ytd)[valid]
+    starts = pd.Series(previous[valid] + np.timedelta64(1, "D"), index=frame.index[rows])
+    frame.loc[frame.index[rows], "period_start"] = starts
+    frame.loc[frame.index[rows], "duration"] = duration_label(starts, frame.loc[frame.index[rows], "period_end"])
+    return frame
+
+
+def _quarter_rows(source: pd.DataFrame, start, value) -> pd.DataFrame:
+    """Derived 3 month facts ending with `source` rows (provenance of the longer period)."""
+    out = source[["cik", "concept", "period_end", "units", "accession_no", "filed", "form"]].copy()
+    out["period_start"] = pd.to_datetime(start)
+    out["value"] = value
+    out["duration"] = "3 months"
+    out["derived"] = True
+    out["calendar_period"] = None
+    return out[FACT_COLUMNS]
+
+
+def _quarters_from_ytd(flows: pd.DataFrame) -> pd.DataFrame:
+    """Q2 = 6 months - 3 months, Q3 = 9 months - 6 months (same fiscal year start)."""
+    longer = flows[flows["duration"].isin(["6 months", "9 months"])]
+    if longer.empty:
+        return _empty()
+    shorter = flows.loc[flows["duration"].isin(["3 months", "6 months"]),
+                        ["cik", "concept", "period_start", "period_end", "duration", "value"]]
+    pairs = longer.merge(shorter, on=["cik", "concept", "period_start"], suffixes=("", "_prev"))
+    steps = (((pairs["duration"] == "6 months") & (pairs["duration_prev"] == "3 months"))
+             | ((pairs["duration"] == "9 months") & (pairs["duration_prev"] == "6 months")))
+    pairs = pairs[steps]
+    return _quarter_rows(pairs, pairs["period_end_prev"] + pd.Timedelta(days=1),
+                         pairs["value"] - pairs["value_prev"])
+
+
+def _q4_from_annual(flows: pd.DataFrame) -> pd.DataFrame:
+    """
+    Q4 = fiscal year - 9 months year-to-date, else fiscal year - (Q1 + Q2 + Q3) when the
+    three quarters of the year are known.
+    """
+    annual = flows[flows["duration"] == "annual"]
+    if annual.empty:
+        return _empty()
+    parts = []
+
+    nine = flows.loc[flows["duration"] == "9 months", ["cik", "concept", "period_start", "period_end", "value"]]
+    pairs = annual.merge(nine, on=["cik", "concept", "period_start"], suffixes=("", "_ytd"))
+    pairs = pairs[pairs["period_end_ytd"] < pairs["period_end"]]
+    parts.append(_quarter_rows(pairs, pairs["period_end_ytd"] + pd.Timedelta(days=1),
+                               pairs["value"] - pairs["value_ytd"]))
+
+    quarters = flows.loc[flows["duration"] == "3 months", ["cik", "concept", "period_start", "period_end", "value"]]
+    annual = annual.reset_index(drop=True)
+    pairs = annual.reset_index(names="year").merge(quarters, on=["cik", "concept"], suffixes=("", "_q"))
+    pairs = pairs[(pairs["period_start_q"] >= pairs["period_start"]) & (pairs["period_end_q"] < pairs["period_end"])]
+    if not pairs.empty:
+        # Grouped by annual row (a null cik must not take part in a group key)
+        sums = pairs.groupby("year").agg(quarters=("value_q", "size"), total=("value_q", "sum"),
+                                         last_end=("period_end_q", "max"))
+        sums = sums[sums["quarters"] == 3]
+        years = annual.loc[sums.index]
+        parts.append(_quarter_rows(years, (sums["last_end"] + pd.Timedelta(days=1)).to_numpy(),
+                                   years["value"].to_numpy() - sums["total"].to_numpy()))
+    return pd.concat(parts, ignore_index=True)
+
+
+def derive_periods(frame: pd.DataFrame) -> pd.DataFrame:
+    """
+    Bulk post-processing of a deduplicated fact table (year-to-date starts resolved):
+    derive the quarters no filing reports (Q2 / Q3 cash flows from year-to-date
+    values, Q4 from the fiscal year) and label every fact with its calendar period.
+    Derived rows never replace reported ones and are rebuilt on every merge.
+    """
+    flows = frame[frame["period_start"].notna() & (frame["duration"] != "instant")]
+    derived = _quarters_from_ytd(flows)
+    # Q4 by difference may need the quarters just derived from year-to-date values
+    derived = pd.concat([derived, _q4_from_annual(pd.concat([flows, derived], ignore_index=True))],
+                        ignore_index=True)
+    if not derived.empty:
+        # One derived row per key (the year-to-date difference first); reported facts win
+        derived = derived.drop_duplicates(FACT_KEY, keep="first")
+        frame = pd.concat([frame, derived], ignore_index=True).drop_duplicates(FACT_KEY, keep="first")
+        metrics.incr("facts_derived", len(derived))
+    frame = frame.copy()
+    frame["calendar_period"] = calendar_period(frame)
+    return frame
+
+
+# ----------------------------- STORE ----------------------------------------
+class FactTable:
+    """
+    A ticker's facts sorted by SORT_KEY with per-concept slice bounds (the index).
+    `mtime` is that of the parquet file the table matches (None: no file).
+    """
+
+    def __init__(self, frame: pd.DataFrame, mtime: Optional[int] = None):
+        self.frame = frame
+        self.mtime = mtime
+        concepts = frame["concept"].to_numpy()
+        names, first = np.unique(concepts, return_index=True)
+        order = np.argsort(first)
+        starts = first[order]
+        stops = np.append(starts[1:], len(concepts))
+        self._bounds = {names[i]: (int(lo), int(hi)) for i, lo, hi in zip(order, starts, stops)}
+        self.ends = frame["period_end"].to_numpy(dtype="datetime64[ns]")
+        self.values = frame["value"].to_numpy(dtype="float64")
+        self.priority = frame["duration"].map(DURATION_PRIORITY).fillna(len(DURATION_PRIORITY)).to_numpy()
+
+    def __len__(self):
+        return len(self.frame)
+
+    def span(self, concept: str, start=None, end=None) -> Tuple[int, int]:
+        """Row range of `concept` with period_end in [start, end] (binary search within the concept slice)."""
+        lo, hi = self._bounds.get(concept, (0, 0))
+        if start is not None:
+            lo += int(np.searchsorted(self.ends[lo:hi], np.datetime64(pd.Timestamp(start), "ns"), side="left"))
+        if end is not None:
+            hi = lo + int(np.searchsorted(self.ends[lo:hi], np.datetime64(pd.Timestamp(end), "ns"), side="right"))
+        return lo, hi
+
+    def rows(self, concept: str, start=None, end=None) -> pd.DataFrame:
+        lo, hi = self.span(concept, start, end)
+        return self.frame.iloc[lo:hi]
+
+
+def _facts_path(ticker: str) -> str:
+    return os.path.join(FACT_DIR, f"{ticker}.parquet")
+
+
+def _cik_for_ticker(ticker: str) -> Optional[str]:
+    """CIK of a ticker from the saved company list (read once)."""
+    global _cik_by_ticker
+    if _cik_by_ticker is None:
+        mapping = {}
+        try:
+            with open(COMPANY_FILE, "r", encoding="utf-8") as f:
+                for key, item in json.load(f).items():
+                    mapping[str(item.get("ticker"))] = str(item.get("cik_str") or item.get("cik") or key)
+        except Exception as e:
+            print(f"[WARNING] Company list {COMPANY_FILE} not readable ({e}); facts stored without CIK.")
+        _cik_by_ticker = mapping
+    return _cik_by_ticker.get(ticker)
+
+
+def _normalize(frame: pd.DataFrame) -> pd.DataFrame:
+    """
+    Unique key, derived periods rebuilt, sorted for range scans (also upgrades tables
+    written without 'cik' or the derived columns).
+    """
+    if "cik" not in frame.columns:
+        frame = frame.assign(cik=None)
+    if "derived" in frame.columns:
+        frame = frame[~frame["derived"].fillna(False).astype(bool)]
+    frame = _resolve_ytd(frame.assign(derived=False))
+    frame = frame.sort_values("filed", kind="stable", na_position="first")
+    frame = frame.drop_duplicates(FACT_KEY, keep="last")
+    frame = derive_periods(frame)
+    return frame.sort_values(SORT_KEY, kind="stable")[FACT_COLUMNS].reset_index(drop=True)
+
+
+def _file_mtime(path: str) -> Optional[int]:
+    try:
+        return os.stat(path).st_mtime_ns
+    except OSError:
+        return None
+
+
+def load_table(ticker: str) -> FactTable:
+    """
+    Fact table of a ticker (memory -> parquet file -> empty). The memory copy is used
+    only while the file is unchanged, so writes of other processes are picked up.
+    """
+    path = _facts_path(ticker)
+    mtime = _file_mtime(path)
+    with _facts_lock:
+        table = _tables.get(ticker)
+        if table is not None and table.mtime == mtime:
+            return table
+    frame = None
+    if mtime is not None:
+        try:
+            with metrics.span("facts_read"):
+                frame = pd.read_parquet(path)
+            if list(frame.columns) != FACT_COLUMNS:
+                frame = _normalize(frame)
+        except Exception as e:
+            print(f"[ERROR] Failed to read facts {path}: {e}")
+            frame = None
+    table = FactTable(frame if frame is not None else _empty(), mtime)
+    with _facts_lock:
+        _tables[ticker] = table
+    return table
+
+
+def load_facts(ticker: str) -> pd.DataFrame:
+    return load_table(ticker).frame
+
+
+def save_facts(ticker: str, facts: pd.DataFrame) -> None:
+    """Write the table (callers merging into it hold `file_lock(_facts_path(ticker))`)."""
+    os.makedirs(FACT_DIR, exist_ok=True)
+    path = _facts_path(ticker)
+    tmp_path = f"{path}.tmp"
+    try:
+        with metrics.span("facts_write"):
+            facts.to_parquet(tmp_path, index=False)
+        os.replace(tmp_path, path)
+    except Exception as e:
+        print(f"[ERROR] Failed to save facts for {ticker}: {e}")
+    with _facts_lock:
+        _tables[ticker] = FactTable(facts, _file_mtime(path))
+
+
+def merge_facts(existing: pd.DataFrame, new: pd.DataFrame) -> pd.DataFrame:
+    """Union of two fact tables, one row per (cik, concept, period_start, period_end), latest filed wins."""
+    if new.empty:
+        return existing
+    return _normalize(new if existing.empty else pd.concat([existing, new], ignore_index=True))
+
+
+def add_filing_facts(ticker: str, facts: pd.DataFrame, accession_no=None, filed=None, form=None,
+                     cik=None) -> int:
+    """Merge the facts of one filing into the ticker table. Returns the number of facts offered."""
+    if facts is None or facts.empty:
+        return 0
+    facts = _with_provenance(facts.copy(), accession_no, filed, form, cik or _cik_for_ticker(ticker))
+    # Per-ticker lock across load -> merge -> save: concurrent writers (threads or
+    # processes) would otherwise drop each other's facts
+    with file_lock(_facts_path(ticker)), metrics.span("facts_merge"):
+        merged = merge_facts(load_facts(ticker), facts)
+        save_facts(ticker, merged)
+    metrics.incr("facts_added", len(facts))
+    return len(facts)
+
+
+def add_filing_json(ticker: str, data: dict, facts: Optional[pd.DataFrame] = None) -> int:
+    """
+    Merge the facts of a saved filing JSON; `facts` (from the XBRL instance) take
+    precedence over the statement tables of `data`.
+    """
+    if not data or not data.get("date"):
+        return 0
+    if facts is None or facts.empty:
+        facts = facts_from_statements(data, data["date"], data.get("form"))
+    return add_filing_facts(ticker, facts, data.get("accession_no"),
+                            data.get("filing_date") or data.get("date"), data.get("form"))
+
+
+# ----------------------------- QUERIES --------------------------------------
+def period_series(ticker: str, concept: str, start=None, end=None):
+    """
+    (period_end, value) arrays of `concept`, one value per period end in [start, end]:
+    instant facts, else the shortest own-period flow (3 months, then annual, ...).
+    """
+    table = load_table(ticker)
+    lo, hi = table.span(concept, start, end)
+    ends, values, priority = table.ends[lo:hi], table.values[lo:hi], table.priority[lo:hi]
+    if hi - lo > 1:
+        order = np.lexsort((priority, ends))
+        ends, values = ends[order], values[order]
+        first = np.ones(len(ends), dtype=bool)
+        first[1:] = ends[1:] != ends[:-1]
+        ends, values = ends[first], values[first]
+    return ends, values
+
+
+def filing_values(ticker: str, concepts: Iterable[str], period_end, form: Optional[str] = None) -> Dict[str, Optional[float]]:
+    """
+    Values of `concepts` for a filing's own period end, as its statements' first column
+    shows them: reported before derived facts, then the filing's own duration (annual for
+    a 10-K, 3 months otherwise), then DURATION_PRIORITY. Missing concepts -> None.
+    """
+    table = load_table(ticker)
+    end = pd.Timestamp(period_end)
+    own = "annual" if _is_annual(form) else "3 months"
+    durations = table.frame["duration"].to_numpy()
+    derived = table.frame["derived"].to_numpy(dtype=bool)
+    out: Dict[str, Optional[float]] = {}
+    for concept in concepts:
+        lo, hi = table.span(concept, end, end)
+        if lo >= hi:
+            out[concept] = None
+            continue
+        best = np.lexsort((table.priority[lo:hi], durations[lo:hi] != own, derived[lo:hi]))[0]
+        out[concept] = float(table.values[lo + best])
+    return out
+
+
+def period_ends(ticker: str) -> pd.DatetimeIndex:
+    """Sorted period ends of the ticker that have a balance sheet (instant facts of the coverage concepts)."""
+    table = load_table(ticker)
+    ends = [table.rows(c)["period_end"] for c in COVERAGE_INSTANT_CONCEPTS]
+    if not any(len(e) for e in ends):
+        return pd.DatetimeIndex([])
+    return pd.DatetimeIndex(pd.concat(ends).unique()).sort_values()
+
+
+def covers_period(ticker: str, period_end, form: Optional[str]) -> bool:
+    """
+    True when the table already holds the facts a filing for `period_end` would
+    contribute (balance sheet at period end and the flow of its own period), e.g.
+    from the comparative columns of later filings.
+    """
+    table = load_table(ticker)
+    if not len(table):
+        return False
+    end = pd.Timestamp(period_end).normalize()
+    flow_duration = "annual" if _is_annual(form) else "3 months"
+    for concepts, duration in ((COVERAGE_INSTANT_CONCEPTS, "instant"), (COVERAGE_FLOW_CONCEPTS, flow_duration)):
+        for concept in concepts:
+            if not (table.rows(concept, end, end)["duration"] == duration).any():
+                return False
+    return True
+
+
+def year_counts(ticker: str) -> Dict[int, int]:
+    """
+    Calendar quarters per calendar year with a balance sheet or a quarterly result
+    (derived Q4 included), fiscal periods aligned to calendar quarters.
+    """
+    table = load_table(ticker)
+    labels = [table.rows(c)["calendar_period"] for c in COVERAGE_INSTANT_CONCEPTS + COVERAGE_FLOW_CONCEPTS]
+    labels = pd.concat(labels).dropna() if labels else pd.Series(dtype=object)
+    quarters = labels[labels.str.contains("Q", regex=False)].str.slice(2, 8).unique()   # '2023Q4'
+    years, counts = np.unique([int(q[:4]) for q in quarters], return_counts=True)
+    return dict(zip(years.tolist(), counts.tolist()))
+
+
+def expected_quarters(year: int, today=None) -> int:
+    """Calendar quarters of `year` whose filings are due by `today` (4 for past years)."""
+    today = pd.Timestamp(today if today is not None else pd.Timestamp.today()).normalize()
+    due = [pd.Period(year=year, quarter=q, freq="Q").end_time.normalize() + pd.Timedelta(days=days)
+           for q, days in FILING_DUE_DAYS.items()]
+    return sum(d <= today for d in due)
+
+
+# ----------------------------- BACKFILL / COMPACTION ------------------------
+def _filing_files(ticker: str) -> List[str]:
+    folder = os.path.join(JSON_DIR, ticker)
+    if not os.path.isdir(folder):
+        return []
+    return [os.path.join(folder, f) for f in os.listdir(folder) if f.endswith(".json")]
+
+
+def backfill_ticker(ticker: str, compact: bool = False) -> int:
+    """
+    Merge the statement facts of all JSON filings of a ticker into its table (filings
+    already compacted contribute nothing, their facts are kept). With `compact` the
+    statement tables are then dropped from the JSONs. Returns the table size.
+    """
+    parts, with_statements = [], []
+    cik = _cik_for_ticker(ticker)
+    for path in _filing_files(ticker):
+        data = read_json(path)
+        if not data or not data.get("date") or not any(data.get(sheet) for sheet in SHEETS):
+            continue
+        facts = facts_from_statements(data, data["date"], data.get("form"))
+        parts.append(_with_provenance(facts, data.get("accession_no"),
+                                      data.get("filing_date") or data.get("date"), data.get("form"), cik))
+        with_statements.append((path, data))
+
+    with file_lock(_facts_path(ticker)):
+        facts = load_facts(ticker)
+        if parts:
+            facts = merge_facts(facts, pd.concat(parts, ignore_index=True))
+            save_facts(ticker, facts)
+
+    if compact:
+        for path, data in with_statements:
+            for sheet in SHEETS:
+                data.pop(sheet, None)
+            write_json(path, data)
+    return len(facts)
+
+
+# ----------------------------- CLI -----------------------------------------
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Build the per-ticker fact tables from JSON filings.")
+    parser.add_argument("--tickers", nargs="*", help="Only these tickers (default: all in xbrl_data_json)")
+    parser.add_argument("--compact", action="store_true",
+                        help="Drop the statement tables from the JSON filings once their facts are stored")
+    args = parser.parse_args(argv)
+
+    tickers = args.tickers
+    if not tickers and os.path.isdir(JSON_DIR):
+        tickers = sorted(d for d in os.listdir(JSON_DIR)
+                         if not d.startswith("_") and os.path.isdir(os.path.join(JSON_DIR, d)))
+    for ticker in tickers or []:
+        count = backfill_ticker(ticker, compact=args.compact)
+        print(f"[INFO] {ticker}: {count} facts.")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,9 +1,19 @@
 import json
 import os
+from contextlib import contextmanager
 from typing import List, Optional, Dict, Union, Tuple, Any
 
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+import numpy as np
 import pandas as pd
 
+import metrics
+
 
 def human_format(num: float) -> str:
     """
@@ -29,6 +39,78 @@ def human_format(num: float) -> str:
     else:
         return f"{num:.2f}"
 
+@contextmanager
+def file_lock(path: str):
+    """
+    Exclusive lock on `<path>.lock` for a read-modify-write of `path` shared by threads
+    and processes (Dash workers, sync jobs, backtests). Blocks until acquired; not reentrant.
+    """
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with open(f"{path}.lock", "a+b") as f:
+        if fcntl is not None:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+        else:
+            f.seek(0)
+            while True:
+                try:
+                    msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)  # retries for ~10 s, then raises
+                    break
+                except OSError:
+                    continue
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+            else:
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+
+
+def read_json(path: str) -> Optional[dict]:
+    """Parsed JSON file, None (logged) when it cannot be read."""
+    try:
+        with metrics.span("json_read"), open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except Exception as e:
+        print(f"[ERROR] Failed to read JSON {path}: {e}")
+        return None
+
+
+def write_json(path: str, data: Any, indent: Optional[int] = 4) -> bool:
+    """
+    Atomic JSON write (tmp file + os.replace): readers never see a half-written file and a
+    failed write leaves the previous content in place. Returns False (logged) on failure.
+    """
+    tmp_path = f"{path}.tmp"
+    try:
+        with metrics.span("json_write"), open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(data, f, indent=indent)
+        os.replace(tmp_path, path)
+        return True
+    except Exception as e:
+        print(f"[ERROR] Failed to write JSON {path}: {e}")
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+        return False
+
+
+def human_format_array(values) -> np.ndarray:
+    """Vectorized `human_format` over an array of floats (same suffixes and rounding)."""
+    values = np.asarray(values, dtype="float64")
+    abs_values = np.abs(values)
+    scale = np.select([abs_values >= 1e12, abs_values >= 1e9, abs_values >= 1e6, abs_values >= 1e3],
+                      [1e12, 1e9, 1e6, 1e3], default=1.0)
+    suffix = np.select([abs_values >= 1e12, abs_values >= 1e9, abs_values >= 1e6, abs_values >= 1e3],
+                       ["T", "B", "M", "K"], default="")
+    return np.char.add(np.char.mod("%.2f", values / scale), suffix)
+
+def fixed_format_array(values, suffix: str = "") -> np.ndarray:
+    """Vectorized f"{v:.2f}{suffix}"."""
+    return np.char.add(np.char.mod("%.2f", np.asarray(values, dtype="float64")), suffix)
+
 def _to_float(x: Any) -> Optional[float]:
     try:
         if x is None:
@@ -0,0 +1,201 @@
+"""
+Shared HTTP client for SEC and Wikipedia access.
+
+    resp = http_client.get("https://www.sec.gov/files/company_tickers.json", headers=SEC_HEADERS,
+                           conditional=True)
+
+- one requests.Session with a keep-alive connection pool, so repeated calls to a
+  host reuse TCP/TLS connections instead of opening a new one per request
+- at most HOST_CONCURRENCY requests in flight per host (threads wait for a slot)
+- 429 / 5xx responses and connection errors are retried with exponential backoff
+  (BACKOFF_SECONDS * 2^attempt plus jitter, or the server's Retry-After)
+- every request has a timeout (DEFAULT_TIMEOUT unless given)
+- `conditional=True` keeps the body with its ETag / Last-Modified under
+  .cache_http and revalidates with If-None-Match / If-Modified-Since; a 304 is
+  answered from that copy (as a 200)
+
+`HttpClient` takes the session, the sleep function and the cache directory as
+arguments, so it can be pointed at a local stub server in tests.
+
+Yahoo Finance is NOT fetched through this client: yfinance (data_sources.LiveSource.closes,
+used by price_store and info_picker_2.yf_download_series_xy) runs its own curl_cffi
+session and does not accept a requests.Session. Its requests get none of the pooling,
+per-host limits or retries above; price downloads are batched (price_store) instead.
+"""
+import hashlib
+import json
+import os
+import random
+import threading
+import time
+from typing import Callable, Dict, Optional, Tuple, Union
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+
+import metrics
+
+# ----------------------------- CONSTANTS ------------------------------------
+HTTP_CACHE_DIR = ".cache_http"
+
+DEFAULT_TIMEOUT: Tuple[float, float] = (5.0, 30.0)   # (connect, read) seconds
+MAX_RETRIES = 4
+BACKOFF_SECONDS = 0.5
+MAX_BACKOFF_SECONDS = 30.0
+RETRY_STATUSES = frozenset({429, 500, 502, 503, 504})
+
+POOL_MAXSIZE = 16   # kept-alive connections per host
+DEFAULT_HOST_CONCURRENCY = 8
+# SEC fair-access policy allows 10 requests/second; stay well below in parallel
+HOST_CONCURRENCY: Dict[str, int] = {
+    "www.sec.gov": 4,
+    "data.sec.gov": 4,
+    "en.wikipedia.org": 2,
+}
+
+Timeout = Union[float, Tuple[float, float]]
+
+
+class HttpClient:
+    """Pooled, retrying GET client (thread-safe)."""
+
+    def __init__(self, session: Optional[requests.Session] = None, timeout: Timeout = DEFAULT_TIMEOUT,
+                 max_retries: int = MAX_RETRIES, backoff: float = BACKOFF_SECONDS,
+                 host_concurrency: Optional[Dict[str, int]] = None, cache_dir: str = HTTP_CACHE_DIR,
+                 sleep: Callable[[float], None] = time.sleep):
+        if session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=len(HOST_CONCURRENCY) + 4, pool_maxsize=POOL_MAXSIZE)
+            session.mount("https://", adapter)
+            session.mount("http://", adapter)
+        self.session = session
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.host_concurrency = dict(HOST_CONCURRENCY if host_concurrency is None else host_concurrency)
+        self.cache_dir = cache_dir
+        self.sleep = sleep
+        self._slots: Dict[str, threading.BoundedSemaphore] = {}
+        self._slots_lock = threading.Lock()
+
+    def _slot(self, url: str) -> threading.BoundedSemaphore:
+        host = urlsplit(url).netloc.lower()
+        with self._slots_lock:
+            slot = self._slots.get(host)
+            if slot is None:
+                slot = self._slots[host] = threading.BoundedSemaphore(
+                    self.host_concurrency.get(host, DEFAULT_HOST_CONCURRENCY))
+        return slot
+
+    def _delay(self, attempt: int, response: Optional[requests.Response]) -> float:
+        retry_after = (getattr(response, "headers", None) or {}).get("Retry-After")
+        if retry_after is not None:
+            try:
+                return min(float(retry_after), MAX_BACKOFF_SECONDS)
+            except ValueError:
+                pass   # HTTP-date form: fall back to the exponential delay
+        return min(self.backoff * 2 ** attempt, MAX_BACKOFF_SECONDS) * (1 + random.random() / 2)
+
+    def get(self, url: str, headers: Optional[Dict[str, str]] = None, timeout: Optional[Timeout] = None,
+            conditional: bool = False, **kwargs) -> requests.Response:
+        """
+        GET with retries. Returns the last response (callers check status_code);
+        raises the last requests exception when every attempt failed to connect.
+        """
+        headers = dict(headers or {})
+        cached = self._cached(url) if conditional else None
+        if cached:
+            if cached.get("etag"):
+                headers["If-None-Match"] = cached["etag"]
+            if cached.get("last_modified"):
+                headers["If-Modified-Since"] = cached["last_modified"]
+
+        response = None
+        for attempt in range(self.max_retries + 1):
+            try:
+                with self._slot(url), metrics.span("http_get", host=urlsplit(url).netloc):
+                    response = self.session.get(url, headers=headers, timeout=timeout or self.timeout, **kwargs)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                if attempt == self.max_retries:
+                    raise
+                metrics.incr("http_retries")
+                print(f"[WARNING] GET {url} failed ({e}), retrying")
+                self.sleep(self._delay(attempt, None))
+                continue
+            if response.status_code not in RETRY_STATUSES or attempt == self.max_retries:
+                break
+            metrics.incr("http_retries")
+            self.sleep(self._delay(attempt, response))
+
+        if conditional and response is not None:
+            if response.status_code == 304 and cached:
+                metrics.incr("http_not_modified")
+                return self._from_cache(url, cached)
+            if response.status_code == 200:
+                self._store(url, response)
+        return response
+
+    # ----- conditional GET cache -----
+    def _cache_paths(self, url: str) -> Tuple[str, str]:
+        key = hashlib.sha1(url.encode("utf-8")).hexdigest()
+        return os.path.join(self.cache_dir, f"{key}.json"), os.path.join(self.cache_dir, f"{key}.body")
+
+    def _cached(self, url: str) -> Optional[dict]:
+        meta_path, body_path = self._cache_paths(url)
+        if not (os.path.exists(meta_path) and os.path.exists(body_path)):
+            return None
+        try:
+            with open(meta_path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except Exception:
+            return None
+
+    def _store(self, url: str, response: requests.Response) -> None:
+        resp_headers = getattr(response, "headers", None) or {}
+        etag, last_modified = resp_headers.get("ETag"), resp_headers.get("Last-Modified")
+        if not etag and not last_modified:
+            return
+        meta_path, body_path = self._cache_paths(url)
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            with open(f"{body_path}.tmp", "wb") as f:
+                f.write(response.content)
+            os.replace(f"{body_path}.tmp", body_path)
+            meta = {"url": url, "etag": etag, "last_modified": last_modified,
+                    "content_type": resp_headers.get("Content-Type"), "encoding": response.encoding}
+            with open(f"{meta_path}.tmp", "w", encoding="utf-8") as f:
+                json.dump(meta, f)
+            os.replace(f"{meta_path}.tmp", meta_path)
+        except Exception as e:
+            print(f"[ERROR] Failed to cache {url}: {e}")
+
+    def _from_cache(self, url: str, cached: dict) -> requests.Response:
+        _, body_path = self._cache_paths(url)
+        response = requests.Response()
+        with open(body_path, "rb") as f:
+            response._content = f.read()
+        response.status_code = 200
+        response.url = url
+        response.encoding = cached.get("encoding")
+        if cached.get("content_type"):
+            response.headers["Content-Type"] = cached["content_type"]
+        return response
+
+
+_default: Optional[HttpClient] = None
+_default_lock = threading.Lock()
+
+
+def default_client() -> HttpClient:
+    """Process-wide client (one connection pool shared by all fetchers)."""
+    global _default
+    with _default_lock:
+        if _default is None:
+            _default = HttpClient()
+        return _default
+
+
+def get(url: str, headers: Optional[Dict[str, str]] = None, timeout: Optional[Timeout] = None,
+        conditional: bool = False, **kwargs) -> requests.Response:
+    return default_client().get(url, headers=headers, timeout=timeout, conditional=conditional, **kwargs)
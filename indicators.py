@@ -1,9 +1,15 @@
 import json
 import os
-from typing import Dict, Optional, Union, Any
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple, Union
 
-import pandas as pd  # (kept for consistency if used elsewhere)
+import numpy as np
+import pandas as pd
 
+import fact_store
+import metrics
+from concepts import ConceptTable, compile_concepts
 from helper import (
     find_variables_and_sheets_by_concepts,
     get_variables_from_json_dict,
@@ -13,110 +19,45 @@ from helper import (
 )
 
 # ---- Tags & Config -------------------------------------------------------
-GAAP_PREFIXES = ("us-gaap_",)  # extend (e.g., "dei_", "ifrs_", vendor tags) if needed
-
-_REQUIRED_FOR_COMPUTED = {
-    # --- ROE ---
-    "us-gaap_NetIncomeLoss",
-    "us-gaap_StockholdersEquity",
-
-    # --- P/E (reported EPS first) ---
-    "us-gaap_EarningsPerShareDiluted",
-    "us-gaap_EarningsPerShareBasic",
-    "us-gaap_IncomeLossFromContinuingOperationsPerDilutedShare",
-    "us-gaap_IncomeLossFromContinuingOperationsPerBasicShare",
-
-    # P/E fallback EPS = NI / Weighted Avg Shares
-    "us-gaap_WeightedAverageNumberOfDilutedSharesOutstanding",
-    "us-gaap_WeightedAverageNumberOfSharesOutstandingDiluted",   # alt
-    "us-gaap_WeightedAverageNumberOfSharesOutstandingBasic",
-    "us-gaap_WeightedAverageNumberOfSharesOutstanding",          # alt
-
-    # --- P/FCF & P/CF need CFO, CapEx (for P/FCF), and shares ---
-    "us-gaap_NetCashProvidedByUsedInOperatingActivitiesContinuingOperations",
-    "us-gaap_NetCashProvidedByUsedInOperatingActivities",  # alt
-    "us-gaap_PaymentsToAcquirePropertyPlantAndEquipment",
-
-    # --- D/E needs debt (total or components) and equity ---
-    "us-gaap_Debt",
-    "us-gaap_DebtAndCapitalLeaseObligations",
-    "us-gaap_DebtCurrent",
-    "us-gaap_DebtNoncurrent",
-    "us-gaap_ShortTermBorrowings",
-    "us-gaap_CommercialPaper",
-    "us-gaap_LongTermDebtCurrent",
-    "us-gaap_LongTermDebtNoncurrent",
-
-    # --- Pretax Profit Margin needs pretax income and revenue ---
-    "us-gaap_IncomeLossFromContinuingOperationsBeforeIncomeTaxesExtraordinaryItemsNoncontrollingInterest",
-    "us-gaap_IncomeBeforeEquityMethodInvestmentsIncomeTaxesExtraordinaryItemsNoncontrollingInterest",  # alt
-    "us-gaap_SalesRevenueNet",
-    "us-gaap_Revenues",  # alt
-    "us-gaap_RevenueFromContractWithCustomerExcludingAssessedTax"
+GAAP_PREFIXES = ("us-gaap_",)  # extend (e.g., "ifrs-full_" for IFRS filers, "dei_", vendor tags) if needed
+
+# GAAP/base variables only (human label -> us-gaap code); used by ingestion and the UI
+MAPPING_VARIABLE: Dict[str, str] = {
+    "Total assets": "us-gaap_Assets",
+    "Total liabilities": "us-gaap_Liabilities",
+    "Cash": "us-gaap_CashAndCashEquivalentsAtCarryingValue",
+    "Net income": "us-gaap_NetIncomeLoss",
+    "Total shareholders’ equity": "us-gaap_StockholdersEquity",
+    "Shares diluted": "us-gaap_EarningsPerShareDiluted",
+    "Shares basic": "us-gaap_EarningsPerShareBasic",
 }
 
-_NET_INCOME_KEYS = [
-    "us-gaap_NetIncomeLoss",
-]
+# Canonical metrics -> priority-ordered tags and labels (concepts.py), compiled once.
+# The fallback chains below are views of that table (IFRS tags join them via GAAP_PREFIXES).
+CONCEPTS: ConceptTable = compile_concepts(GAAP_PREFIXES)
 
-_EQUITY_KEYS = [
-    "us-gaap_StockholdersEquity",
-]
+_NET_INCOME_KEYS = CONCEPTS.tags("net income")
+_EQUITY_KEYS = CONCEPTS.tags("shareholders equity")
 
 # Preferred EPS tags, then continuing-ops variants as fallback
-_EPS_KEYS = [
-    "us-gaap_EarningsPerShareDiluted",
-    "us-gaap_EarningsPerShareBasic",
-    "us-gaap_IncomeLossFromContinuingOperationsPerDilutedShare",
-    "us-gaap_IncomeLossFromContinuingOperationsPerBasicShare",
-]
+_EPS_KEYS = CONCEPTS.tags("eps")
 
 # Weighted-average share count (diluted & basic) — multiple common variants
-_SHARES_DILUTED_KEYS = [
-    "us-gaap_WeightedAverageNumberOfDilutedSharesOutstanding",
-    "us-gaap_WeightedAverageNumberOfSharesOutstandingDiluted",
-    "us-gaap_WeightedAverageNumberOfDilutedSharesOutstanding",
-]
-_SHARES_BASIC_KEYS = [
-    "us-gaap_WeightedAverageNumberOfSharesOutstandingBasic",
-    "us-gaap_WeightedAverageNumberOfSharesOutstanding",
-]
+_SHARES_DILUTED_KEYS = CONCEPTS.tags("shares diluted")
+_SHARES_BASIC_KEYS = CONCEPTS.tags("shares basic")
 
 # CFO and CapEx for FCF
-_CFO_KEYS = [
-    "us-gaap_NetCashProvidedByUsedInOperatingActivitiesContinuingOperations",
-    "us-gaap_NetCashProvidedByUsedInOperatingActivities",
-]
-_CAPEX_KEYS = [
-    "us-gaap_PaymentsToAcquirePropertyPlantAndEquipment",
-]
+_CFO_KEYS = CONCEPTS.tags("cfo")
+_CAPEX_KEYS = CONCEPTS.tags("capex")
 
 # Debt tags
-_DEBT_TOTAL_KEYS = [
-    "us-gaap_Debt",
-    "us-gaap_DebtAndCapitalLeaseObligations",
-]
-_DEBT_CURRENT_KEYS = [
-    "us-gaap_DebtCurrent",
-    "us-gaap_ShortTermBorrowings",
-    "us-gaap_CommercialPaper",
-    "us-gaap_LongTermDebtCurrent",
-]
-_DEBT_NONCURRENT_KEYS = [
-    "us-gaap_DebtNoncurrent",
-    "us-gaap_LongTermDebtNoncurrent",
-]
+_DEBT_TOTAL_KEYS = CONCEPTS.tags("debt total")
+_DEBT_CURRENT_KEYS = CONCEPTS.tags("debt current")
+_DEBT_NONCURRENT_KEYS = CONCEPTS.tags("debt noncurrent")
 
 # Pretax Profit Margin tags
-_PRETAX_KEYS = [
-    "us-gaap_IncomeLossFromContinuingOperationsBeforeIncomeTaxesExtraordinaryItemsNoncontrollingInterest",
-    "us-gaap_IncomeBeforeEquityMethodInvestmentsIncomeTaxesExtraordinaryItemsNoncontrollingInterest",  # alt
-]
-_REVENUE_KEYS = [
-    "us-gaap_SalesRevenueNet",
-    "us-gaap_Revenues",  # alt
-    "us-gaap_RevenueFromContractWithCustomerExcludingAssessedTax",
-]
+_PRETAX_KEYS = CONCEPTS.tags("pretax income")
+_REVENUE_KEYS = CONCEPTS.tags("revenue")
 
 
 # ---- Helpers --------------------------------------------------------------
@@ -138,203 +79,343 @@ def _read_yf_value_from_any(file_or_json: Union[str, Dict, None]) -> Optional[fl
     return None
 
 
-# ---- Variables ------------------------------------------------------------
-def calculate_EPS(variables: Dict[str, Any], stock_price=None) -> Optional[float]:
+def _statement_values(file_or_json: Union[str, Dict], concepts: Iterable[str]) -> Dict[str, Optional[float]]:
+    """Values of `concepts` from the statement tables of a filing (one pass per sheet)."""
+    names = find_variables_and_sheets_by_concepts(file_or_json, list(concepts))
+    return get_variables_from_json_dict(file_or_json, names)
+
+
+# ---- Ratio registry -------------------------------------------------------
+# Input name of the filing's Yahoo close (json["yf_value"]); the other inputs are 'base' codes
+PRICE_INPUT = "yf_value"
+
+
+class RatioSpec:
+    """A registered ratio or intermediate: function(ctx), concept fallback chains, other dependencies."""
+    __slots__ = ("name", "function", "chains", "intermediates", "price")
+
+    def __init__(self, name: str, function: Callable, chains: Tuple[List[str], ...],
+                 intermediates: Tuple[str, ...], price: bool):
+        self.name = name
+        self.function = function
+        self.chains = chains
+        self.intermediates = intermediates
+        self.price = price
+
+
+# Intermediate values shared by ratios (EPS, total debt, ...), memoized per filing
+INTERMEDIATES: Dict[str, RatioSpec] = {}
+# Ratios written into json["computed"], in registration order
+RATIOS: Dict[str, RatioSpec] = {}
+
+
+def _register(registry: Dict[str, RatioSpec], name: str, chains, intermediates, price: bool):
+    def decorator(function):
+        registry[name] = RatioSpec(name, function, tuple(chains), tuple(intermediates), price)
+        return function
+    return decorator
+
+
+def register_intermediate(name: str, *chains: List[str], intermediates: Iterable[str] = (),
+                          price: bool = False):
+    """
+    Decorator registering `function(ctx)` as intermediate `name`. `chains` are the concept
+    fallback chains it reads (first non-empty code of each chain wins, see FilingContext.first).
+    """
+    return _register(INTERMEDIATES, name, chains, intermediates, price)
+
+
+def register_ratio(name: str, *chains: List[str], intermediates: Iterable[str] = (), price: bool = False):
+    """Decorator registering `function(ctx)` as ratio `name` (same arguments as register_intermediate)."""
+    return _register(RATIOS, name, chains, intermediates, price)
+
+
+def _spec(name: str) -> RatioSpec:
+    spec = RATIOS.get(name) or INTERMEDIATES.get(name)
+    if spec is None:
+        raise KeyError(f"Unknown ratio '{name}'")
+    return spec
+
+
+def required_concepts(names: Iterable[str]) -> set:
+    """Minimal concept set of the ratios / intermediates `names` (dependencies included)."""
+    concepts, seen, todo = set(), set(), list(names)
+    while todo:
+        name = todo.pop()
+        if name in seen:
+            continue
+        seen.add(name)
+        spec = _spec(name)
+        for chain in spec.chains:
+            concepts.update(chain)
+        todo.extend(spec.intermediates)
+    return concepts
+
+
+def _needs_price(name: str) -> bool:
+    spec = _spec(name)
+    return spec.price or any(_needs_price(i) for i in spec.intermediates)
+
+
+def ratio_inputs(name: str) -> frozenset:
+    """Inputs of a ratio: its concepts plus PRICE_INPUT when it reads the price."""
+    return frozenset(required_concepts([name]) | ({PRICE_INPUT} if _needs_price(name) else set()))
+
+
+def ratios_depending_on(inputs: Iterable[str]) -> List[str]:
+    """Ratios (in RATIOS order) reading any of `inputs`, e.g. [PRICE_INPUT] -> P/E, P/FCF, P/CF."""
+    changed = set(inputs)
+    return [name for name in RATIOS if ratio_inputs(name) & changed]
+
+
+class FilingContext:
+    """
+    One filing for ratio evaluation: 'base' values (concepts missing from `base` are
+    resolved on demand through `resolve`, only those asked for), the price, and
+    memoized intermediates and ratios.
+    """
+
+    def __init__(self, base: Optional[Dict[str, Any]] = None, price: Optional[float] = None,
+                 resolve: Optional[Callable[[List[str]], Dict[str, Any]]] = None):
+        self.base: Dict[str, Any] = dict(base or {})
+        self.price = _to_float(price)
+        self._resolve = resolve
+        self._memo: Dict[str, Optional[float]] = {}
+
+    @classmethod
+    def from_filing(cls, file_or_json: Union[str, Dict], stock_price: Optional[float] = None) -> "FilingContext":
+        """
+        Context of a filing JSON (path or dict): its 'base', then the statement tables, or
+        the ticker's fact table for filings stored without them (compacted), for the rest.
+        """
+        data = file_or_json
+        if isinstance(file_or_json, str):
+            with open(file_or_json, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        price = stock_price if stock_price is not None else data.get(PRICE_INPUT)
+        has_statements = any(data.get(sheet) for sheet in ("balance_sheet", "income", "cashflow"))
+        if has_statements:
+            resolve = lambda concepts: _statement_values(data, concepts)
+        elif data.get("ticker") and data.get("date"):
+            resolve = lambda concepts: fact_store.filing_values(data["ticker"], concepts, data["date"], data.get("form"))
+        else:
+            resolve = None
+        return cls(data.get("base"), price, resolve)
+
+    def require(self, concepts: Iterable[str]) -> None:
+        """Resolve the concepts not known yet in one statement lookup (unresolved -> None)."""
+        missing = [c for c in concepts if c not in self.base]
+        if not missing:
+            return
+        resolved = self._resolve(missing) if self._resolve else {}
+        for concept in missing:
+            self.base[concept] = resolved.get(concept)
+        metrics.incr("ratio_concepts_resolved", len(missing))
+
+    def first(self, chain: List[str]) -> Optional[float]:
+        """First numeric value along a fallback chain of concepts."""
+        self.require(chain)
+        return first_numeric(self.base, chain)
+
+    def value(self, name: str) -> Optional[float]:
+        """Ratio or intermediate `name`, computed once per context."""
+        if name not in self._memo:
+            spec = _spec(name)
+            try:
+                self._memo[name] = spec.function(self)
+            except Exception as e:
+                print(f"[ERROR] Ratio {name} failed: {e}")
+                self._memo[name] = None
+        return self._memo[name]
+
+    def evaluate(self, names: Optional[Iterable[str]] = None) -> Dict[str, Optional[float]]:
+        """Ratios `names` (default: all registered), resolving their minimal concept set first."""
+        names = list(RATIOS if names is None else names)
+        self.require(sorted(required_concepts(names)))
+        return {name: self.value(name) for name in names}
+
+
+def evaluate_ratios(base: Dict[str, Any], price: Optional[float],
+                    names: Optional[Iterable[str]] = None) -> Dict[str, Optional[float]]:
+    """Values of the ratios `names` (default: all) from 'base' values and the price."""
+    return FilingContext(base, price).evaluate(names)
+
+
+def evaluate_filing(file_or_json: Union[str, Dict], names: Iterable[str],
+                    stock_price: Optional[float] = None) -> Dict[str, Optional[float]]:
+    """Lazy evaluation of a few ratios of one filing (nothing persisted), e.g. for ad-hoc screens."""
+    return FilingContext.from_filing(file_or_json, stock_price).evaluate(names)
+
+
+# ---- Intermediates --------------------------------------------------------
+@register_intermediate("EPS", _EPS_KEYS, _NET_INCOME_KEYS, _SHARES_DILUTED_KEYS, _SHARES_BASIC_KEYS)
+def _eps(ctx: FilingContext) -> Optional[float]:
     """
     EPS preference:
       1) Reported EPS (diluted → basic → continuing-ops variants)
       2) Fallback: NetIncomeLoss / WeightedAverageShares (diluted → basic)
     """
-    # 1) Reported EPS if present
-    eps = first_numeric(variables, _EPS_KEYS)
+    eps = ctx.first(_EPS_KEYS)
     if eps is not None:
         return eps
-
-    # 2) Fallback: NI / shares (prefer diluted)
-    net_income = first_numeric(variables, _NET_INCOME_KEYS)
-
-    # Try diluted shares
-    shares = first_numeric(variables, _SHARES_DILUTED_KEYS)
-    eps = safe_div(net_income, shares)
+    net_income = ctx.first(_NET_INCOME_KEYS)
+    eps = safe_div(net_income, ctx.first(_SHARES_DILUTED_KEYS))
     if eps is not None:
         return eps
+    return safe_div(net_income, ctx.first(_SHARES_BASIC_KEYS))
 
-    # Try basic shares
-    shares = first_numeric(variables, _SHARES_BASIC_KEYS)
-    eps = safe_div(net_income, shares)
-    return eps
 
+@register_intermediate("Shares", _SHARES_DILUTED_KEYS, _SHARES_BASIC_KEYS)
+def _shares(ctx: FilingContext) -> Optional[float]:
+    """Weighted average shares (prefer diluted; fallback basic)."""
+    shares = ctx.first(_SHARES_DILUTED_KEYS)
+    return shares if shares is not None else ctx.first(_SHARES_BASIC_KEYS)
 
-# ---- Indicators -----------------------------------------------------------
-def calculate_ROE(variables: Dict[str, Any]) -> Optional[float]:
-    """
-    ROE = Net Income / Shareholders' Equity  (end-of-period only)
-    """
-    net_income = first_numeric(variables, _NET_INCOME_KEYS)
-    equity_end = first_numeric(variables, _EQUITY_KEYS)
-    return to_percent(safe_div(net_income, equity_end))
 
+@register_intermediate("FCF", _CFO_KEYS, _CAPEX_KEYS)
+def _fcf(ctx: FilingContext) -> Optional[float]:
+    """FCF = CFO - CapEx"""
+    cfo = ctx.first(_CFO_KEYS)
+    capex = ctx.first(_CAPEX_KEYS)
+    if cfo is None or capex is None:
+        return None
+    return cfo - capex
 
-def calculate_PE(
-    variables: Dict[str, Any],
-    file_or_json: Union[str, Dict, None] = None,
-    stock_price: Optional[float] = None,
-) -> Optional[float]:
+
+@register_intermediate("Total debt", _DEBT_TOTAL_KEYS, _DEBT_CURRENT_KEYS, _DEBT_NONCURRENT_KEYS)
+def _total_debt(ctx: FilingContext) -> Optional[float]:
     """
-    P/E = Price per Share / EPS (trailing or period EPS)
+    Priority:
+      1) Use reported total debt if available (us-gaap_Debt or us-gaap_DebtAndCapitalLeaseObligations)
+      2) Else, sum components (current & noncurrent, including common short-term items).
+         Missing components are treated as 0 only if at least one component is present.
     """
-    # 1) Price
-    price = _to_float(stock_price) if stock_price is not None else None
-    if price is None:
-        price = _read_yf_value_from_any(file_or_json)
-    if price is None:
+    total_debt = ctx.first(_DEBT_TOTAL_KEYS)
+    if total_debt is not None:
+        return total_debt
+    component_keys = _DEBT_CURRENT_KEYS + _DEBT_NONCURRENT_KEYS
+    ctx.require(component_keys)
+    components = [_to_float(ctx.base.get(k)) for k in component_keys]
+    components = [float(v) for v in components if v is not None]
+    return sum(components) if components else None
+
+
+# ---- Ratios ---------------------------------------------------------------
+@register_ratio("ROE", _NET_INCOME_KEYS, _EQUITY_KEYS)
+def _roe(ctx: FilingContext) -> Optional[float]:
+    """ROE = Net Income / Shareholders' Equity  (end-of-period only)"""
+    return to_percent(safe_div(ctx.first(_NET_INCOME_KEYS), ctx.first(_EQUITY_KEYS)))
+
+
+@register_ratio("P/E", intermediates=("EPS",), price=True)
+def _pe(ctx: FilingContext) -> Optional[float]:
+    """P/E = Price per Share / EPS (trailing or period EPS)"""
+    if ctx.price is None:
         return None
+    return safe_div(ctx.price, ctx.value("EPS"))
 
-    # 2) EPS (use reported if present; otherwise NI / WAvg shares)
-    eps = first_numeric(variables, _EPS_KEYS)
-    if eps is None:
-        eps = calculate_EPS(variables)
 
-    return safe_div(price, eps)
+@register_ratio("P/FCF", intermediates=("FCF", "Shares"), price=True)
+def _pfcf(ctx: FilingContext) -> Optional[float]:
+    """P/FCF = Price per Share / (Free Cash Flow per Share)"""
+    if ctx.price is None:
+        return None
+    fcf = ctx.value("FCF")
+    fcf_ps = safe_div(fcf, ctx.value("Shares")) if fcf is not None else None
+    return safe_div(ctx.price, fcf_ps)
 
 
-def calculate_PFCF(
-    variables: Dict[str, Any],
-    file_or_json: Union[str, Dict, None] = None,
-    stock_price: Optional[float] = None,
-) -> Optional[float]:
-    """
-    P/FCF = Price per Share / (Free Cash Flow per Share)
-    FCF = CFO - CapEx
-    """
-    # 1) Price
-    price = _to_float(stock_price) if stock_price is not None else None
-    if price is None:
-        price = _read_yf_value_from_any(file_or_json)
-    if price is None:
+@register_ratio("P/CF", _CFO_KEYS, intermediates=("Shares",), price=True)
+def _pcf(ctx: FilingContext) -> Optional[float]:
+    """P/CF = Price per Share / (Operating Cash Flow per Share)"""
+    if ctx.price is None:
         return None
+    cfo = ctx.first(_CFO_KEYS)
+    cfo_ps = safe_div(cfo, ctx.value("Shares")) if cfo is not None else None
+    return safe_div(ctx.price, cfo_ps)
 
-    # 2) FCF = CFO - CapEx
-    cfo = first_numeric(variables, _CFO_KEYS)
-    capex = first_numeric(variables, _CAPEX_KEYS)
-    if cfo is None or capex is None:
-        return None
-    fcf = cfo - capex
-
-    # 3) Per share (prefer diluted shares; fallback basic)
-    shares = first_numeric(variables, _SHARES_DILUTED_KEYS)
-    if shares is None:
-        shares = first_numeric(variables, _SHARES_BASIC_KEYS)
-    fcf_ps = safe_div(fcf, shares)
-    if fcf_ps is None:
-        return None
 
-    # 4) Ratio
-    return safe_div(price, fcf_ps)
+@register_ratio("D/E", _EQUITY_KEYS, intermediates=("Total debt",))
+def _debt_equity(ctx: FilingContext) -> Optional[float]:
+    """D/E = Total Debt / Shareholders' Equity"""
+    return safe_div(ctx.value("Total debt"), ctx.first(_EQUITY_KEYS))
 
 
-def calculate_PCF(
-    variables: Dict[str, Any],
-    file_or_json: Union[str, Dict, None] = None,
-    stock_price: Optional[float] = None,
-) -> Optional[float]:
-    """
-    P/CF = Price per Share / (Operating Cash Flow per Share)
-    """
-    # 1) Price
+@register_ratio("Pretax Profit Margin", _PRETAX_KEYS, _REVENUE_KEYS)
+def _pretax_margin(ctx: FilingContext) -> Optional[float]:
+    """Pretax Profit Margin = Income Before Tax / Revenue * 100"""
+    return to_percent(safe_div(ctx.first(_PRETAX_KEYS), ctx.first(_REVENUE_KEYS)))
+
+
+# Every concept the registered ratios can read (the 'base' section of a full compute_ratios)
+_REQUIRED_FOR_COMPUTED = required_concepts(RATIOS)
+
+
+# ---- Single-ratio wrappers ------------------------------------------------
+# `variables` is a 'base'-like dict {us-gaap code: value}; kept for callers of the old API
+def _price_of(file_or_json, stock_price) -> Optional[float]:
     price = _to_float(stock_price) if stock_price is not None else None
-    if price is None:
-        price = _read_yf_value_from_any(file_or_json)
-    if price is None:
-        return None
+    return price if price is not None else _read_yf_value_from_any(file_or_json)
 
-    # 2) CFO
-    cfo = first_numeric(variables, _CFO_KEYS)
-    if cfo is None:
-        return None
 
-    # 3) Per share (prefer diluted shares; fallback basic)
-    shares = first_numeric(variables, _SHARES_DILUTED_KEYS)
-    if shares is None:
-        shares = first_numeric(variables, _SHARES_BASIC_KEYS)
-    cfo_ps = safe_div(cfo, shares)
-    if cfo_ps is None:
-        return None
+def calculate_EPS(variables: Dict[str, Any], stock_price=None) -> Optional[float]:
+    return FilingContext(variables).value("EPS")
 
-    # 4) Ratio
-    return safe_div(price, cfo_ps)
 
+def calculate_ROE(variables: Dict[str, Any]) -> Optional[float]:
+    return FilingContext(variables).value("ROE")
 
-def calculate_debt_eq_ratio(variables: Dict[str, Any]) -> Optional[float]:
-    """
-    D/E = Total Debt / Shareholders' Equity
 
-    Priority:
-      1) Use reported total debt if available (us-gaap_Debt or us-gaap_DebtAndCapitalLeaseObligations)
-      2) Else, sum components (current & noncurrent, including common short-term items).
-         Missing components are treated as 0 only if at least one component is present.
-    """
-    # Denominator
-    equity = first_numeric(variables, _EQUITY_KEYS)
+def calculate_PE(variables: Dict[str, Any], file_or_json: Union[str, Dict, None] = None,
+                 stock_price: Optional[float] = None) -> Optional[float]:
+    return FilingContext(variables, _price_of(file_or_json, stock_price)).value("P/E")
+
 
-    # Try total debt first
-    total_debt = first_numeric(variables, _DEBT_TOTAL_KEYS)
+def calculate_PFCF(variables: Dict[str, Any], file_or_json: Union[str, Dict, None] = None,
+                   stock_price: Optional[float] = None) -> Optional[float]:
+    return FilingContext(variables, _price_of(file_or_json, stock_price)).value("P/FCF")
 
-    if total_debt is None:
-        # Sum components that are present
-        comp_keys = _DEBT_CURRENT_KEYS + _DEBT_NONCURRENT_KEYS
-        found_any = False
-        total = 0.0
-        for k in comp_keys:
-            if k in variables:
-                val = _to_float(variables.get(k))
-                if val is not None:
-                    total += float(val)
-                    found_any = True
-        total_debt = total if found_any else None
 
-    return safe_div(total_debt, equity)
+def calculate_PCF(variables: Dict[str, Any], file_or_json: Union[str, Dict, None] = None,
+                  stock_price: Optional[float] = None) -> Optional[float]:
+    return FilingContext(variables, _price_of(file_or_json, stock_price)).value("P/CF")
+
+
+def calculate_debt_eq_ratio(variables: Dict[str, Any]) -> Optional[float]:
+    return FilingContext(variables).value("D/E")
 
 
 def calculate_pretax_margin(variables: Dict[str, Any]) -> Optional[float]:
-    """
-    Pretax Profit Margin = Income Before Tax / Revenue * 100
-    """
-    pretax_income = first_numeric(variables, _PRETAX_KEYS)
-    revenue = first_numeric(variables, _REVENUE_KEYS)
-    return to_percent(safe_div(pretax_income, revenue))
+    return FilingContext(variables).value("Pretax Profit Margin")
 
 
 # ---- Main computation -----------------------------------------------------
+@metrics.timed("ratio_compute")
 def compute_ratios(
     file: Union[str, Dict],
     variable_mapping: Dict[str, str],
     stock_price: Optional[float] = None,
+    ratios: Optional[Iterable[str]] = None,
 ) -> Dict[str, Dict[str, Union[float, str, None]]]:
+    """
+    'base' (GAAP codes of `variable_mapping` + the concepts the ratios read) and
+    'computed' (ratios) of a filing, resolved from its statement tables. `ratios`
+    restricts both to the given ratios (default: all registered); then the stored
+    sections are updated instead of replaced.
+    """
     # 1) Only GAAP-like codes go to 'base'
     user_codes = set(variable_mapping.values())
     gaap_codes = {c for c in user_codes if isinstance(c, str) and c.startswith(GAAP_PREFIXES)}
 
-    # Add internal deps for computed metrics (still GAAP tags)
-    code_variables = list(gaap_codes | _REQUIRED_FOR_COMPUTED)
-
-    name_variables = find_variables_and_sheets_by_concepts(file, code_variables)
-    variables = get_variables_from_json_dict(file, name_variables)
+    # Add internal deps of the requested ratios (still GAAP tags)
+    names = list(RATIOS if ratios is None else ratios)
+    code_variables = sorted(gaap_codes | required_concepts(names))
 
     # 2) Base contains ONLY GAAP-like keys we requested above
-    base: Dict[str, Optional[Union[float, str]]] = {code: val for code, val in variables.items()}
-
-    # 3) Computed contains ratios
-    computed: Dict[str, Optional[float]] = {}
-    try:
-        computed["ROE"] = calculate_ROE(base)
-        computed["P/E"] = calculate_PE(base, file_or_json=file, stock_price=stock_price)
-        computed["P/FCF"] = calculate_PFCF(base, file_or_json=file, stock_price=stock_price)
-        computed["P/CF"] = calculate_PCF(base, file_or_json=file, stock_price=stock_price)
-        computed["D/E"] = calculate_debt_eq_ratio(base)
-        computed["Pretax Profit Margin"] = calculate_pretax_margin(base)
-    except Exception as e:
-        print(f"[ERROR] compute_ratios failed: {e}")
+    base: Dict[str, Optional[Union[float, str]]] = dict(_statement_values(file, code_variables))
+
+    # 3) Computed contains ratios (price: argument, else the file's yf_value)
+    computed = FilingContext(base, _price_of(file, stock_price)).evaluate(names)
 
     result = {"base": base, "computed": computed}
 
@@ -343,11 +424,127 @@ def compute_ratios(
         try:
             with open(file, "r", encoding="utf-8") as f:
                 data = json.load(f)
-            data["base"] = base
-            data["computed"] = computed
+            if ratios is None:
+                data["base"] = base
+                data["computed"] = computed
+            else:
+                data["base"] = {**(data.get("base") or {}), **base}
+                data["computed"] = {**(data.get("computed") or {}), **computed}
             with open(file, "w", encoding="utf-8") as f:
                 json.dump(data, f, indent=4)
         except Exception as e:
             print(f"[ERROR] Failed to persist base/computed into {file}: {e}")
 
     return result
+
+
+# ---- Multi-factor scoring -------------------------------------------------
+# Factor = (variable, weight, higher_is_better). Parsed from e.g. "-P/E:1, ROE:2, -D/E"
+# ("-" prefix = lower is better, weight defaults to 1).
+Factor = Tuple[str, float, bool]
+
+# Ratios where values <= 0 are not meaningful "cheap" values (losses), excluded from the rank
+POSITIVE_ONLY_FACTORS = {"P/E", "P/FCF", "P/CF", "P/E (TTM)"}
+
+SCORE_CACHE_SIZE = 32
+_score_cache: "OrderedDict[tuple, pd.DataFrame]" = OrderedDict()
+_score_cache_lock = threading.Lock()
+
+
+def parse_factor_spec(text: str) -> List[Factor]:
+    """"-P/E:1, ROE:2, -D/E" -> [("P/E", 1.0, False), ("ROE", 2.0, True), ("D/E", 1.0, False)]"""
+    factors: List[Factor] = []
+    for part in (text or "").split(","):
+        part = part.strip()
+        if not part:
+            continue
+        higher_is_better = not part.startswith("-")
+        part = part.lstrip("+-").strip()
+        name, _, weight = part.rpartition(":") if ":" in part else (part, "", "1")
+        try:
+            weight_value = float(weight)
+        except ValueError:
+            raise ValueError(f"Invalid weight in factor '{part}'")
+        factors.append((name.strip(), weight_value, higher_is_better))
+    return factors
+
+
+def latest_snapshot(df: pd.DataFrame, as_of: Optional[str] = None) -> pd.DataFrame:
+    """Last filing per company (CIK) with Date <= `as_of` (default: latest available)."""
+    frame = df
+    if as_of:
+        frame = frame[pd.to_datetime(frame["Date"], errors="coerce") <= pd.to_datetime(as_of)]
+    return frame.sort_values("Date", kind="stable").drop_duplicates("CIK", keep="last").reset_index(drop=True)
+
+
+def data_version(df: pd.DataFrame) -> int:
+    """Content hash of a frame; part of the score cache key."""
+    return int(pd.util.hash_pandas_object(df, index=False).sum())
+
+
+def score_universe(
+    snapshot: pd.DataFrame,
+    factors: List[Factor],
+    top_n: Optional[int] = None,
+    version: Optional[int] = None,
+) -> pd.DataFrame:
+    """
+    Composite score of every company in `snapshot` (one row per company).
+
+    Each factor is ranked across the universe (percentile 0..1, best = 1), and the score
+    is the weighted mean of the factor ranks (a missing value ranks 0).
+    Returns the top `top_n` rows (all when None) sorted by Score, with a rank column per
+    factor. Results are cached by (factors, top_n, data version); pass the `version` of
+    the data the snapshot was taken from when known, else the snapshot is hashed.
+    Callers get a copy, so modifying it leaves the cache intact.
+    """
+    if not factors:
+        raise ValueError("No factors given.")
+    version = data_version(snapshot) if version is None else version
+    key = (tuple(factors), top_n, version)
+    with _score_cache_lock:
+        if key in _score_cache:
+            _score_cache.move_to_end(key)
+            return _score_cache[key].copy()
+
+    with metrics.span("score_universe"):
+        n = len(snapshot)
+        weighted = np.zeros(n)
+        covered = np.zeros(n, dtype=bool)
+        total_weight = sum(weight for _, weight, _ in factors) or 1.0
+        ranks = {}
+        for variable, weight, higher_is_better in factors:
+            if variable not in snapshot.columns:
+                raise ValueError(f"Unknown factor variable '{variable}'")
+            values = pd.to_numeric(snapshot[variable], errors="coerce")
+            if variable in POSITIVE_ONLY_FACTORS:
+                values = values.where(values > 0)
+            rank = values.rank(pct=True, ascending=higher_is_better).to_numpy()
+            ranks[f"rank({variable})"] = rank
+            available = ~np.isnan(rank)
+            weighted[available] += weight * rank[available]
+            covered |= available
+
+        # Missing factor values count as the worst rank (0); companies without any value are dropped
+        score = np.where(covered, weighted / total_weight, np.nan)
+
+        valid = np.flatnonzero(~np.isnan(score))
+        if top_n is not None and 0 < top_n < len(valid):
+            # O(n) selection of the best top_n, then sort just those
+            part = np.argpartition(-score[valid], top_n - 1)[:top_n]
+            picked = valid[part]
+        else:
+            picked = valid
+        picked = picked[np.argsort(-score[picked], kind="stable")]
+
+        result = snapshot.iloc[picked].copy()
+        for column, rank in ranks.items():
+            result[column] = rank[picked]
+        result["Score"] = score[picked]
+        result.reset_index(drop=True, inplace=True)
+
+    with _score_cache_lock:
+        _score_cache[key] = result
+        while len(_score_cache) > SCORE_CACHE_SIZE:
+            _score_cache.popitem(last=False)
+    return result.copy()
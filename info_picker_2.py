@@ -1,5 +1,4 @@
 from io import StringIO, BytesIO
-import uuid
 import zipfile
 import json
 import os
@@ -11,15 +10,26 @@ import numpy as np
 from bs4 import BeautifulSoup
 from datetime import datetime, timedelta
 import pandas as pd
-import requests
-import yfinance as yf
 from typing import Dict, Optional, Tuple, List, Union
 from edgar import *
-from indicators import compute_ratios
+import derived_metrics
+import fact_store
+from company_metadata import UNKNOWN_SECTOR, load_company_metadata
+import data_sources
+import http_client
+import metrics
+import price_store
+from helper import _to_float, first_numeric
+from indicators import CONCEPTS, GAAP_PREFIXES, compute_ratios
+from ingest_pipeline import IngestPipeline, parse_statements
+from ratio_scheduler import RecomputeScheduler
+from xbrl_cache import load_raw_xbrl
 
 # ----------------------------- CONSTANTS ------------------------------------
 
 FILE_PATH = "company_tickers.json"
+SEC_TICKERS_URL = data_sources.SEC_TICKERS_URL
+SEC_HEADERS = {"User-Agent": "EdgarAnalytic/0.1 (contact@example.com)"}
 
 HEADERS = {
     # Use a realistic desktop UA – many sites (incl. Wikipedia) block default Python UAs.
@@ -33,13 +43,7 @@ HEADERS = {
     "Connection": "keep-alive",
 }
 
-# Aliases to locate variables in XBRL tables (kept for fallback-only)
-VARIABLE_ALIASES = {
-    "total assets": ["total assets", "assets"],
-    "total liabilities": ["total liabilities", "liabilities"],
-    "cash": ["cash", "cash and cash equivalents at carrying value"],
-    "Shares Outstanding": ["Weighted Average Number Of Shares Outstanding Basic"]
-}
+# Tag and label aliases to locate variables in XBRL tables: indicators.CONCEPTS (concepts.py)
 
 VARIABLE_SHEETS = {
     "total assets": "balance_sheet",
@@ -53,30 +57,123 @@ INDEX_CACHE_SECONDS = 24 * 3600
 CACHE_DIR = ".cache_index_lists"
 os.makedirs(CACHE_DIR, exist_ok=True)
 
+# Per-ticker index of already ingested filings (accession number -> metadata).
+# Lives outside xbrl_data_json/<TICKER>/ so the filing loaders never pick it up.
+FILING_INDEX_DIR = os.path.join("xbrl_data_json", "_index")
+
+# Skip the XBRL download of a filing whose period the fact table already holds
+# (balance sheet + own-period flows from comparative columns of later filings)
+SKIP_COVERED_PERIODS = True
+
+# New filing JSONs store metadata, 'base' and 'computed' only, like `fact_store.py --compact`
+# does for existing filings: their statement facts live in the fact table, from which ratios
+# added later resolve concepts missing in 'base' (indicators.FilingContext.from_filing).
+STATEMENTS_IN_JSON = False
+
 
 # ----------------------------- DATA CLASSES ---------------------------------
+# ~10k companies live in every Dash worker: keep them in __slots__ objects (no per-instance
+# __dict__) and allocate the per-year filing buckets only for companies actually fetched.
 class CompanyIns:
+    __slots__ = ("cik", "ticker", "title", "_years")
+
     def __init__(self, cik_str, ticker, title):
         self.cik = cik_str
         self.ticker = ticker
         self.title = title
-        self.years = {}  # dict[int, List[CompanyFinancials]]
+        self._years = None
+
+    @property
+    def years(self) -> Dict[int, List["CompanyFinancials"]]:
+        if self._years is None:
+            self._years = {}
+        return self._years
+
+    def to_dict(self) -> dict:
+        return {"cik": self.cik, "ticker": self.ticker, "title": self.title}
+
+    def __eq__(self, other):
+        if not isinstance(other, CompanyIns):
+            return NotImplemented
+        return (str(self.cik), self.ticker, self.title) == (str(other.cik), other.ticker, other.title)
+
+    __hash__ = None
 
 
 class CompanyFinancials:
+    __slots__ = ("date", "financials", "location", "json_data")
+
     def __init__(self, date, filling, location=None, json_data: Optional[dict] = None):
         self.date = date                    # report date (period end)
-        self.financials = filling           # edgar.Financials or a wrapper
+        self.financials = filling           # edgar.Financials or a wrapper (None once persisted)
         self.location = location            # path to saved JSON snapshot
         self.json_data = json_data          # cached JSON dict (if available)
 
 
 class CompanyData:
+    """
+    Company universe indexed by CIK (`companies`) and by upper-case ticker.
+    Assigning `companies` rebuilds the ticker index.
+    SIC / sector metadata (`load_metadata`) is a DataFrame indexed by CIK, so tables can
+    join it with a vectorized `map` and sectors resolve to CIK sets without scanning.
+    """
+
     def __init__(self, data: Dict = None):
-        self.companies: Dict[str, CompanyIns] = {}
+        self._companies: Dict[str, CompanyIns] = {}
+        self._by_ticker: Dict[str, str] = {}
+        self._metadata: Optional[pd.DataFrame] = None
+        self._by_sector: Dict[str, set] = {}
         if data:
-            for key, value in data.items():
-                self.companies[key] = CompanyIns(**value)
+            self.companies = {key: CompanyIns(**value) for key, value in data.items()}
+
+    @property
+    def companies(self) -> Dict[str, CompanyIns]:
+        return self._companies
+
+    @companies.setter
+    def companies(self, companies: Dict[str, CompanyIns]):
+        self._companies = companies
+        self._by_ticker = {str(c.ticker).upper(): cik for cik, c in companies.items()}
+        self._metadata = None
+        self._by_sector = {}
+
+    def cik_for_ticker(self, ticker: str) -> Optional[str]:
+        return self._by_ticker.get(str(ticker).upper())
+
+    def get_by_ticker(self, ticker: str) -> Optional[CompanyIns]:
+        cik = self.cik_for_ticker(ticker)
+        return self._companies.get(cik) if cik is not None else None
+
+    # --- SIC / sector metadata ---------------------------------------------
+    def load_metadata(self, source: Optional[str] = None, refresh: bool = False) -> pd.DataFrame:
+        """Load SIC codes and sectors of the universe (bulk submissions.zip or fixture, cached)."""
+        self._metadata = load_company_metadata(self._companies.keys(), source=source, refresh=refresh)
+        self._by_sector = {
+            sector: set(ciks) for sector, ciks in self._metadata.groupby("sector").groups.items()
+        }
+        return self._metadata
+
+    @property
+    def metadata(self) -> pd.DataFrame:
+        if self._metadata is None:
+            self.load_metadata()
+        return self._metadata
+
+    @property
+    def sector_by_cik(self) -> pd.Series:
+        """CIK -> sector Series, for `df["CIK"].map(...)` joins."""
+        return self.metadata["sector"]
+
+    @property
+    def sectors(self) -> List[str]:
+        if self._metadata is None:
+            self.load_metadata()
+        return sorted(s for s in self._by_sector if s != UNKNOWN_SECTOR)
+
+    def ciks_in_sector(self, sector: str) -> set:
+        if self._metadata is None:
+            self.load_metadata()
+        return self._by_sector.get(sector, set())
 
     def update_companies(self, new_data):
         """Update the company list if there are any changes."""
@@ -95,7 +192,7 @@ class CompanyData:
     def save_companies(self):
         """Save company data to a JSON file."""
         with open(FILE_PATH, "w", encoding="utf-8") as file:
-            json.dump({k: v.__dict__ for k, v in self.companies.items()}, file, indent=4)
+            json.dump({k: v.to_dict() for k, v in self.companies.items()}, file, indent=4)
         print("Company tickers list updated and saved.")
 
     def load_saved_companies(self):
@@ -116,31 +213,6 @@ class CompanyData:
 
 
 # ----------------------------- FILE SAVE HELPERS ----------------------------
-def save_xbrl_to_disk(xbrl_data, ticker, reporting_date):
-    """
-    Saves XBRL data to disk and returns the file path.
-    """
-    directory = "xbrl_data"
-    os.makedirs(directory, exist_ok=True)
-
-    safe_date = reporting_date.strftime("%Y-%m-%d")
-    filename = f"{ticker}_{safe_date}_{uuid.uuid4().hex[:8]}.xbrl"
-    file_path = os.path.join(directory, filename)
-
-    try:
-        if isinstance(xbrl_data, bytes):
-            with open(file_path, "wb") as f:
-                f.write(xbrl_data)
-        else:
-            with open(file_path, "w", encoding="utf-8") as f:
-                f.write(str(xbrl_data))
-    except Exception as e:
-        print(f"Error saving XBRL file: {e}")
-        return None
-
-    return file_path
-
-
 def save_financials_as_json(
     financials_file,
     ticker: str,
@@ -150,11 +222,20 @@ def save_financials_as_json(
     variable_mapping: dict | None = None,
     yf_value: Optional[float] = None,
     yf_value_date: Optional[str] = None,
+    accession_no: Optional[str] = None,
+    filing_date: Optional[str] = None,
+    form: Optional[str] = None,
+    keep_statements: bool = True,
 ) -> str:
     """
     Serialize parsed financial statements into a JSON file.
     Optionally computes 'base' and 'computed' ratios using `variable_mapping`.
     If `yf_value` is provided, it is stored and also used to compute ratios (e.g., P/E).
+    Filing metadata (`accession_no`, `filing_date`, `form`) is stored when known.
+    `financials_file` is an edgar.Financials or the already extracted statements
+    ({"balance_sheet": {...}, "income": {...}, "cashflow": {...}}) from the parse stage.
+    With `keep_statements=False` the statement tables are used for the ratios but not
+    written (their facts are stored by fact_store).
     """
     try:
         safe_date = reporting_date.strftime("%Y-%m-%d")
@@ -168,18 +249,31 @@ def save_financials_as_json(
     file_path = os.path.join(out_dir, ticker, f"{ticker}_{safe_date}.json")
 
     try:
-        balance_sheet_df = financials_file.get_balance_sheet().data
-        income_df = financials_file.get_income_statement().data
-        cashflow_df = financials_file.get_cash_flow_statement().data
+        if isinstance(financials_file, dict):
+            statements = financials_file
+        else:
+            statements = {
+                "balance_sheet": financials_file.get_balance_sheet().data.to_dict(),
+                "income": financials_file.get_income_statement().data.to_dict(),
+                "cashflow": financials_file.get_cash_flow_statement().data.to_dict(),
+            }
 
         data = {
-            "balance_sheet": balance_sheet_df.to_dict(),
-            "income": income_df.to_dict(),
-            "cashflow": cashflow_df.to_dict(),
+            "balance_sheet": statements["balance_sheet"],
+            "income": statements["income"],
+            "cashflow": statements["cashflow"],
             "date": safe_date,
             "ticker": ticker
         }
 
+        # Filing metadata (accession number is the dedup key of the filing index)
+        if accession_no:
+            data["accession_no"] = str(accession_no)
+        if filing_date:
+            data["filing_date"] = str(filing_date)
+        if form:
+            data["form"] = str(form)
+
         # Store Yahoo price if provided
         if yf_value is not None:
             data["yf_value"] = float(yf_value)
@@ -191,7 +285,11 @@ def save_financials_as_json(
             ratios = compute_ratios(data, variable_mapping, stock_price=yf_value)
             data.update(ratios)
 
-        with open(file_path, "w", encoding="utf-8") as f:
+        if not keep_statements:
+            for sheet in fact_store.SHEETS:
+                data.pop(sheet, None)
+
+        with metrics.span("json_write"), open(file_path, "w", encoding="utf-8") as f:
             json.dump(data, f, indent=4)
 
         return file_path
@@ -206,6 +304,125 @@ def save_financials_as_json(
         return file_path
 
 
+# ----------------------------- FILING INDEX ---------------------------------
+def _filing_index_path(ticker: str) -> str:
+    return os.path.join(FILING_INDEX_DIR, f"{ticker}.json")
+
+
+def load_filing_index(ticker: str) -> Dict[str, dict]:
+    """
+    Load the filing index of a ticker:
+      accession_no -> {"date", "filing_date", "form", "file"}
+    Returns {} if the ticker has not been ingested yet.
+    """
+    path = _filing_index_path(ticker)
+    if not os.path.exists(path):
+        return {}
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except Exception as e:
+        print(f"[ERROR] Failed to read filing index {path}: {e}")
+        return {}
+
+
+def save_filing_index(ticker: str, index: Dict[str, dict]) -> None:
+    """Persist the filing index of a ticker."""
+    os.makedirs(FILING_INDEX_DIR, exist_ok=True)
+    try:
+        with open(_filing_index_path(ticker), "w", encoding="utf-8") as f:
+            json.dump(index, f, indent=2)
+    except Exception as e:
+        print(f"[ERROR] Failed to save filing index for {ticker}: {e}")
+
+
+def _existing_report_files(ticker: str) -> Dict[str, str]:
+    """Map report date (YYYY-MM-DD) -> JSON path, using file names only (no JSON parsing)."""
+    json_dir = f"xbrl_data_json/{ticker}"
+    existing: Dict[str, str] = {}
+    if not os.path.isdir(json_dir):
+        return existing
+    for file in os.listdir(json_dir):
+        file_date = extract_date_from_filename(file, ticker)
+        if file_date is not None:
+            existing[file_date.strftime("%Y-%m-%d")] = os.path.join(json_dir, file)
+    return existing
+
+
+def _get_filing_metadata(filing) -> Optional[dict]:
+    """
+    Read the filing index fields (no XBRL download):
+      accession_no, report_date (period of report), filing_date, form.
+    Returns None if the filing has no usable date.
+    """
+    report_dt = _get_reporting_date(filing)
+    if report_dt is None:
+        return None
+    filing_date = getattr(filing, "filing_date", None)
+    return {
+        "accession_no": getattr(filing, "accession_no", None),
+        "report_date": report_dt,
+        "filing_date": str(filing_date) if filing_date else None,
+        "form": getattr(filing, "form", None),
+    }
+
+
+def select_filings_to_fetch(filings, ticker: str, year: int, index: Dict[str, dict]) -> List[Tuple[object, dict]]:
+    """
+    Metadata prefilter: decide which filings actually need an XBRL download.
+
+    A filing is skipped when
+      - its period of report is not in `year`,
+      - its accession number is already in the filing index, or
+      - a JSON for the same report date already exists on disk (legacy files
+        without accession) – the accession is then backfilled into `index`, or
+      - the fact table already holds its period from the comparative columns of
+        later filings (SKIP_COVERED_PERIODS).
+
+    Returns [(filing, metadata), ...] of filings to download.
+    """
+    existing_files = _existing_report_files(ticker)
+    seen_dates = set()
+    to_fetch: List[Tuple[object, dict]] = []
+
+    for filing in filings:
+        meta = _get_filing_metadata(filing)
+        if meta is None:
+            print("[WARNING] Skipping filing without usable date.")
+            continue
+
+        report_dt = meta["report_date"]
+        if int(report_dt.year) != int(year):
+            continue
+
+        accession = meta["accession_no"]
+        if accession and accession in index:
+            continue
+
+        safe_report_date = report_dt.strftime("%Y-%m-%d")
+        if safe_report_date in existing_files:
+            if accession:
+                index[accession] = {
+                    "date": safe_report_date,
+                    "filing_date": meta["filing_date"],
+                    "form": meta["form"],
+                    "file": existing_files[safe_report_date],
+                }
+            continue
+
+        if SKIP_COVERED_PERIODS and fact_store.covers_period(ticker, report_dt, meta["form"]):
+            metrics.incr("filings_skipped_covered")
+            continue
+
+        # Two filings for the same period within one window (e.g. amendments): first wins
+        if safe_report_date in seen_dates:
+            continue
+        seen_dates.add(safe_report_date)
+        to_fetch.append((filing, meta))
+
+    return to_fetch
+
+
 # ----------------------------- VARIABLE EXTRACT -----------------------------
 def _load_json_any(file_or_json: Union[str, dict, None]) -> Optional[dict]:
     """Load JSON dict from a filepath or return the dict if already provided."""
@@ -215,7 +432,7 @@ def _load_json_any(file_or_json: Union[str, dict, None]) -> Optional[dict]:
         return file_or_json
     if isinstance(file_or_json, str):
         try:
-            with open(file_or_json, "r", encoding="utf-8") as f:
+            with metrics.span("json_read"), open(file_or_json, "r", encoding="utf-8") as f:
                 return json.load(f)
         except Exception as e:
             print(f"[ERROR] Failed to read JSON '{file_or_json}': {e}")
@@ -226,16 +443,18 @@ def _load_json_any(file_or_json: Union[str, dict, None]) -> Optional[dict]:
 def get_file_variable(variable_key: str, file_or_json: Union[str, dict, None], year: Optional[int] = None):
     """
     Prefer values from JSON sections 'base' / 'computed'.
-    - If `variable_key` starts with 'us-gaap' → search in base[variable_key]
+    - If `variable_key` is a tag (GAAP_PREFIXES) → search in base[variable_key], then its
+      counterparts in other taxonomies (CONCEPTS.equivalents, e.g. IFRS)
     - Otherwise → search in computed[variable_key]
-    Falls back to legacy .data scanning only if JSON is not available.
+    JSONs without those sections and objects with .data are resolved through the compiled
+    concept table (tag of the 'concept' column, exact label alias, alias contained in a label).
     """
     data = _load_json_any(file_or_json)
 
     key = variable_key.strip()
     # Preferred path: JSON with 'base'/'computed'
     if isinstance(data, dict) and ("base" in data or "computed" in data):
-        is_usgaap = key.lower().startswith("us-gaap")
+        is_usgaap = key.lower().startswith(GAAP_PREFIXES)
         section = "base" if is_usgaap else "computed"
         bucket = data.get(section, {})
 
@@ -244,6 +463,10 @@ def get_file_variable(variable_key: str, file_or_json: Union[str, dict, None], y
                 return float(bucket[key])
             except Exception:
                 return bucket[key]
+        if is_usgaap:
+            value = first_numeric(bucket, CONCEPTS.equivalents(key)[1:])
+            if value is not None:
+                return value
 
         other = "computed" if section == "base" else "base"
         if key in data.get(other, {}):
@@ -255,6 +478,26 @@ def get_file_variable(variable_key: str, file_or_json: Union[str, dict, None], y
         print(f"[DEBUG] Key '{key}' not present in '{section}' nor '{other}'.")
         return None
 
+    # Legacy JSON with statement tables only: resolve the key in each sheet
+    if isinstance(data, dict) and any(data.get(sheet) for sheet in fact_store.SHEETS):
+        for sheet in fact_store.SHEETS:
+            table = data.get(sheet) or {}
+            period_cols = [c for c in table if c not in fact_store.STATEMENT_META_COLUMNS]
+            if not period_cols:
+                continue
+            labels = list(table[period_cols[0]].keys())
+            concepts = [table.get("concept", {}).get(label) for label in labels]
+            pos = CONCEPTS.find_row(labels, key, concepts)
+            if pos is None:
+                continue
+            label = labels[pos]
+            for col in period_cols:
+                value = _to_float(table[col].get(label))
+                if value is not None:
+                    return value
+        print(f"[DEBUG] Key '{key}' not found in the statement tables.")
+        return None
+
     # Fallback: try object with .data (kept for backward compatibility)
     try:
         df = getattr(file_or_json, "data", None)
@@ -267,31 +510,14 @@ def get_file_variable(variable_key: str, file_or_json: Union[str, dict, None], y
             print(f"[WARNING] DataFrame is empty for year {year}.")
             return None
 
-        var_norm = key.lower()
-        try:
-            candidate_labels = VARIABLE_ALIASES.get(var_norm, [var_norm])
-        except NameError:
-            candidate_labels = [var_norm]
-
-        # exact
-        for name in candidate_labels:
-            for row_label in df.index:
-                if str(row_label).strip().lower() == name:
-                    value = df.loc[row_label].dropna().iloc[0]
-                    try:
-                        return float(value)
-                    except Exception:
-                        return value
-
-        # partial
-        for name in candidate_labels:
-            for row_label in df.index:
-                if name in str(row_label).strip().lower():
-                    value = df.loc[row_label].dropna().iloc[0]
-                    try:
-                        return float(value)
-                    except Exception:
-                        return value
+        concepts = df["concept"].tolist() if "concept" in df.columns else None
+        pos = CONCEPTS.find_row(list(df.index), key, concepts)
+        if pos is not None:
+            value = df.iloc[pos].drop(labels=list(fact_store.STATEMENT_META_COLUMNS), errors="ignore").dropna().iloc[0]
+            try:
+                return float(value)
+            except Exception:
+                return value
 
         print(f"[DEBUG] (fallback) Variable '{variable_key}' not found.")
         return None
@@ -304,13 +530,11 @@ def get_file_variable(variable_key: str, file_or_json: Union[str, dict, None], y
 # ----------------------------- COMPANY LIST MGMT ----------------------------
 def download_company_tickers():
     """Fetch the latest company tickers list from SEC."""
-    url = "https://www.sec.gov/files/company_tickers.json"
-    response = requests.get(url, headers={"User-Agent": "EdgarAnalytic/0.1 (contact@example.com)"})
-    if response.status_code == 200:
-        return response.json()
-    else:
-        print(f"Error downloading company tickers: {response.status_code}")
-        return None
+    # Revalidated with ETag / Last-Modified: unchanged lists are not downloaded again
+    data = data_sources.get_source().get_json(SEC_TICKERS_URL, headers=SEC_HEADERS, conditional=True)
+    if data is None:
+        print("Error downloading company tickers.")
+    return data
 
 
 def update_company_list():
@@ -355,11 +579,7 @@ def _fetch_html(url: str) -> Optional[str]:
     Returns decoded text or None.
     """
     try:
-        resp = requests.get(url, headers=HEADERS, timeout=20)
-        if resp.status_code == 200 and resp.text:
-            return resp.text
-        print(f"[INDEX] HTTP {resp.status_code} on {url}")
-        return None
+        return data_sources.get_source().get_text(url, headers=HEADERS)
     except Exception as e:
         print(f"[INDEX] Request failed for {url}: {e}")
         return None
@@ -498,41 +718,21 @@ def yf_download_series_xy(ticker: str, start_year: int, end_year: int) -> Option
         start = pd.Timestamp(year=start_year, month=1, day=1)
         end = pd.Timestamp(year=end_year, month=12, day=31) + pd.Timedelta(days=1)
 
-        hist = yf.download(
-            tickers=ticker,
-            start=start,
-            end=end,
-            progress=False,
-            auto_adjust=True
-        )
-        if hist is None or hist.empty:
-            print(f"[YF][{ticker}] Empty for {start.date()}..{(end - pd.Timedelta(days=1)).date()}")
-            return None
-
-        # Robust "Close" extraction for both single- and multi-index columns
-        if isinstance(hist.columns, pd.MultiIndex):
-            if ('Close', ticker) in hist.columns:
-                series = hist[('Close', ticker)]
-            elif 'Close' in hist.columns.get_level_values(0):
-                series = hist['Close'].iloc[:, 0]
-            else:
-                series = hist.iloc[:, 0]
-        else:
-            series = hist.get("Close", hist.iloc[:, 0])
-
-        series = pd.to_numeric(series, errors="coerce").dropna()
+        # Closes already in the shared matrix (price_store): no download
+        matrix = price_store.open_matrix()
+        if matrix is not None and ticker in matrix:
+            dates, closes = matrix.series(ticker, start, end - pd.Timedelta(days=1))
+            keep = ~np.isnan(closes)
+            if keep.any():
+                metrics.incr("price_matrix_hits")
+                return list(pd.DatetimeIndex(dates[keep])), closes[keep].astype(float).tolist()
+
+        closes = data_sources.get_source().closes([ticker], start, end)
+        series = closes[ticker].dropna() if ticker in closes else pd.Series(dtype="float64")
         if series.empty:
-            print(f"[YF][{ticker}] Series empty after dropna().")
+            print(f"[YF][{ticker}] Empty for {start.date()}..{(end - pd.Timedelta(days=1)).date()}")
             return None
 
-        idx = pd.to_datetime(series.index)
-        try:
-            idx = idx.tz_localize(None)
-        except Exception:
-            pass
-        idx = idx.normalize()
-        series.index = idx
-
         print(f"[YF][{ticker}] points={len(series)}, first={series.index[0].date()}, "
               f"last={series.index[-1].date()}, min={float(series.min()):.2f}, max={float(series.max()):.2f}")
 
@@ -566,6 +766,7 @@ def yf_get_stock_data(ticker, start_year, end_year):
     years = set(range(start_year, end_year + 1))
     stock_data: Dict[str, Optional[float]] = {}
     json_dir = f"xbrl_data_json/{ticker}"
+    scheduler = RecomputeScheduler()
 
     if not os.path.isdir(json_dir):
         print(f"[WARNING] Directory not found for {ticker}: {json_dir}")
@@ -584,7 +785,7 @@ def yf_get_stock_data(ticker, start_year, end_year):
 
         # Read JSON
         try:
-            with open(filepath, "r", encoding="utf-8") as f:
+            with metrics.span("json_read"), open(filepath, "r", encoding="utf-8") as f:
                 data = json.load(f)
         except Exception as e:
             print(f"[ERROR] Error while reading file: {e}")
@@ -595,106 +796,55 @@ def yf_get_stock_data(ticker, start_year, end_year):
         if "yf_value" in data and data["yf_value"] is not None:
             try:
                 stock_data[date_key] = float(data["yf_value"])
-                print(f"[DEBUG] Loaded existing YF value: {data['yf_value']} for {date_key}")
+                metrics.incr("yahoo_price_cached")
             except Exception:
                 stock_data[date_key] = None
             continue
 
         # Otherwise, download and persist it
         try:
-            price = yf_download_price(ticker=ticker, date=file_date, file_path=filepath)
+            price = yf_download_price(ticker=ticker, date=file_date, file_path=filepath, scheduler=scheduler)
             stock_data[date_key] = price
         except Exception as e:
             print(f"[ERROR] Download/write failed for {ticker} {file_date.date()} ({file}): {e}")
             stock_data[date_key] = None
 
+    # New prices and the ratios depending on them, one write per filing
+    scheduler.flush()
     return stock_data
 
 
-def yf_download_price(ticker, date, file_path, window_days: int = 3):
+def yf_download_price(ticker, date, file_path, window_days: int = 3,
+                      scheduler: Optional[RecomputeScheduler] = None):
     """
     Fetch the Close nearest to `date` within a ±window_days window.
     Fixes TimedeltaIndex .abs() issue by using numpy on the ns values.
     Persists:
       - yf_value
       - yf_value_date (the trading day actually used)
+    and the price-based ratios. With `scheduler` the write is only marked there
+    (batched by the caller's flush).
     """
-    date = pd.to_datetime(date)
-    try:
-        date = date.tz_localize(None)
-    except Exception:
-        pass
-    date = date.normalize()
-
-    start_w = date - pd.Timedelta(days=window_days)
-    end_w   = date + pd.Timedelta(days=window_days + 1)
-
-    try:
-        hist = yf.download(
-            tickers=ticker,
-            start=start_w,
-            end=end_w,
-            progress=False,
-            auto_adjust=True,
-            threads=False
-        )
-    except Exception as e:
-        print(f"[ERROR] yf_download_price download failed for {ticker}: {e}")
-        return None
-
-    if hist is None or hist.empty:
-        print(f"[WARNING] No data found for {ticker} around {date.date()}")
-        return None
-
-    if isinstance(hist.columns, pd.MultiIndex):
-        if ('Close', ticker) in hist.columns:
-            close = hist[('Close', ticker)]
-        elif 'Close' in hist.columns.get_level_values(0):
-            close = hist['Close'].iloc[:, 0]
-        else:
-            close = hist.iloc[:, 0]
-    else:
-        close = hist.get("Close", hist.iloc[:, 0])
-
-    close = pd.to_numeric(close, errors="coerce").dropna()
-    if close.empty:
-        print(f"[WARNING] No close series for {ticker} around {date.date()}")
+    price, picked_date = _yf_fetch_price_value_only(ticker, date, window_days=window_days)
+    if price is None:
+        print(f"[WARNING] No close found for {ticker} around {pd.Timestamp(date).date()}")
         return None
 
-    idx = pd.to_datetime(close.index)
-    try:
-        idx = idx.tz_localize(None)
-    except Exception:
-        pass
-    idx = idx.normalize()
-    close.index = idx
-
-    td = close.index - date
-    td_ns = td.view('i8')
-    td_abs = np.abs(td_ns)
-    pos = int(np.argmin(td_abs))
-
-    picked_date = close.index[pos]
-    price = float(close.iloc[pos])
-
     if os.path.exists(file_path):
-        try:
-            with open(file_path, "r", encoding="utf-8") as f:
-                data = json.load(f)
-            data["yf_value"] = price
-            data["yf_value_date"] = picked_date.strftime("%Y-%m-%d")
-            with open(file_path, "w", encoding="utf-8") as f:
-                json.dump(data, f, indent=4)
-        except Exception as e:
-            print(f"[ERROR] Failed to update JSON {file_path}: {e}")
+        # Price-based ratios (P/E, P/FCF, P/CF, P/E (TTM)) are recomputed with the new price
+        pending = scheduler if scheduler is not None else RecomputeScheduler()
+        pending.mark(ticker, file_path, {"yf_value": price, "yf_value_date": picked_date})
+        if scheduler is None:
+            pending.flush()
 
-    print(f"[INFO] Saved yf_value={price:.2f} (from {picked_date.date()}) for {ticker}")
+    metrics.incr("yahoo_prices_saved")
     return price
 
 
 def _yf_fetch_price_value_only(ticker: str, date: Union[str, pd.Timestamp, datetime], window_days: int = 3) -> Tuple[Optional[float], Optional[str]]:
     """
     Fetch the Close nearest to `date` within ±window_days, but DO NOT persist.
+    The shared close matrix (price_store) is read first; Yahoo only when it has no close there.
     Returns (price, picked_date_str) or (None, None).
     """
     date = pd.to_datetime(date)
@@ -704,47 +854,23 @@ def _yf_fetch_price_value_only(ticker: str, date: Union[str, pd.Timestamp, datet
         pass
     date = date.normalize()
 
+    price, picked = price_store.nearest_close(ticker, date, window_days)
+    if price is not None:
+        return price, picked.strftime("%Y-%m-%d")
+
     start_w = date - pd.Timedelta(days=window_days)
     end_w   = date + pd.Timedelta(days=window_days + 1)
 
     try:
-        hist = yf.download(
-            tickers=ticker,
-            start=start_w,
-            end=end_w,
-            progress=False,
-            auto_adjust=True,
-            threads=False
-        )
+        closes = data_sources.get_source().closes([ticker], start_w, end_w)
     except Exception as e:
         print(f"[ERROR] _yf_fetch_price_value_only failed for {ticker}: {e}")
         return None, None
 
-    if hist is None or hist.empty:
-        return None, None
-
-    if isinstance(hist.columns, pd.MultiIndex):
-        if ('Close', ticker) in hist.columns:
-            close = hist[('Close', ticker)]
-        elif 'Close' in hist.columns.get_level_values(0):
-            close = hist['Close'].iloc[:, 0]
-        else:
-            close = hist.iloc[:, 0]
-    else:
-        close = hist.get("Close", hist.iloc[:, 0])
-
-    close = pd.to_numeric(close, errors="coerce").dropna()
+    close = closes[ticker].dropna() if ticker in closes else pd.Series(dtype="float64")
     if close.empty:
         return None, None
 
-    idx = pd.to_datetime(close.index)
-    try:
-        idx = idx.tz_localize(None)
-    except Exception:
-        pass
-    idx = idx.normalize()
-    close.index = idx
-
     td = close.index - date
     td_ns = td.view('i8')
     td_abs = np.abs(td_ns)
@@ -771,11 +897,73 @@ def _get_reporting_date(filing) -> Optional[pd.Timestamp]:
             return None
 
 
+def _store_filing_facts(ticker: str, statements, meta: dict, cik=None) -> None:
+    """All periods of the filing (comparative columns included) into the ticker fact table."""
+    if not isinstance(statements, dict):
+        return
+    facts = statements.get("facts")
+    if facts is None:
+        facts = fact_store.facts_from_statements(statements, meta["report_date"], meta.get("form"))
+    fact_store.add_filing_facts(ticker, facts, meta.get("accession_no"),
+                                meta.get("filing_date") or meta["report_date"], meta.get("form"), cik=cik)
+
+
+def ingest_financials(company, file_financials, meta: dict, filing_index: Dict[str, dict],
+                      mapping_variables=None) -> Optional[str]:
+    """
+    Persist one parsed filing: fetch the Yahoo close near the report date, save the JSON
+    (base/computed ratios included) and record the accession in `filing_index`.
+    Returns the JSON path or None on failure. The caller saves the index.
+    """
+    report_dt = meta["report_date"]
+    safe_report_date = report_dt.strftime("%Y-%m-%d")
+
+    # Fetch Yahoo price BEFORE saving JSON so ratios can use it immediately
+    yf_price, yf_price_date = _yf_fetch_price_value_only(company.ticker, report_dt, window_days=3)
+
+    file_path = save_financials_as_json(
+        file_financials,
+        company.ticker,
+        report_dt,
+        variable_mapping=mapping_variables,
+        yf_value=yf_price,
+        yf_value_date=yf_price_date,
+        accession_no=meta["accession_no"],
+        filing_date=meta["filing_date"],
+        form=meta["form"],
+        # statement tables only when their facts can be stored (parsed dict, not an edgar object)
+        keep_statements=STATEMENTS_IN_JSON or not isinstance(file_financials, dict),
+    )
+    if not file_path:
+        print("[ERROR] Nepodařilo se uložit JSON.")
+        return None
+
+    # TTM / YoY of this filing and of the later ones depending on it
+    derived_metrics.update_filing(company.ticker, file_path)
+    _store_filing_facts(company.ticker, file_financials, meta, cik=company.cik)
+
+    if meta["accession_no"]:
+        filing_index[meta["accession_no"]] = {
+            "date": safe_report_date,
+            "filing_date": meta["filing_date"],
+            "form": meta["form"],
+            "file": file_path,
+        }
+
+    metrics.incr("filings_saved")
+    if yf_price is None:
+        metrics.incr("yahoo_price_missing")
+    return file_path
+
+
 def SecTools_export_important_data(company, existing_data, year, fetch_yahoo=False, yahoo_vars=None, mapping_variables=None):
     """
     Fetch 10-Q / 10-K around a given calendar year but *store and bucket* by the report date
     (period end).
 
+    Filings are prefiltered on their index metadata (period of report, accession number)
+    before any XBRL download, so re-running a fully covered year downloads nothing.
+
     NEW: For each saved filing we now:
       1) Fetch Yahoo close near the report date (±3 days, value-only).
       2) Pass that price to `save_financials_as_json` → stored as `yf_value`
@@ -788,7 +976,7 @@ def SecTools_export_important_data(company, existing_data, year, fetch_yahoo=Fal
         CompanyIns(company.cik, company.ticker, company.title)
     )
 
-    company_obj = Company(company.cik)
+    source = data_sources.get_source()
 
     windows = [
         (f"{year-1}-12-01", f"{year+1}-03-25"),
@@ -797,82 +985,100 @@ def SecTools_export_important_data(company, existing_data, year, fetch_yahoo=Fal
     all_filings = []
     for start_str, end_str in windows:
         try:
-            filings = company_obj.get_filings(form=["10-Q", "10-K"], is_xbrl=True, date=f"{start_str}:{end_str}")
+            filings = source.filings(company.cik, ["10-Q", "10-K"], start_str, end_str)
             all_filings.extend(filings)
         except Exception as e:
             print(f"[ERROR] get_filings failed for window {start_str}:{end_str}: {e}")
 
-    for filing in all_filings:
-        report_dt = _get_reporting_date(filing)
-        if report_dt is None:
-            print("[WARNING] Skipping filing without usable date.")
-            continue
-
-        report_year = int(report_dt.year)
-        if report_year != int(year):
-            continue
-
-        xbrl_data = filing.xbrl()
-        if xbrl_data is None:
-            print("[WARNING] Žádná XBRL data ve filing.")
-            continue
+    filing_index = load_filing_index(company.ticker)
+    to_fetch = select_filings_to_fetch(all_filings, company.ticker, year, filing_index)
+    print(f"[INFO] {company.ticker} {year}: {len(all_filings)} filings in window, "
+          f"{len(to_fetch)} need XBRL download.")
 
-        try:
-            file_financials = Financials(xbrl_data)
-        except Exception as e:
-            print(f"[ERROR] Chyba při vytváření objektu Financials: {e}")
-            continue
+    if year not in company_data.years:
+        company_data.years[year] = []
 
-        safe_report_date = report_dt.strftime("%Y-%m-%d")
-        json_dir = f"xbrl_data_json/{company.ticker}"
-        duplicate_found = False
-
-        if os.path.exists(json_dir):
-            for existing_file in os.listdir(json_dir):
-                if existing_file.endswith(".json") and safe_report_date in existing_file:
-                    print(f"[DEBUG] JSON pro {company.ticker} (report {safe_report_date}) už existuje, přeskočeno.")
-                    duplicate_found = True
-                    break
-        if duplicate_found:
-            if year not in company_data.years:
-                company_data.years[year] = []
-            exists_in_mem = any(pd.to_datetime(f.date).normalize() == report_dt.normalize()
-                                for f in company_data.years[year])
-            if not exists_in_mem:
-                company_data.years[year].append(CompanyFinancials(report_dt, file_financials, location=None))
+    # Filings already on disk: register them in memory without touching EDGAR
+    for entry in filing_index.values():
+        entry_dt = pd.to_datetime(entry.get("date"), errors="coerce")
+        if pd.isna(entry_dt) or entry_dt.year != int(year):
             continue
-
-        # === NEW: fetch Yahoo price BEFORE saving JSON so ratios can use it immediately ===
-        yf_price, yf_price_date = _yf_fetch_price_value_only(company.ticker, report_dt, window_days=3)
-
-        file_path = save_financials_as_json(
-            file_financials,
-            company.ticker,
-            report_dt,
-            variable_mapping=mapping_variables,
-            yf_value=yf_price,
-            yf_value_date=yf_price_date
-        )
+        exists_in_mem = any(pd.to_datetime(f.date).normalize() == entry_dt.normalize()
+                            for f in company_data.years[year])
+        if not exists_in_mem:
+            company_data.years[year].append(CompanyFinancials(entry_dt, None, location=entry.get("file")))
+
+    def write(item, statements):
+        _, meta = item
+        report_dt = meta["report_date"]
+        file_path = ingest_financials(company, statements, meta, filing_index,
+                                      mapping_variables=mapping_variables)
         if not file_path:
-            print("[ERROR] Nepodařilo se uložit JSON.")
-            continue
-
-        if year not in company_data.years:
-            company_data.years[year] = []
-
+            return None
         exists = any(pd.to_datetime(f.date).normalize() == report_dt.normalize()
                      for f in company_data.years[year])
         if not exists:
             company_data.years[year].append(
-                CompanyFinancials(report_dt, file_financials, location=file_path, json_data=None)
+                CompanyFinancials(report_dt, None, location=file_path, json_data=None)
             )
-            print(f"[INFO] Uloženo: {company.ticker} – report {safe_report_date} "
-                  f"(filed {getattr(filing, 'filing_date', 'N/A')}); "
-                  f"yf_value={yf_price if yf_price is not None else 'None'} (date={yf_price_date})")
+        return file_path
+
+    if to_fetch:
+        # fetch (threads) -> parse (process pool) -> write (this thread)
+        saved = IngestPipeline(
+            fetch_fn=lambda item: source.xbrl(item[0]),
+            parse_fn=parse_statements,
+            write_fn=write,
+        ).run(to_fetch)
+        print(f"[INFO] Uloženo: {company.ticker} {year}: {len(saved)}/{len(to_fetch)} filings.")
 
+    save_filing_index(company.ticker, filing_index)
     return company_data
 
 
+def reparse_from_cache(ticker: str, mapping_variables=None) -> List[str]:
+    """
+    Re-derive the JSON filings of a ticker from the local XBRL cache only (no network).
+    Use after changing statement extraction or ratio logic. The stored Yahoo price
+    (`yf_value`) of each filing is kept. Filings missing from the cache are skipped.
+    Returns the rewritten JSON paths.
+    """
+    filing_index = load_filing_index(ticker)
+    items = []
+    for accession, entry in filing_index.items():
+        report_dt = pd.to_datetime(entry.get("date"), errors="coerce")
+        if pd.isna(report_dt):
+            continue
+        items.append(dict(entry, accession_no=accession, report_date=report_dt))
+
+    def write(meta, statements):
+        previous = _load_json_any(meta.get("file")) if meta.get("file") and os.path.exists(meta["file"]) else None
+        previous = previous or {}
+        file_path = save_financials_as_json(
+            statements,
+            ticker,
+            meta["report_date"],
+            variable_mapping=mapping_variables,
+            yf_value=previous.get("yf_value"),
+            yf_value_date=previous.get("yf_value_date"),
+            accession_no=meta["accession_no"],
+            filing_date=meta.get("filing_date"),
+            form=meta.get("form"),
+            keep_statements=STATEMENTS_IN_JSON,
+        )
+        derived_metrics.update_filing(ticker, file_path)
+        _store_filing_facts(ticker, statements, meta)
+        return file_path
+
+    paths = IngestPipeline(
+        fetch_fn=lambda meta: load_raw_xbrl(meta["accession_no"]),
+        parse_fn=parse_statements,
+        write_fn=write,
+    ).run(items)
+    print(f"[INFO] {ticker}: re-parsed {len(paths)}/{len(items)} filings from the XBRL cache.")
+    return paths
+
+
 # ----------------------------- OTHER UTILITIES ------------------------------
 def __edgar_API(years, quarter):
     link = "https://www.sec.gov/Archives/edgar/daily-index/xbrl/companyfacts.zip"
@@ -880,20 +1086,18 @@ def __edgar_API(years, quarter):
 
 
 def get_all_current_companies():
-    url = "https://www.sec.gov/files/company_tickers.json"
-    response = requests.get(url, headers=HEADERS)
-    if response.status_code == 200:
+    data = data_sources.get_source().get_json(SEC_TICKERS_URL, headers=HEADERS, conditional=True)
+    if data is not None:
         print("Successfully downloaded indexes of companies.")
-        return response.json()
     else:
-        print(f"Error while downloading: {response.status_code}")
-        return None
+        print("Error while downloading.")
+    return data
 
 
 def get_overview_file(link, years, quarter):
     result = []
     for current_year in years:
-        response = requests.get(link, headers=HEADERS)
+        response = http_client.get(link, headers=HEADERS, timeout=(5.0, 300.0))
         if response.status_code == 200:
             z_file = zipfile.ZipFile(BytesIO(response.content))
             print("Zip file downloaded")
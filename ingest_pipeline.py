@@ -0,0 +1,387 @@
+"""
+Filing ingestion pipeline: fetch -> parse -> write.
+
+- Fetch:  threads download the raw XBRL documents (network bound, governed by the SEC rate limit).
+- Parse:  a ProcessPoolExecutor turns raw documents into statement tables (CPU bound).
+- Write:  a single writer persists results (JSON + ratios), so the filing store has one writer.
+
+Stages are connected by bounded queues, so a slow stage back-pressures the ones before it,
+and every stage records its own timing.
+
+NOTE: this module must stay free of import-time side effects (no network, no Dash),
+because parse workers import it in fresh processes on spawn-based platforms (Windows).
+"""
+import atexit
+import os
+import queue
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+from typing import Callable, Dict, Iterable, List, Optional
+
+from edgar import Financials, XBRLData
+from edgar.xbrl.calculations import CalculationLinkbase
+from edgar.xbrl.labels import parse_label_linkbase
+from edgar.xbrl.xbrldata import XBRLAttachments
+
+import metrics
+from fact_store import facts_from_instance, statement_concepts
+from xbrl_cache import load_raw_xbrl, save_raw_xbrl
+
+# ----------------------------- CONSTANTS ------------------------------------
+# XBRL documents needed to rebuild the statements (same set edgar downloads itself)
+XBRL_DOC_TYPES = ("instance", "schema", "label", "calculation", "presentation")
+
+FETCH_WORKERS = 4
+PARSE_WORKERS = max(1, (os.cpu_count() or 2) - 1)
+QUEUE_SIZE = 8            # raw documents waiting for a parse worker / results waiting for the writer
+PARSE_TIMEOUT = 300       # seconds a single filing may spend in a parse worker
+
+_DONE = object()
+
+
+# ----------------------------- STAGE FUNCTIONS ------------------------------
+def fetch_raw_xbrl(filing, use_cache: bool = True) -> Optional[Dict[str, str]]:
+    """
+    Download the raw XBRL documents of a filing (no parsing).
+    The local XBRL cache (keyed by accession number) is read first and filled on download.
+    Returns {doc_type: text} or None when the filing has no usable XBRL.
+    """
+    accession_no = getattr(filing, "accession_no", None)
+    if use_cache:
+        cached = load_raw_xbrl(accession_no)
+        if cached is not None:
+            metrics.incr("xbrl_cache_hits")
+            return cached
+        metrics.incr("xbrl_cache_misses")
+
+    with metrics.span("edgar_fetch", kind="xbrl"):
+        documents = XBRLAttachments(filing.attachments)
+        if documents.empty or not documents.has_instance_document or documents.instance_only:
+            return None
+        raw: Dict[str, str] = {}
+        for doc_type in XBRL_DOC_TYPES:
+            attachment = documents.get(doc_type)
+            if attachment is None:
+                continue
+            content = attachment.download()
+            if isinstance(content, bytes):
+                content = content.decode("utf-8", errors="replace")
+            raw[doc_type] = content
+    if use_cache:
+        save_raw_xbrl(accession_no, raw)
+    return raw
+
+
+def parse_statements(raw: Dict[str, str]) -> Optional[Dict[str, dict]]:
+    """
+    Parse raw XBRL documents into the three statement tables (runs in a worker process).
+    Returns {"balance_sheet": {...}, "income": {...}, "cashflow": {...}} in the same
+    dict-of-dicts shape `save_financials_as_json` stores, plus "facts" (fact_store
+    table of the filing), or None if parsing fails.
+    """
+    if not raw or "instance" not in raw:
+        return None
+
+    presentation = raw.get("presentation")
+    labels = parse_label_linkbase(raw["label"]) if raw.get("label") else None
+    calculations = CalculationLinkbase.parse(raw["calculation"]) if raw.get("calculation") else None
+
+    # Older filings embed the linkbases in the schema
+    if raw.get("schema") and (presentation is None or labels is None or calculations is None):
+        embedded = XBRLAttachments.extract_embedded_linkbases(raw["schema"])["linkbases"]
+        if presentation is None:
+            presentation = embedded.get("presentation")
+        if labels is None and embedded.get("label"):
+            labels = parse_label_linkbase(embedded["label"])
+        if calculations is None and embedded.get("calculation"):
+            calculations = CalculationLinkbase.parse(embedded["calculation"])
+
+    xbrl_data = XBRLData.parse(raw["instance"], presentation or "", labels or {}, calculations)
+    financials = Financials(xbrl_data)
+
+    sheets = {
+        "balance_sheet": financials.get_balance_sheet(),
+        "income": financials.get_income_statement(),
+        "cashflow": financials.get_cash_flow_statement(),
+    }
+    if any(statement is None for statement in sheets.values()):
+        return None
+    statements = {key: statement.data.to_dict() for key, statement in sheets.items()}
+    # Every period of the statement concepts (comparatives included), exact start / end dates
+    statements["facts"] = facts_from_instance(xbrl_data.instance.facts, statement_concepts(statements))
+    return statements
+
+
+# ----------------------------- SHARED PROCESS POOL --------------------------
+_parse_pool: Optional[ProcessPoolExecutor] = None
+_parse_pool_lock = threading.Lock()
+
+
+def get_parse_pool(workers: int = PARSE_WORKERS) -> ProcessPoolExecutor:
+    """One process pool per interpreter: spawning workers per company would cost more than parsing."""
+    global _parse_pool
+    with _parse_pool_lock:
+        if _parse_pool is None:
+            _parse_pool = ProcessPoolExecutor(max_workers=workers)
+            atexit.register(_parse_pool.shutdown, wait=False, cancel_futures=True)
+        return _parse_pool
+
+
+def start_parse_pool(workers: int = PARSE_WORKERS) -> ProcessPoolExecutor:
+    """
+    Create the shared pool and start its workers now. Long-running apps (the Dash
+    server) call this at startup, so workers are not forked inside a request thread.
+    """
+    pool = get_parse_pool(workers)
+    pool.submit(os.getpid).result()
+    return pool
+
+
+def recycle_parse_pool(pool: ProcessPoolExecutor) -> None:
+    """
+    Kill the workers of `pool` (a parse in one of them timed out and would keep it busy
+    forever) and drop it as the shared pool; the next get_parse_pool() starts fresh ones.
+    Futures still running in it fail with BrokenProcessPool.
+    """
+    global _parse_pool
+    with _parse_pool_lock:
+        if _parse_pool is pool:
+            _parse_pool = None
+    for process in list((getattr(pool, "_processes", None) or {}).values()):
+        process.terminate()
+    pool.shutdown(wait=False, cancel_futures=True)
+    metrics.incr("ingest_parse_pool_recycled")
+
+
+# ----------------------------- PIPELINE -------------------------------------
+class StageStats:
+    """Per-stage counters: items, errors, busy time and time blocked on a queue."""
+
+    def __init__(self, name: str):
+        self.name = name
+        self.items = 0
+        self.errors = 0
+        self.busy = 0.0
+        self.blocked = 0.0
+        self._lock = threading.Lock()
+
+    def add(self, busy: float = 0.0, blocked: float = 0.0, error: bool = False):
+        with self._lock:
+            self.items += 1
+            self.errors += int(error)
+            self.busy += busy
+            self.blocked += blocked
+        # Parse runs in worker processes, so stages are timed here rather than inside them
+        metrics.observe("ingest_stage", busy, stage=self.name)
+        if error:
+            metrics.incr("ingest_stage_errors", stage=self.name)
+
+    def __str__(self):
+        return (f"{self.name}: n={self.items} err={self.errors} "
+                f"busy={self.busy:.2f}s blocked={self.blocked:.2f}s")
+
+
+class IngestPipeline:
+    """
+    Run `fetch_fn` -> `parse_fn` -> `write_fn` over `items`.
+
+    - fetch_fn(item) -> raw | None              (threads)
+    - parse_fn(raw)  -> parsed | None           (process pool; must be picklable, i.e. top-level)
+    - write_fn(item, parsed) -> result | None   (single writer, the calling thread)
+
+    `parse_workers=0` parses inline in the dispatcher thread (no process pool), which is
+    handy for debugging and for environments without multiprocessing.
+
+    A parse running longer than `parse_timeout` fails its item and its pool is recycled
+    (workers killed, see `recycle_parse_pool`); parses still in flight are resubmitted
+    to a fresh shared pool, which also replaces a caller-supplied `executor`.
+    """
+
+    def __init__(self,
+                 fetch_fn: Callable,
+                 parse_fn: Callable,
+                 write_fn: Callable,
+                 *,
+                 fetch_workers: int = FETCH_WORKERS,
+                 parse_workers: int = PARSE_WORKERS,
+                 queue_size: int = QUEUE_SIZE,
+                 parse_timeout: float = PARSE_TIMEOUT,
+                 executor: Optional[ProcessPoolExecutor] = None):
+        self.fetch_fn = fetch_fn
+        self.parse_fn = parse_fn
+        self.write_fn = write_fn
+        self.fetch_workers = max(1, fetch_workers)
+        self.parse_workers = parse_workers
+        self.queue_size = max(1, queue_size)
+        self.parse_timeout = parse_timeout
+        self.executor = executor
+        self.stats = {name: StageStats(name) for name in ("fetch", "parse", "write")}
+
+    # --- stages -------------------------------------------------------------
+    def _fetcher(self, source, source_lock, raw_queue):
+        while True:
+            with source_lock:
+                item = next(source, _DONE)
+            if item is _DONE:
+                return
+            t0 = time.perf_counter()
+            try:
+                raw = self.fetch_fn(item)
+                error = False
+            except Exception as e:
+                print(f"[PIPELINE] fetch failed for {item!r}: {e}")
+                raw, error = None, True
+            t1 = time.perf_counter()
+            if raw is not None:
+                raw_queue.put((item, raw))  # blocks while parsers are behind (backpressure)
+            self.stats["fetch"].add(busy=t1 - t0, blocked=time.perf_counter() - t1, error=error)
+
+    def _dispatcher(self, raw_queue, write_queue, n_fetchers):
+        finished_fetchers = 0
+        in_flight = {}   # future -> (item, raw, submitted, resubmitted)
+        max_in_flight = max(1, self.parse_workers) * 2
+        pool = None
+        if self.parse_workers > 0:
+            pool = self.executor or get_parse_pool(self.parse_workers)
+
+        def submit(item, raw, resubmitted=False):
+            in_flight[pool.submit(self.parse_fn, raw)] = (item, raw, time.perf_counter(), resubmitted)
+
+        def finish(item, submitted, parsed, error):
+            t0 = time.perf_counter()
+            if parsed is not None:
+                write_queue.put((item, parsed))
+            self.stats["parse"].add(busy=t0 - submitted, blocked=time.perf_counter() - t0, error=error)
+
+        def recycle():
+            # Kill the stuck worker(s); parses still running elsewhere in the pool are resubmitted
+            nonlocal pool
+            recycle_parse_pool(pool)
+            self.executor = None
+            pool = get_parse_pool(self.parse_workers)
+            for future, (item, raw, _, resubmitted) in list(in_flight.items()):
+                del in_flight[future]
+                submit(item, raw, resubmitted)
+
+        def drain(block: bool):
+            nonlocal pool
+            if not in_flight:
+                return
+            timeout = 0
+            if block:
+                oldest = min(submitted for _, _, submitted, _ in in_flight.values())
+                timeout = max(0.0, oldest + self.parse_timeout - time.perf_counter())
+            done, _ = wait(list(in_flight), timeout=timeout, return_when=FIRST_COMPLETED)
+            for future in done:
+                item, raw, submitted, resubmitted = in_flight.pop(future)
+                try:
+                    parsed = future.result(timeout=0)
+                    error = False
+                except BrokenProcessPool as e:
+                    if not resubmitted:
+                        # The shared pool was recycled under this parse (another pipeline's timeout)
+                        if self.executor is None:
+                            pool = get_parse_pool(self.parse_workers)
+                        submit(item, raw, resubmitted=True)
+                        continue
+                    print(f"[PIPELINE] parse failed for {item!r}: {e}")
+                    parsed, error = None, True
+                except Exception as e:
+                    print(f"[PIPELINE] parse failed for {item!r}: {e}")
+                    parsed, error = None, True
+                finish(item, submitted, parsed, error)
+
+            now = time.perf_counter()
+            expired = [f for f, (_, _, submitted, _) in in_flight.items() if now - submitted >= self.parse_timeout]
+            if expired:
+                for future in expired:
+                    item, _, submitted, _ = in_flight.pop(future)
+                    future.cancel()
+                    print(f"[PIPELINE] parse timed out after {self.parse_timeout}s for {item!r}")
+                    metrics.incr("ingest_parse_timeouts")
+                    finish(item, submitted, None, True)
+                recycle()
+
+        while finished_fetchers < n_fetchers:
+            entry = raw_queue.get()
+            if entry is _DONE:
+                finished_fetchers += 1
+                continue
+            item, raw = entry
+            if pool is None:
+                t0 = time.perf_counter()
+                try:
+                    parsed, error = self.parse_fn(raw), False
+                except Exception as e:
+                    print(f"[PIPELINE] parse failed for {item!r}: {e}")
+                    parsed, error = None, True
+                finish(item, t0, parsed, error)
+                continue
+            while len(in_flight) >= max_in_flight:
+                drain(block=True)
+            submit(item, raw)
+            drain(block=False)
+
+        while in_flight:
+            drain(block=True)
+        write_queue.put(_DONE)
+
+    # --- driver -------------------------------------------------------------
+    def run(self, items: Iterable) -> List:
+        """Process all items; returns the non-None results of `write_fn` in write order."""
+        raw_queue: queue.Queue = queue.Queue(maxsize=self.queue_size)
+        write_queue: queue.Queue = queue.Queue(maxsize=self.queue_size)
+        source, source_lock = iter(items), threading.Lock()
+        started = time.perf_counter()
+
+        def fetcher():
+            try:
+                self._fetcher(source, source_lock, raw_queue)
+            finally:
+                raw_queue.put(_DONE)
+
+        fetchers = [threading.Thread(target=fetcher, daemon=True) for _ in range(self.fetch_workers)]
+        def dispatcher_main():
+            try:
+                self._dispatcher(raw_queue, write_queue, len(fetchers))
+            except Exception as e:
+                print(f"[PIPELINE] dispatcher failed: {e}")
+                # Unblock the fetchers and the writer
+                finished = 0
+                while finished < len(fetchers):
+                    if raw_queue.get() is _DONE:
+                        finished += 1
+                write_queue.put(_DONE)
+
+        dispatcher = threading.Thread(target=dispatcher_main, daemon=True)
+        for thread in fetchers:
+            thread.start()
+        dispatcher.start()
+
+        results = []
+        while True:
+            t0 = time.perf_counter()
+            entry = write_queue.get()
+            waited = time.perf_counter() - t0
+            if entry is _DONE:
+                break
+            item, parsed = entry
+            t1 = time.perf_counter()
+            try:
+                result, error = self.write_fn(item, parsed), False
+            except Exception as e:
+                print(f"[PIPELINE] write failed for {item!r}: {e}")
+                result, error = None, True
+            self.stats["write"].add(busy=time.perf_counter() - t1, blocked=waited, error=error)
+            if result is not None:
+                results.append(result)
+
+        dispatcher.join()
+        for thread in fetchers:
+            thread.join()
+
+        print(f"[PIPELINE] {time.perf_counter() - started:.2f}s | " +
+              " | ".join(str(s) for s in self.stats.values()))
+        return results
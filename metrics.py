@@ -0,0 +1,230 @@
+"""
+Lightweight instrumentation: timing spans and counters for the hot paths
+(EDGAR fetch, XBRL parse, Yahoo fetch, JSON read/write, ratio computation,
+graph and table build).
+
+    with metrics.span("json_read"):
+        ...
+    metrics.incr("filings_saved")
+
+Set SCREENER_METRICS=0 for the no-op mode: `span()` then returns a shared
+do-nothing context manager and `incr()` / `observe()` return immediately.
+`register_endpoint(app.server)` exposes everything in Prometheus text format
+on /metrics of the Dash Flask server; the screener registers it only with
+SCREENER_METRICS_ENDPOINT=1 (it is unauthenticated and lists internal timings).
+
+No import-time side effects: ingestion worker processes import this module too.
+"""
+import os
+import threading
+import time
+from functools import wraps
+from typing import Dict, Optional, Tuple
+
+METRICS_ENABLED = os.environ.get("SCREENER_METRICS", "1").strip().lower() not in ("0", "false", "off", "no")
+METRICS_ENDPOINT_ENABLED = os.environ.get("SCREENER_METRICS_ENDPOINT", "0").strip().lower() in ("1", "true", "on", "yes")
+METRICS_PREFIX = "screener"
+METRICS_PATH = "/metrics"
+
+# Histogram buckets (seconds) for spans
+SPAN_BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 10.0, 30.0)
+
+_Key = Tuple[str, Tuple[Tuple[str, str], ...]]
+
+_lock = threading.Lock()
+_counters: Dict[_Key, float] = {}
+_timers: Dict[_Key, "_Timer"] = {}
+
+
+def _key(name: str, labels: dict) -> _Key:
+    return name, tuple(sorted((k, str(v)) for k, v in labels.items())) if labels else ()
+
+
+class _Timer:
+    __slots__ = ("count", "total", "max", "buckets")
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.buckets = [0] * len(SPAN_BUCKETS)
+
+    def add(self, seconds: float):
+        self.count += 1
+        self.total += seconds
+        if seconds > self.max:
+            self.max = seconds
+        for i, bound in enumerate(SPAN_BUCKETS):
+            if seconds <= bound:
+                self.buckets[i] += 1
+                break
+
+
+# ----------------------------- RECORDING ------------------------------------
+def enable(flag: bool = True) -> None:
+    global METRICS_ENABLED
+    METRICS_ENABLED = bool(flag)
+
+
+def is_enabled() -> bool:
+    return METRICS_ENABLED
+
+
+def endpoint_enabled() -> bool:
+    """Whether the app should serve /metrics (opt-in, SCREENER_METRICS_ENDPOINT=1)."""
+    return METRICS_ENABLED and METRICS_ENDPOINT_ENABLED
+
+
+def incr(name: str, value: float = 1.0, **labels) -> None:
+    """Add `value` to the counter `name` (optionally split by labels)."""
+    if not METRICS_ENABLED:
+        return
+    key = _key(name, labels)
+    with _lock:
+        _counters[key] = _counters.get(key, 0.0) + value
+
+
+def observe(name: str, seconds: float, **labels) -> None:
+    """Record a duration measured elsewhere (e.g. a stage timed in a worker process)."""
+    if not METRICS_ENABLED:
+        return
+    key = _key(name, labels)
+    with _lock:
+        timer = _timers.get(key)
+        if timer is None:
+            timer = _timers[key] = _Timer()
+        timer.add(seconds)
+
+
+class _Span:
+    __slots__ = ("name", "labels", "started")
+
+    def __init__(self, name: str, labels: dict):
+        self.name = name
+        self.labels = labels
+        self.started = 0.0
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        observe(self.name, time.perf_counter() - self.started, **self.labels)
+        if exc_type is not None:
+            incr(f"{self.name}_errors", **self.labels)
+        return False
+
+
+class _NullSpan:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+_NULL_SPAN = _NullSpan()
+
+
+def span(name: str, **labels):
+    """Context manager timing its block under `name`; exceptions are counted as `<name>_errors`."""
+    if not METRICS_ENABLED:
+        return _NULL_SPAN
+    return _Span(name, labels)
+
+
+def timed(name: str, **labels):
+    """Decorator form of `span`."""
+    def decorator(fn):
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            with span(name, **labels):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+# ----------------------------- READING --------------------------------------
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _label_str(labels: Tuple[Tuple[str, str], ...], **extra) -> str:
+    pairs = list(labels) + sorted(extra.items())
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in pairs) + "}"
+
+
+def snapshot() -> dict:
+    """{"counters": {"name{labels}": value}, "spans": {"name{labels}": {count, sum_s, max_s, mean_s}}}"""
+    with _lock:
+        counters = {f"{name}{_label_str(labels)}": value for (name, labels), value in _counters.items()}
+        spans = {
+            f"{name}{_label_str(labels)}": {
+                "count": t.count,
+                "sum_s": t.total,
+                "max_s": t.max,
+                "mean_s": t.total / t.count if t.count else 0.0,
+            }
+            for (name, labels), t in _timers.items()
+        }
+    return {"counters": counters, "spans": spans}
+
+
+def render_prometheus(prefix: str = METRICS_PREFIX) -> str:
+    """Prometheus text exposition: one histogram for all spans, one counter per name."""
+    lines = []
+    with _lock:
+        timers = sorted(_timers.items())
+        counters = sorted(_counters.items())
+
+    if timers:
+        metric = f"{prefix}_span_seconds"
+        lines.append(f"# HELP {metric} Duration of instrumented operations.")
+        lines.append(f"# TYPE {metric} histogram")
+        for (name, labels), t in timers:
+            cumulative = 0
+            for bound, n in zip(SPAN_BUCKETS, t.buckets):
+                cumulative += n
+                lines.append(f"{metric}_bucket{_label_str(labels, span=name, le=bound)} {cumulative}")
+            lines.append(f"{metric}_bucket{_label_str(labels, span=name, le='+Inf')} {t.count}")
+            lines.append(f"{metric}_sum{_label_str(labels, span=name)} {t.total}")
+            lines.append(f"{metric}_count{_label_str(labels, span=name)} {t.count}")
+
+    declared = set()
+    for (name, labels), value in counters:
+        metric = f"{prefix}_{name}_total"
+        if metric not in declared:
+            lines.append(f"# TYPE {metric} counter")
+            declared.add(metric)
+        lines.append(f"{metric}{_label_str(labels)} {value}")
+
+    return "\n".join(lines) + "\n"
+
+
+def format_summary() -> str:
+    """Short human-readable table of spans (slowest total first) and counters."""
+    snap = snapshot()
+    lines = [f"{name:<40} n={s['count']:<7} total={s['sum_s']:.3f}s mean={s['mean_s'] * 1000:.2f}ms"
+             for name, s in sorted(snap["spans"].items(), key=lambda kv: -kv[1]["sum_s"])]
+    lines += [f"{name:<40} {value:g}" for name, value in sorted(snap["counters"].items())]
+    return "\n".join(lines)
+
+
+def reset() -> None:
+    with _lock:
+        _counters.clear()
+        _timers.clear()
+
+
+def register_endpoint(server, path: str = METRICS_PATH) -> None:
+    """Expose `render_prometheus()` on a Flask server (e.g. `app.server` of Dash)."""
+    from flask import Response
+
+    def metrics_view():
+        return Response(render_prometheus(), mimetype="text/plain; version=0.0.4")
+
+    server.add_url_rule(path, endpoint="screener_metrics", view_func=metrics_view)
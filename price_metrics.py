@@ -0,0 +1,259 @@
+"""
+Price-derived screening metrics computed on the shared close matrix (price_store).
+
+    Return 3M / 6M / 12M   close / close at the window start - 1, in %
+    Volatility 12M         annualized std of daily log returns, in %
+    Max drawdown 12M       worst fall from a running peak within the window, in %
+    52W high distance      close / highest close of the window - 1, in %
+
+Every metric is computed for all (trading day, ticker) cells of the matrix at once
+with numpy. Windows are calendar windows (3M = 91 days, ...) located with one
+np.searchsorted over the matrix dates. Closes are carried over days a ticker did
+not trade (at most MAX_STALE_DAYS). A metric is NaN when the ticker has no close
+at the start of its window.
+
+The arrays live per process and are refreshed incrementally (`refresh`): rows the
+matrix gained since the last refresh are computed from their lookback window only;
+columns whose history changed (new tickers, backfilled ranges - found with
+per-column checksums) are recomputed in full.
+
+    lookup(["AAPL", "MSFT"], ["2024-03-28", "2024-03-28"])   # DataFrame, one row per pair
+"""
+import threading
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+import metrics
+import price_store
+
+# ----------------------------- CONSTANTS ------------------------------------
+RETURN_WINDOWS = {"Return 3M": 91, "Return 6M": 182, "Return 12M": 365}   # calendar days
+RISK_WINDOW_DAYS = 365        # volatility, drawdown and 52-week high
+TRADING_DAYS_PER_YEAR = 252
+MAX_STALE_DAYS = 7            # a close is carried forward at most this long
+DRAWDOWN_COLUMN_CHUNK = 512   # tickers per drawdown pass (bounds the temporary arrays)
+
+PRICE_METRICS: List[str] = list(RETURN_WINDOWS) + ["Volatility 12M", "Max drawdown 12M", "52W high distance"]
+
+_LOOKBACK_DAYS = max(max(RETURN_WINDOWS.values()), RISK_WINDOW_DAYS) + 2 * MAX_STALE_DAYS
+
+_state_lock = threading.Lock()
+_state: Optional["PriceMetrics"] = None
+
+
+class PriceMetrics:
+    """Metric arrays aligned with the matrix: values[name] is (rows, tickers) float32."""
+
+    def __init__(self, version: int, dates: np.ndarray, tickers: List[str], values: Dict[str, np.ndarray],
+                 checksums: Tuple[np.ndarray, np.ndarray]):
+        self.version = version
+        self.dates = dates              # datetime64[D], same rows as the matrix
+        self.tickers = tickers
+        self.values = values
+        self.checksums = checksums      # (nansum, count) of the closes per column
+        self.column_of = {t: i for i, t in enumerate(tickers)}
+
+
+# ----------------------------- COMPUTATION ----------------------------------
+def _window_start(dates: np.ndarray, days: int) -> np.ndarray:
+    """Per row: the last row at least `days` before it (-1 = history too short)."""
+    return np.searchsorted(dates, dates - np.timedelta64(days, "D"), side="right") - 1
+
+
+def _carry_forward(closes: np.ndarray, dates: np.ndarray) -> np.ndarray:
+    """Last close at or before each row (NaN before the first close or once older than MAX_STALE_DAYS)."""
+    rows = np.arange(len(closes))[:, None]
+    last = np.where(np.isnan(closes), -1, rows)
+    np.maximum.accumulate(last, axis=0, out=last)
+    known = np.maximum(last, 0)
+    filled = closes[known, np.arange(closes.shape[1])]
+    stale = (last < 0) | ((dates[:, None] - dates[known]) > np.timedelta64(MAX_STALE_DAYS, "D"))
+    filled[stale] = np.nan
+    return filled
+
+
+def _window_sums(values: np.ndarray, start: np.ndarray, end: np.ndarray) -> np.ndarray:
+    """Sum of `values` over rows (start, end] per row pair, NaN counted as 0."""
+    cumulative = np.zeros((len(values) + 1, values.shape[1]))
+    np.cumsum(np.nan_to_num(values), axis=0, out=cumulative[1:])
+    return cumulative[end + 1] - cumulative[np.maximum(start, -1) + 1]
+
+
+def _window_drawdown(filled: np.ndarray, lo: np.ndarray, hi: np.ndarray) -> np.ndarray:
+    """
+    Per row pair: min of close / running max over rows [lo, hi] (1 - max drawdown).
+
+    A disjoint sparse table answers all windows without a per-window loop: at level k the
+    rows form blocks of 2^(k+1) split at their middle; a window whose ends differ first in
+    bit k spans a suffix of a left half and a prefix of the following right half. Per half
+    (max, min, drawdown) aggregates come from one accumulate each, and the window is
+        min(suffix drawdown, prefix drawdown, prefix min / suffix max).
+    Levels are built one at a time, only those some window needs.
+    """
+    n, width = filled.shape
+    out = np.full((len(hi), width), np.nan)
+    single = lo == hi
+    out[single] = np.where(np.isnan(filled[hi[single]]), np.nan, 1.0)
+    level = np.full(len(hi), -1)
+    level[~single] = np.log2(lo[~single] ^ hi[~single]).astype(int)
+
+    for k in np.unique(level[~single]):
+        half = 1 << int(k)
+        blocks = -(-n // (2 * half))
+        padded = np.full((blocks * 2 * half, width), np.nan)
+        padded[:n] = filled
+        padded = padded.reshape(blocks, 2, half, width)
+
+        right = padded[:, 1]
+        prefix_max = np.fmax.accumulate(right, axis=1)
+        prefix_min = np.fmin.accumulate(right, axis=1)
+        prefix_dd = np.fmin.accumulate(right / prefix_max, axis=1)
+
+        left = padded[:, 0, ::-1]                      # suffixes of the left half, grown leftwards
+        suffix_max = np.fmax.accumulate(left, axis=1)[:, ::-1]
+        suffix_min = np.fmin.accumulate(left, axis=1)
+        suffix_dd = np.fmin.accumulate(suffix_min / left, axis=1)[:, ::-1]
+
+        pick = np.flatnonzero(level == k)
+        s, r = lo[pick], hi[pick]
+        at_s = (s // (2 * half), s % (2 * half))
+        at_r = (r // (2 * half), r % (2 * half) - half)
+        out[pick] = np.fmin(np.fmin(suffix_dd[at_s], prefix_dd[at_r]), prefix_min[at_r] / suffix_max[at_s])
+    return out
+
+
+def compute_metrics(closes: np.ndarray, dates: np.ndarray, first: int = 0) -> Dict[str, np.ndarray]:
+    """
+    Metrics of rows [first, len(dates)) of a dates x tickers close array. Rows before
+    `first` only serve as lookback (callers pass at least _LOOKBACK_DAYS of them).
+    """
+    closes = np.asarray(closes, dtype="float64")
+    if first >= len(dates):
+        return {name: np.empty((0, closes.shape[1]), dtype="float32") for name in PRICE_METRICS}
+    filled = _carry_forward(closes, dates)
+    rows = np.arange(first, len(dates))
+    out: Dict[str, np.ndarray] = {}
+
+    with np.errstate(invalid="ignore", divide="ignore"):
+        for name, days in RETURN_WINDOWS.items():
+            start = _window_start(dates, days)[first:]
+            base = np.where((start >= 0)[:, None], filled[np.maximum(start, 0)], np.nan)
+            out[name] = (filled[first:] / base - 1) * 100
+
+        start = _window_start(dates, RISK_WINDOW_DAYS)[first:]
+        covered = (start >= 0)[:, None] & ~np.isnan(filled[np.maximum(start, 0)])
+
+        # Log returns between consecutive closes; days without a close do not count
+        log_returns = np.diff(np.log(filled), axis=0, prepend=np.nan)
+        log_returns[np.isnan(closes)] = np.nan
+        count = _window_sums(~np.isnan(log_returns), start, rows)
+        total = _window_sums(log_returns, start, rows)
+        squares = _window_sums(log_returns ** 2, start, rows)
+        variance = (squares - total ** 2 / count) / (count - 1)
+        volatility = np.sqrt(np.maximum(variance, 0)) * np.sqrt(TRADING_DAYS_PER_YEAR) * 100
+        out["Volatility 12M"] = np.where(covered & (count >= 2), volatility, np.nan)
+
+        # Highest close per window: one fmax.reduceat over [start, row] pairs
+        padded = np.vstack([filled, np.full((1, filled.shape[1]), np.nan)])
+        bounds = np.column_stack([np.maximum(start, 0), rows + 1]).ravel()
+        high = np.fmax.reduceat(padded, bounds, axis=0)[::2]
+        out["52W high distance"] = np.where(covered, (filled[first:] / high - 1) * 100, np.nan)
+
+        drawdown = np.full((len(rows), filled.shape[1]), np.nan)
+        for c0 in range(0, filled.shape[1], DRAWDOWN_COLUMN_CHUNK):
+            columns = slice(c0, c0 + DRAWDOWN_COLUMN_CHUNK)
+            drawdown[:, columns] = _window_drawdown(filled[:, columns], np.maximum(start, 0), rows)
+        out["Max drawdown 12M"] = np.where(covered, (drawdown - 1) * 100, np.nan)
+
+    return {name: out[name].astype("float32") for name in PRICE_METRICS}
+
+
+def _checksums(closes: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    return np.nansum(closes, axis=0, dtype="float64"), np.count_nonzero(~np.isnan(closes), axis=0)
+
+
+def _extend(state: PriceMetrics, matrix: price_store.PriceMatrix, closes: np.ndarray) -> Optional[PriceMetrics]:
+    """`state` grown to the current matrix, or None when the matrix was rebuilt (full recompute)."""
+    rows, old_rows, old_n = len(matrix.dates), len(state.dates), len(state.tickers)
+    if (old_rows > rows or matrix.tickers[:old_n] != state.tickers
+            or not np.array_equal(matrix.dates[:old_rows], state.dates)):
+        return None
+    old_sums, old_counts = _checksums(closes[:old_rows, :old_n])
+    unchanged = (old_counts == state.checksums[1]) & ((old_sums == state.checksums[0]) | (old_counts == 0))
+    changed = [c for c in range(old_n) if not unchanged[c]] + list(range(old_n, len(matrix.tickers)))
+    kept = [c for c in range(old_n) if unchanged[c]]
+
+    values = {}
+    for name in PRICE_METRICS:
+        grown = np.full((rows, len(matrix.tickers)), np.nan, dtype="float32")
+        grown[:old_rows, :old_n] = state.values[name]
+        values[name] = grown
+    if changed:
+        for name, array in compute_metrics(closes[:, changed], matrix.dates).items():
+            values[name][:, changed] = array
+    if kept and rows > old_rows:
+        lo = int(np.searchsorted(matrix.dates, matrix.dates[old_rows] - np.timedelta64(_LOOKBACK_DAYS, "D")))
+        for name, array in compute_metrics(closes[lo:, kept], matrix.dates[lo:], old_rows - lo).items():
+            values[name][old_rows:, kept] = array
+    metrics.incr("price_metrics_rows_computed", rows - old_rows)
+    metrics.incr("price_metrics_columns_recomputed", len(changed))
+    return PriceMetrics(matrix.version, matrix.dates, list(matrix.tickers), values, _checksums(closes))
+
+
+def refresh(matrix: Optional[price_store.PriceMatrix] = None) -> Optional[PriceMetrics]:
+    """Metrics of the current matrix; only new rows / changed tickers are computed."""
+    global _state
+    matrix = matrix if matrix is not None else price_store.open_matrix()
+    if matrix is None:
+        return None
+    with _state_lock:
+        if _state is not None and _state.version == matrix.version:
+            return _state
+        with metrics.span("price_metrics"):
+            closes = np.asarray(matrix.values[:, :len(matrix.tickers)], dtype="float64")
+            state = _extend(_state, matrix, closes) if _state is not None else None
+            if state is None:
+                state = PriceMetrics(matrix.version, matrix.dates, list(matrix.tickers),
+                                     compute_metrics(closes, matrix.dates), _checksums(closes))
+                metrics.incr("price_metrics_rows_computed", len(matrix.dates))
+        _state = state
+        return state
+
+
+# ----------------------------- PUBLIC API -----------------------------------
+def lookup(tickers: Iterable[str], dates: Iterable, names: Optional[Iterable[str]] = None) -> pd.DataFrame:
+    """
+    Metrics as of many (ticker, date) pairs: the last trading day on or before each date
+    (NaN without a close within MAX_STALE_DAYS). One row per pair, in input order.
+    """
+    names = [n for n in (names or PRICE_METRICS) if n in PRICE_METRICS]
+    tickers = pd.Series(list(tickers), dtype="object")
+    out = pd.DataFrame(np.nan, index=range(len(tickers)), columns=names, dtype="float64")
+    state = refresh()
+    if state is None or tickers.empty or not names:
+        return out
+    days = pd.to_datetime(pd.Series(list(dates)), errors="coerce").to_numpy(dtype="datetime64[D]")
+    row = np.searchsorted(state.dates, days, side="right") - 1
+    col = tickers.map(state.column_of).to_numpy(dtype="float64")
+    ok = (row >= 0) & ~np.isnan(col) & ~np.isnat(days)
+    ok[ok] = (days[ok] - state.dates[row[ok]]) <= np.timedelta64(MAX_STALE_DAYS, "D")
+    rows_ok, cols_ok = row[ok], col[ok].astype(int)
+    for name in names:
+        values = np.full(len(tickers), np.nan)
+        values[ok] = state.values[name][rows_ok, cols_ok]
+        out[name] = np.round(values, 2)
+    return out
+
+
+def series(ticker: str, name: str, start=None, end=None) -> Tuple[np.ndarray, np.ndarray]:
+    """Daily (dates, values) of one metric of one ticker in [start, end), NaN dropped."""
+    state = refresh()
+    if state is None or ticker not in state.column_of or name not in state.values:
+        return np.array([], dtype="datetime64[ns]"), np.array([], dtype="float64")
+    lo = 0 if start is None else int(np.searchsorted(state.dates, np.datetime64(pd.Timestamp(start), "D")))
+    hi = len(state.dates) if end is None else int(np.searchsorted(state.dates, np.datetime64(pd.Timestamp(end), "D")))
+    values = state.values[name][lo:hi, state.column_of[ticker]].astype("float64")
+    keep = ~np.isnan(values)
+    return state.dates[lo:hi][keep].astype("datetime64[ns]"), values[keep]
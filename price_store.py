@@ -0,0 +1,368 @@
+"""
+Local cache of daily close prices (Yahoo Finance) for many tickers.
+
+    prices = load_price_matrix(["AAPL", "MSFT"], "2010-01-01", "2024-12-31")
+
+Returns a dates x tickers DataFrame of adjusted closes. Each ticker is cached as
+.cache_prices/<TICKER>.parquet together with the date range already requested
+(coverage.json), so a range is downloaded once even when Yahoo has no data for
+it (delisted / not yet listed). Missing ranges are fetched with batched
+downloads (data_sources: Yahoo, or recorded fixtures) instead of one request per ticker.
+
+All cached closes are also kept in one dense dates x tickers float32 matrix
+(.cache_prices/close_matrix.<generation>.f32, row-major, raw), memory-mapped
+read-only by every reader (`open_matrix`): Dash workers, backtests and
+nearest-close lookups share the OS page cache instead of each loading prices
+into its own heap. Sidecars:
+    close_dates.<generation>.i8  int64 days since epoch, one per matrix row
+    close_matrix.json            {"tickers": [...column order], "rows": n,
+                                  "capacity": c, "generation": g}
+New trading days are appended as rows (matrix and dates files grow in place);
+new tickers fill reserved columns (`capacity`). The JSON sidecar is replaced
+last, so readers only ever map fully written rows. Dates before the first row,
+unseen days in the middle or more tickers than reserved columns rebuild the
+files as the next generation (rare); mapped old generations stay readable.
+"""
+import json
+import os
+import threading
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+import data_sources
+import metrics
+from helper import file_lock
+
+PRICE_CACHE_DIR = ".cache_prices"
+COVERAGE_FILE = os.path.join(PRICE_CACHE_DIR, "coverage.json")
+DOWNLOAD_BATCH = 100   # tickers per download call
+
+MATRIX_META_FILE = os.path.join(PRICE_CACHE_DIR, "close_matrix.json")
+MATRIX_MIN_CAPACITY = 256   # columns reserved up front; doubled on rebuild when exceeded
+
+_coverage_lock = threading.Lock()
+_matrix_lock = threading.Lock()
+_matrix: Optional["PriceMatrix"] = None
+
+
+# ----------------------------- CACHE FILES ----------------------------------
+def _price_path(ticker: str) -> str:
+    return os.path.join(PRICE_CACHE_DIR, f"{ticker.replace('/', '_').replace('^', '_')}.parquet")
+
+
+def _load_coverage() -> Dict[str, List[str]]:
+    if not os.path.exists(COVERAGE_FILE):
+        return {}
+    try:
+        with open(COVERAGE_FILE, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except Exception as e:
+        print(f"[ERROR] Failed to read price coverage {COVERAGE_FILE}: {e}")
+        return {}
+
+
+def _save_coverage(coverage: Dict[str, List[str]]) -> None:
+    os.makedirs(PRICE_CACHE_DIR, exist_ok=True)
+    tmp_path = f"{COVERAGE_FILE}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(coverage, f, indent=2)
+    os.replace(tmp_path, COVERAGE_FILE)
+
+
+def load_cached_series(ticker: str) -> pd.Series:
+    path = _price_path(ticker)
+    if not os.path.exists(path):
+        return pd.Series(dtype="float64", name=ticker)
+    try:
+        frame = pd.read_parquet(path)
+        return frame["close"].rename(ticker)
+    except Exception as e:
+        print(f"[ERROR] Corrupt price cache {path}: {e}")
+        return pd.Series(dtype="float64", name=ticker)
+
+
+def _store_series(ticker: str, series: pd.Series) -> None:
+    os.makedirs(PRICE_CACHE_DIR, exist_ok=True)
+    merged = pd.concat([load_cached_series(ticker), series.dropna()])
+    merged = merged[~merged.index.duplicated(keep="last")].sort_index()
+    path = _price_path(ticker)
+    tmp_path = f"{path}.tmp"
+    merged.to_frame("close").to_parquet(tmp_path)
+    os.replace(tmp_path, path)
+
+
+# ----------------------------- DOWNLOAD -------------------------------------
+def _missing_range(coverage: Dict[str, List[str]], ticker: str, start: pd.Timestamp,
+                   end: pd.Timestamp) -> Optional[Tuple[pd.Timestamp, pd.Timestamp]]:
+    covered = coverage.get(ticker)
+    if not covered:
+        return start, end
+    c_start, c_end = pd.Timestamp(covered[0]), pd.Timestamp(covered[1])
+    if start >= c_start and end <= c_end:
+        return None
+    # One contiguous request covering both gaps keeps the coverage a single interval
+    return min(start, c_start), max(end, c_end)
+
+
+def fetch_prices(tickers: Iterable[str], start, end) -> None:
+    """Download the not yet cached parts of [start, end] for `tickers`, batched."""
+    start, end = pd.Timestamp(start).normalize(), pd.Timestamp(end).normalize()
+    with _coverage_lock:
+        coverage = _load_coverage()
+
+    # Group tickers by the range they still need, so each group is one batched call
+    groups: Dict[Tuple[pd.Timestamp, pd.Timestamp], List[str]] = {}
+    for ticker in dict.fromkeys(tickers):
+        missing = _missing_range(coverage, ticker, start, end)
+        if missing is not None:
+            groups.setdefault(missing, []).append(ticker)
+
+    for (g_start, g_end), group in groups.items():
+        for i in range(0, len(group), DOWNLOAD_BATCH):
+            batch = group[i:i + DOWNLOAD_BATCH]
+            try:
+                frame = data_sources.get_source().closes(batch, g_start, g_end + pd.Timedelta(days=1))
+            except Exception as e:
+                print(f"[ERROR] price download failed for {len(batch)} tickers: {e}")
+                continue
+            closes = {t: frame[t].dropna() for t in frame.columns}
+            for ticker in batch:
+                if ticker in closes and not closes[ticker].empty:
+                    _store_series(ticker, closes[ticker])
+            try:
+                update_matrix(closes)
+            except Exception as e:
+                # The parquet caches keep the prices; build_matrix() rebuilds the matrix from them
+                print(f"[ERROR] price matrix update failed: {e}")
+            with _coverage_lock:
+                coverage = _load_coverage()
+                for ticker in batch:
+                    coverage[ticker] = [g_start.strftime("%Y-%m-%d"), g_end.strftime("%Y-%m-%d")]
+                _save_coverage(coverage)
+            metrics.incr("prices_downloaded", len(batch))
+
+
+# ----------------------------- MEMORY-MAPPED MATRIX -------------------------
+class PriceMatrix:
+    """Read-only dates x tickers view of the memory-mapped close matrix (NaN = no close)."""
+
+    def __init__(self, values: np.ndarray, dates: np.ndarray, tickers: List[str], version: int):
+        self.values = values            # np.memmap float32 (rows, capacity), only len(tickers) columns used
+        self.dates = dates              # datetime64[D], sorted
+        self.tickers = tickers
+        self.version = version
+        self.column_of = {t: i for i, t in enumerate(tickers)}
+
+    def __contains__(self, ticker: str) -> bool:
+        return ticker in self.column_of
+
+    def _rows(self, start=None, end=None) -> Tuple[int, int]:
+        lo = 0 if start is None else int(np.searchsorted(self.dates, np.datetime64(pd.Timestamp(start), "D"), "left"))
+        hi = len(self.dates) if end is None else int(np.searchsorted(self.dates, np.datetime64(pd.Timestamp(end), "D"), "right"))
+        return lo, hi
+
+    def series(self, ticker: str, start=None, end=None) -> Tuple[np.ndarray, np.ndarray]:
+        """(dates, closes) of one ticker in [start, end]; the closes are a strided view of the map."""
+        if ticker not in self.column_of:
+            return np.array([], dtype="datetime64[D]"), np.array([], dtype="float32")
+        lo, hi = self._rows(start, end)
+        return self.dates[lo:hi], self.values[lo:hi, self.column_of[ticker]]
+
+    def nearest_close(self, ticker: str, date, window_days: int = 3) -> Tuple[Optional[float], Optional[pd.Timestamp]]:
+        """Close nearest to `date` within ±window_days (ties: the earlier day), else (None, None)."""
+        date = pd.Timestamp(date).normalize()
+        dates, closes = self.series(ticker, date - pd.Timedelta(days=window_days),
+                                    date + pd.Timedelta(days=window_days))
+        valid = ~np.isnan(closes)
+        if not valid.any():
+            return None, None
+        dates, closes = dates[valid], closes[valid]
+        pos = int(np.argmin(np.abs(dates - np.datetime64(date, "D"))))
+        return float(closes[pos]), pd.Timestamp(dates[pos])
+
+    def frame(self, tickers: Iterable[str], start=None, end=None) -> pd.DataFrame:
+        """Dates x tickers DataFrame (a copy; unknown tickers are NaN columns)."""
+        tickers = list(tickers)
+        lo, hi = self._rows(start, end)
+        out = np.full((hi - lo, len(tickers)), np.nan, dtype="float32")
+        known = [(i, self.column_of[t]) for i, t in enumerate(tickers) if t in self.column_of]
+        if known:
+            out[:, [i for i, _ in known]] = self.values[lo:hi, [c for _, c in known]]
+        return pd.DataFrame(out, index=pd.DatetimeIndex(self.dates[lo:hi].astype("datetime64[ns]")), columns=tickers)
+
+
+def _matrix_paths(generation: int) -> Tuple[str, str]:
+    return (os.path.join(PRICE_CACHE_DIR, f"close_matrix.{generation}.f32"),
+            os.path.join(PRICE_CACHE_DIR, f"close_dates.{generation}.i8"))
+
+
+def _read_matrix_meta() -> Optional[dict]:
+    if not os.path.exists(MATRIX_META_FILE):
+        return None
+    try:
+        with open(MATRIX_META_FILE, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except Exception as e:
+        print(f"[ERROR] Failed to read price matrix meta {MATRIX_META_FILE}: {e}")
+        return None
+
+
+def open_matrix() -> Optional[PriceMatrix]:
+    """The shared close matrix (re-mapped when a writer committed new rows or tickers)."""
+    global _matrix
+    try:
+        version = os.stat(MATRIX_META_FILE).st_mtime_ns
+    except OSError:
+        return None
+    with _matrix_lock:
+        if _matrix is not None and _matrix.version == version:
+            return _matrix
+    meta = _read_matrix_meta()
+    if not meta or not meta.get("rows"):
+        return None
+    rows, capacity = int(meta["rows"]), int(meta["capacity"])
+    values_path, dates_path = _matrix_paths(meta.get("generation", 0))
+    try:
+        values = np.memmap(values_path, dtype="float32", mode="r", shape=(rows, capacity))
+        dates = np.fromfile(dates_path, dtype="int64", count=rows).astype("datetime64[D]")
+    except Exception as e:
+        print(f"[ERROR] Failed to map price matrix {values_path}: {e}")
+        return None
+    matrix = PriceMatrix(values, dates, list(meta["tickers"]), version)
+    with _matrix_lock:
+        _matrix = matrix
+    metrics.incr("price_matrix_opens")
+    return matrix
+
+
+def _write_matrix_meta(tickers: List[str], rows: int, capacity: int, generation: int) -> None:
+    tmp_path = f"{MATRIX_META_FILE}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump({"tickers": tickers, "rows": rows, "capacity": capacity, "generation": generation}, f)
+    os.replace(tmp_path, MATRIX_META_FILE)
+
+
+def _rebuild_matrix(frame: pd.DataFrame, previous: Optional[dict] = None) -> None:
+    """Write `frame` (dates x tickers) as the next generation of the matrix files."""
+    frame = frame.sort_index()
+    capacity = max(MATRIX_MIN_CAPACITY, 2 * frame.shape[1])
+    data = np.full((len(frame), capacity), np.nan, dtype="float32")
+    data[:, :frame.shape[1]] = frame.to_numpy(dtype="float32")
+    days = frame.index.to_numpy(dtype="datetime64[D]").astype("int64")
+    generation = int(previous.get("generation", 0)) + 1 if previous else 0
+    values_path, dates_path = _matrix_paths(generation)
+    data.tofile(values_path)
+    days.tofile(dates_path)
+    _write_matrix_meta(list(frame.columns), len(frame), capacity, generation)
+    # Processes still mapping the old generation keep their (unlinked) pages
+    if previous:
+        for path in _matrix_paths(int(previous.get("generation", 0))):
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+    metrics.incr("price_matrix_rebuilds")
+
+
+def update_matrix(closes: Dict[str, pd.Series]) -> None:
+    """
+    Merge {ticker: close series} into the matrix: later dates are appended as rows,
+    new tickers take reserved columns, values are written in place. Writers (Dash
+    workers, backtests, downloads) are serialized by a file lock held from reading the
+    meta to committing it. Raises RuntimeError when a rebuild cannot read the current
+    matrix (rewriting it would drop its tickers).
+    """
+    closes = {t: s.dropna() for t, s in closes.items() if s is not None and not s.dropna().empty}
+    if not closes:
+        return
+    os.makedirs(PRICE_CACHE_DIR, exist_ok=True)
+    with file_lock(MATRIX_META_FILE), metrics.span("price_matrix_write"):
+        meta = _read_matrix_meta()
+        new_days = np.unique(np.concatenate([s.index.to_numpy(dtype="datetime64[D]") for s in closes.values()]))
+        if not meta or not meta.get("rows"):
+            _rebuild_matrix(pd.DataFrame(closes))
+            return
+
+        tickers, rows, capacity = list(meta["tickers"]), int(meta["rows"]), int(meta["capacity"])
+        generation = int(meta.get("generation", 0))
+        values_path, dates_path = _matrix_paths(generation)
+        days = np.fromfile(dates_path, dtype="int64", count=rows).astype("datetime64[D]")
+        added = [t for t in closes if t not in tickers]
+        appended = new_days[new_days > days[-1]]
+        inside = new_days[new_days <= days[-1]]
+        if (len(tickers) + len(added) > capacity or (len(inside) and inside[0] < days[0])
+                or not np.isin(inside, days).all()):
+            # Earlier history, unseen trading days in the middle or no free columns: rewrite
+            current = open_matrix()
+            if current is None:
+                raise RuntimeError(f"Price matrix {values_path} is not readable; refusing to rebuild without it")
+            frame = current.frame(tickers).astype("float64")
+            update = pd.DataFrame(closes)
+            _rebuild_matrix(update.combine_first(frame).reindex(columns=tickers + added), meta)
+            return
+
+        if len(appended):
+            with open(values_path, "ab") as f:
+                f.truncate(rows * capacity * 4)   # drop rows of an interrupted append
+                np.full((len(appended), capacity), np.nan, dtype="float32").tofile(f)
+            with open(dates_path, "ab") as f:
+                f.truncate(rows * 8)
+                appended.astype("int64").tofile(f)
+        all_days = np.concatenate([days, appended])
+        values = np.memmap(values_path, dtype="float32", mode="r+", shape=(len(all_days), capacity))
+        tickers = tickers + added
+        for ticker, series in closes.items():
+            rows_of = np.searchsorted(all_days, series.index.to_numpy(dtype="datetime64[D]"))
+            values[rows_of, tickers.index(ticker)] = series.to_numpy(dtype="float32")
+        values.flush()
+        del values
+        # Commit: readers map the new rows / tickers from here on
+        _write_matrix_meta(tickers, len(all_days), capacity, generation)
+        metrics.incr("price_matrix_rows_appended", len(appended))
+
+
+def build_matrix(tickers: Optional[Iterable[str]] = None) -> Optional[PriceMatrix]:
+    """(Re)build the matrix from the per-ticker parquet caches (default: all cached tickers)."""
+    if tickers is None:
+        tickers = [f[:-len(".parquet")] for f in sorted(os.listdir(PRICE_CACHE_DIR))
+                   if f.endswith(".parquet")] if os.path.isdir(PRICE_CACHE_DIR) else []
+    closes = {t: load_cached_series(t) for t in tickers}
+    closes = {t: s for t, s in closes.items() if not s.empty}
+    if closes:
+        os.makedirs(PRICE_CACHE_DIR, exist_ok=True)
+        with file_lock(MATRIX_META_FILE):
+            _rebuild_matrix(pd.DataFrame(closes), _read_matrix_meta())
+    return open_matrix()
+
+
+def nearest_close(ticker: str, date, window_days: int = 3) -> Tuple[Optional[float], Optional[pd.Timestamp]]:
+    """Close nearest to `date` from the matrix ((None, None) if not cached there)."""
+    matrix = open_matrix()
+    if matrix is None:
+        return None, None
+    price, day = matrix.nearest_close(ticker, date, window_days)
+    metrics.incr("price_matrix_hits" if price is not None else "price_matrix_misses")
+    return price, day
+
+
+# ----------------------------- PUBLIC API -----------------------------------
+def load_price_matrix(tickers: Iterable[str], start, end, fetch_missing: bool = True) -> pd.DataFrame:
+    """Dates x tickers close matrix for [start, end] (NaN where a ticker has no price), float32."""
+    tickers = list(dict.fromkeys(tickers))
+    if fetch_missing:
+        fetch_prices(tickers, start, end)
+    matrix = open_matrix()
+    # Tickers cached before the matrix existed are moved into it once
+    unmapped = [t for t in tickers if (matrix is None or t not in matrix) and os.path.exists(_price_path(t))]
+    if unmapped:
+        try:
+            update_matrix({t: load_cached_series(t) for t in unmapped})
+        except Exception as e:
+            print(f"[ERROR] price matrix update failed: {e}")
+        matrix = open_matrix()
+    if matrix is None:
+        return pd.DataFrame(columns=tickers, dtype="float32")
+    frame = matrix.frame(tickers, start, end)
+    # Rows where none of the requested tickers traded (other exchanges' days) are dropped
+    return frame[frame.notna().any(axis=1)]
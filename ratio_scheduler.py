@@ -0,0 +1,108 @@
+"""
+Batched recomputation of stored ratios when their inputs change.
+
+Ratios declare the inputs they read (indicators.RATIOS: 'base' codes and/or the
+filing price, PRICE_INPUT). Writers of an input mark the change instead of
+patching the JSON themselves:
+
+    scheduler = RecomputeScheduler()
+    scheduler.mark("AAPL", path, {"yf_value": 171.2, "yf_value_date": "2024-03-28"})
+    ...
+    scheduler.flush()
+
+`flush` works ticker by ticker: each marked filing is read once, values that did
+not actually change are dropped, only the ratios depending on the changed inputs
+are re-evaluated (a new price: P/E, P/FCF, P/CF) and the JSON is written once.
+Price-dependent derived values (P/E (TTM)) are refreshed with one series update
+per ticker (derived_metrics.update_prices). Changed 'base' values also refresh
+the TTM / YoY series of that filing (derived_metrics.update_filing).
+"""
+import os
+import threading
+from typing import Any, Dict, Optional, Tuple
+
+import derived_metrics
+import metrics
+from helper import read_json, write_json
+from indicators import PRICE_INPUT, evaluate_ratios, ratios_depending_on
+
+# file path -> (ticker, top-level JSON updates, 'base' updates)
+_Pending = Dict[str, Tuple[str, Dict[str, Any], Dict[str, Any]]]
+
+
+class RecomputeScheduler:
+    """Collects input changes per filing; `flush` applies them and recomputes what depends on them."""
+
+    def __init__(self):
+        self._pending: _Pending = {}
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._pending)
+
+    def mark(self, ticker: str, file_path: str, updates: Optional[Dict[str, Any]] = None,
+             base: Optional[Dict[str, Any]] = None) -> None:
+        """New top-level values (e.g. yf_value) and/or 'base' values of one filing."""
+        with self._lock:
+            _, pending_updates, pending_base = self._pending.setdefault(file_path, (ticker, {}, {}))
+            pending_updates.update(updates or {})
+            pending_base.update(base or {})
+
+    def flush(self) -> int:
+        """Apply all pending changes. Returns the number of filings rewritten."""
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        by_ticker: Dict[str, _Pending] = {}
+        for file_path, item in pending.items():
+            by_ticker.setdefault(item[0], {})[file_path] = item
+
+        written = 0
+        with metrics.span("ratio_recompute"):
+            for ticker, items in by_ticker.items():
+                written += self._flush_ticker(ticker, items)
+        return written
+
+    def _flush_ticker(self, ticker: str, items: _Pending) -> int:
+        changed_docs: Dict[str, dict] = {}
+        base_changed = []
+        prices: Dict[str, Optional[float]] = {}
+        paths_by_date: Dict[str, str] = {}
+
+        for file_path, (_, updates, base_updates) in items.items():
+            data = read_json(file_path) if os.path.exists(file_path) else None
+            if data is None:
+                continue
+            base = data.get("base") or {}
+            inputs = {k for k, v in updates.items() if data.get(k) != v}
+            inputs |= {k for k, v in base_updates.items() if base.get(k) != v}
+            if not inputs:
+                metrics.incr("ratio_recompute_unchanged")
+                continue
+
+            data.update(updates)
+            base.update(base_updates)
+            data["base"] = base
+            names = ratios_depending_on(inputs)
+            computed = data.get("computed") or {}
+            computed.update(evaluate_ratios(base, data.get(PRICE_INPUT), names))
+            data["computed"] = computed
+            metrics.incr("ratios_recomputed", len(names))
+
+            changed_docs[file_path] = data
+            if inputs - {PRICE_INPUT, "yf_value_date"}:
+                base_changed.append(file_path)
+            elif PRICE_INPUT in inputs and data.get("date"):
+                prices[str(data["date"])] = data.get(PRICE_INPUT)
+                paths_by_date[str(data["date"])] = file_path
+
+        # P/E (TTM) of all repriced filings of the ticker: one series update
+        for date, values in derived_metrics.update_prices(ticker, prices).items():
+            computed = changed_docs[paths_by_date[date]].setdefault("computed", {})
+            computed.update(values)
+
+        for file_path, data in changed_docs.items():
+            write_json(file_path, data)
+        # New fundamentals: TTM / YoY of this filing and the later ones depending on it
+        for file_path in base_changed:
+            derived_metrics.update_filing(ticker, file_path, changed_docs[file_path])
+        return len(changed_docs)
@@ -0,0 +1,147 @@
+"""
+Graph-ready time series per (ticker, variable).
+
+Reading a ticker means one pass over its JSON filings that extracts every graph
+variable at once into NumPy arrays sorted by report date:
+    dates  datetime64[ns], shape (n,)
+    values {variable: float64 array (NaN = missing)}
+Entries are keyed by a cheap signature of the ticker folder (file count and
+newest mtime, via os.scandir - no JSON parsing), so any new or rewritten filing
+of that ticker invalidates just that ticker. Date ranges are then sliced with
+np.searchsorted instead of filtering filings one by one.
+"""
+import os
+import threading
+from collections import OrderedDict
+from typing import Callable, Dict, Iterable, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+import helper
+import metrics
+
+JSON_DIR = "xbrl_data_json"
+MAX_CACHED_TICKERS = 2000
+
+
+class TickerSeries:
+    __slots__ = ("signature", "dates", "values")
+
+    def __init__(self, signature, dates: np.ndarray, values: Dict[str, np.ndarray]):
+        self.signature = signature
+        self.dates = dates
+        self.values = values
+
+    def year_counts(self) -> Dict[int, int]:
+        years, counts = np.unique(self.dates.astype("datetime64[Y]").astype(int) + 1970, return_counts=True)
+        return dict(zip(years.tolist(), counts.tolist()))
+
+    def slice(self, variable: str, start=None, end=None, dropna: bool = True) -> Tuple[np.ndarray, np.ndarray]:
+        """(dates, values) of one variable within [start, end), sorted by date."""
+        if variable not in self.values:
+            return np.array([], dtype="datetime64[ns]"), np.array([], dtype="float64")
+        lo = 0 if start is None else np.searchsorted(self.dates, np.datetime64(start, "ns"), side="left")
+        hi = len(self.dates) if end is None else np.searchsorted(self.dates, np.datetime64(end, "ns"), side="left")
+        dates, values = self.dates[lo:hi], self.values[variable][lo:hi]
+        if dropna:
+            keep = ~np.isnan(values)
+            dates, values = dates[keep], values[keep]
+        return dates, values
+
+
+class SeriesCache:
+    """
+    LRU cache of TickerSeries.
+
+    `extract_fn(json_data, variable, report_date)` returns the value of `variable` in
+    one filing (or None); it is only called while (re)building a ticker.
+    """
+
+    def __init__(self, variables: Iterable[str], extract_fn: Callable, json_dir: str = JSON_DIR,
+                 max_tickers: int = MAX_CACHED_TICKERS, read_json: Optional[Callable] = None):
+        self.variables = list(variables)
+        self.extract_fn = extract_fn
+        self.json_dir = json_dir
+        self.max_tickers = max_tickers
+        self.read_json = read_json or helper.read_json
+        self._entries: "OrderedDict[str, TickerSeries]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _folder(self, ticker: str) -> str:
+        return os.path.join(self.json_dir, ticker)
+
+    def _signature(self, ticker: str) -> Optional[Tuple[int, int]]:
+        folder = self._folder(ticker)
+        if not os.path.isdir(folder):
+            return None
+        count, newest = 0, 0
+        with os.scandir(folder) as it:
+            for entry in it:
+                if entry.name.endswith(".json"):
+                    count += 1
+                    newest = max(newest, entry.stat().st_mtime_ns)
+        return count, newest
+
+    def _build(self, ticker: str, signature) -> TickerSeries:
+        folder = self._folder(ticker)
+        rows = []
+        with metrics.span("series_build"):
+            for file in os.listdir(folder):
+                if not file.endswith(".json"):
+                    continue
+                data = self.read_json(os.path.join(folder, file))
+                if not data or not data.get("date"):
+                    continue
+                report_date = pd.to_datetime(data["date"], errors="coerce")
+                if pd.isna(report_date):
+                    continue
+                report_date = report_date.normalize()
+                values = []
+                for variable in self.variables:
+                    try:
+                        value = self.extract_fn(data, variable, report_date)
+                        values.append(float(value) if value is not None else np.nan)
+                    except Exception:
+                        values.append(np.nan)
+                rows.append((report_date.to_datetime64(), values))
+
+            rows.sort(key=lambda r: r[0])
+            dates = np.array([r[0] for r in rows], dtype="datetime64[ns]")
+            matrix = np.array([r[1] for r in rows], dtype="float64").reshape(len(rows), len(self.variables))
+        return TickerSeries(signature, dates, {v: matrix[:, i] for i, v in enumerate(self.variables)})
+
+    def get(self, ticker: str) -> Optional[TickerSeries]:
+        """Series of a ticker, rebuilt only if its folder changed since the last call."""
+        signature = self._signature(ticker)
+        if signature is None:
+            return None
+        with self._lock:
+            entry = self._entries.get(ticker)
+            if entry is not None and entry.signature == signature:
+                self._entries.move_to_end(ticker)
+                metrics.incr("series_cache_hits")
+                return entry
+        metrics.incr("series_cache_misses")
+        entry = self._build(ticker, signature)
+        with self._lock:
+            self._entries[ticker] = entry
+            self._entries.move_to_end(ticker)
+            while len(self._entries) > self.max_tickers:
+                self._entries.popitem(last=False)
+        return entry
+
+    def series(self, ticker: str, variable: str, start=None, end=None,
+               dropna: bool = True) -> Tuple[np.ndarray, np.ndarray]:
+        """(dates, values) of one variable within [start, end), sorted by date."""
+        entry = self.get(ticker)
+        if entry is None:
+            return np.array([], dtype="datetime64[ns]"), np.array([], dtype="float64")
+        return entry.slice(variable, start, end, dropna)
+
+    def invalidate(self, ticker: Optional[str] = None) -> None:
+        with self._lock:
+            if ticker is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(ticker, None)
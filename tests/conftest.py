@@ -0,0 +1,24 @@
+"""
+Test setup: the modules under test read and write their caches relative to the
+working directory and fetch the SEC company list at import time, so the tests run
+in a scratch directory against a replay data source (no network).
+"""
+import json
+import os
+import sys
+import tempfile
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_DIR)
+
+TEST_COMPANIES = {"0": {"cik_str": 1, "ticker": "AAA", "title": "Aaa Inc"}}
+
+
+def pytest_configure(config):
+    import data_sources
+
+    workdir = tempfile.mkdtemp(prefix="screener_tests_")
+    os.chdir(workdir)
+    fixtures_dir = os.path.join(workdir, "fixtures")
+    data_sources.FixtureStore(fixtures_dir).save_text(data_sources.SEC_TICKERS_URL, json.dumps(TEST_COMPANIES))
+    data_sources.set_source(data_sources.ReplaySource(fixtures_dir))
@@ -0,0 +1,54 @@
+import numpy as np
+import pandas as pd
+
+import backtest
+
+DAYS = pd.bdate_range("2024-01-01", "2024-12-31")
+
+
+def _prices(delisted_after=None):
+    prices = pd.DataFrame({"AAA": np.linspace(100.0, 200.0, len(DAYS)), "BBB": 50.0}, index=DAYS)
+    if delisted_after is not None:
+        prices.loc[prices.index > pd.Timestamp(delisted_after), "BBB"] = np.nan
+    return prices
+
+
+def _panel(rows):
+    panel = pd.DataFrame(rows, columns=["Ticker", "Date", "Available", "ROE"])
+    panel[["Date", "Available"]] = panel[["Date", "Available"]].apply(pd.to_datetime)
+    return panel
+
+
+def _positive_roe(snapshot):
+    return snapshot.loc[snapshot["ROE"] > 0, "Ticker"]
+
+
+def test_filing_published_on_rebalance_date_is_not_used():
+    dates = backtest.rebalance_schedule("2024-01-01", "2024-12-31", "Q", DAYS)
+    panel = _panel([
+        ("AAA", "2023-09-30", "2023-11-01", -1.0),
+        ("AAA", "2023-12-31", dates[1], 1.0),  # published on the rebalance date itself
+        ("BBB", "2023-12-31", "2024-02-01", 1.0),
+    ])
+
+    snapshots = backtest.point_in_time_snapshots(panel, dates)
+    aaa = snapshots[snapshots["Ticker"] == "AAA"].set_index("Rebalance")["ROE"]
+    assert aaa[dates[1]] == -1.0
+    assert aaa[dates[2]] == 1.0
+
+    result = backtest.run_backtest(_positive_roe, "2024-01-01", "2024-12-31", panel=panel, prices=_prices())
+    assert list(result["returns"]["holdings"][:3]) == [1, 1, 2]
+
+
+def test_delisted_name_drops_out_instead_of_holding_last_close():
+    panel = _panel([("AAA", "2023-12-31", "2024-01-15", 1.0), ("BBB", "2023-12-31", "2024-01-15", 1.0)])
+    prices = _prices(delisted_after="2024-05-15")
+
+    result = backtest.run_backtest(_positive_roe, "2024-01-01", "2024-12-31", freq="M", panel=panel, prices=prices)
+    returns = result["returns"]
+    aaa = prices["AAA"]
+    march, april, may = returns.index[2:5]
+    # Both held while BBB trades (flat); over its delisting AAA alone, not BBB's last close
+    assert returns.loc[march, "portfolio"] == (aaa[april] / aaa[march] - 1) / 2
+    assert returns.loc[april, "portfolio"] == aaa[may] / aaa[april] - 1
+    assert returns.loc[april, "universe"] == returns.loc[april, "portfolio"]
@@ -0,0 +1,44 @@
+import pandas as pd
+
+from cross_section import PERIOD_COL, CrossSectionStats, compute_cross_section
+
+VARIABLES = ["ROE", "P/E"]
+
+
+def _summary():
+    dates = ["2024-03-31", "2024-06-30", "2024-09-30"]
+    rows = [(f"{cik:010d}", date, 0.01 * cik + i, 10.0 + cik * (i + 1), "Tech" if cik % 2 else "Energy")
+            for i, date in enumerate(dates) for cik in range(1, 6)]
+    return pd.DataFrame(rows, columns=["CIK", "Date", "ROE", "P/E", "Sector"])
+
+
+def _assert_matches_full(stats, df):
+    pd.testing.assert_frame_equal(stats.drop(columns=PERIOD_COL), compute_cross_section(df, VARIABLES),
+                                  check_like=True)
+
+
+def test_only_changed_period_is_recomputed():
+    df = _summary()
+    cross = CrossSectionStats()
+    cross.update(df, VARIABLES)
+    assert cross.last_recomputed == 3 * len(VARIABLES)
+
+    cross.update(df, VARIABLES)
+    assert cross.last_recomputed == 0
+
+    df.loc[(df["Date"] == "2024-06-30") & (df["CIK"] == f"{3:010d}"), "ROE"] = 9.0
+    stats = cross.update(df, VARIABLES)
+    assert cross.last_recomputed == 1
+    _assert_matches_full(stats, df)
+
+
+def test_new_and_removed_rows_match_full_computation():
+    df = _summary()
+    cross = CrossSectionStats()
+    cross.update(df, VARIABLES)
+
+    new_filing = pd.DataFrame([(f"{9:010d}", "2024-09-30", 5.0, 3.0, "Tech")], columns=df.columns)
+    df = pd.concat([df[df["Date"] != "2024-03-31"], new_filing], ignore_index=True)
+    stats = cross.update(df, VARIABLES)
+    assert cross.last_recomputed == len(VARIABLES)  # only 2024Q3 gained a row; 2024Q1 is dropped
+    _assert_matches_full(stats, df)
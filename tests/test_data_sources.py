@@ -0,0 +1,51 @@
+import pandas as pd
+import pytest
+
+import data_sources
+
+
+class FakeLive(data_sources.DataSource):
+    def filings(self, cik, forms, start, end):
+        return []
+
+    def xbrl(self, filing):
+        return {"instance": "<xbrl/>"}
+
+    def closes(self, tickers, start, end):
+        index = pd.date_range("2024-01-02", periods=3, freq="B")
+        return pd.DataFrame({t: [1.0, 2.0, 3.0] for t in tickers}, index=index)
+
+    def get_text(self, url, headers=None, conditional=False):
+        return "text"
+
+
+def test_data_source_is_abstract():
+    with pytest.raises(TypeError):
+        data_sources.DataSource()
+
+    class Partial(data_sources.DataSource):
+        def closes(self, tickers, start, end):
+            return pd.DataFrame()
+
+    with pytest.raises(TypeError):
+        Partial()
+
+
+def test_recorded_answers_replay(tmp_path):
+    recording = data_sources.RecordingSource(str(tmp_path), live=FakeLive())
+    frame = recording.closes(["AAA", "BBB"], "2024-01-01", "2024-01-31")
+    assert recording.get_text("https://example.com/list") == "text"
+
+    replay = data_sources.ReplaySource(str(tmp_path), strict=True)
+    pd.testing.assert_frame_equal(replay.closes(["AAA", "BBB"], "2024-01-01", "2024-01-31"), frame, check_freq=False)
+    assert replay.get_text("https://example.com/list") == "text"
+
+
+def test_failed_fixture_write_still_returns_live_answer(tmp_path):
+    blocked = tmp_path / "blocked"
+    blocked.write_text("a file where the fixture directory should be")
+    recording = data_sources.RecordingSource(str(blocked), live=FakeLive())
+
+    frame = recording.closes(["AAA"], "2024-01-01", "2024-01-31")
+    assert list(frame.columns) == ["AAA"] and len(frame) == 3
+    assert recording.get_text("https://example.com/list") == "text"
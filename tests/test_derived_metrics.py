@@ -0,0 +1,103 @@
+import json
+import os
+
+import pytest
+
+import derived_metrics
+
+NI, REVENUE, CFO, CAPEX = ("us-gaap_NetIncomeLoss", "us-gaap_Revenues",
+                           "us-gaap_NetCashProvidedByUsedInOperatingActivities",
+                           "us-gaap_PaymentsToAcquirePropertyPlantAndEquipment")
+DILUTED, BASIC = ("us-gaap_WeightedAverageNumberOfDilutedSharesOutstanding",
+                  "us-gaap_WeightedAverageNumberOfSharesOutstandingBasic")
+QUARTER_ENDS = ("03-31", "06-30", "09-30", "12-31")
+
+
+@pytest.fixture(autouse=True)
+def scratch(monkeypatch, tmp_path):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(derived_metrics, "_series_cache", {})
+    monkeypatch.setattr(derived_metrics, "_ticker_locks", {})
+
+
+def _filings(years):
+    """
+    {report date: filing JSON} of a ticker earning `years[year]` net income per quarter
+    (revenue 10x that); cash flows are year-to-date like in real 10-Qs.
+    """
+    docs = {}
+    for year, quarterly in years.items():
+        for q, end in enumerate(QUARTER_ENDS, start=1):
+            date = f"{year}-{end}"
+            ytd = quarterly if q < 4 else 4 * quarterly  # 10-Q: the quarter; 10-K: the full year
+            docs[date] = {
+                "date": date,
+                "form": "10-K" if q == 4 else "10-Q",
+                "yf_value": 10.0,
+                "base": {NI: ytd, REVENUE: 10 * ytd, CFO: 2 * quarterly * q, CAPEX: quarterly * q / 2,
+                         DILUTED: 100.0},
+            }
+    return docs
+
+
+def _save(date, doc):
+    path = os.path.join(derived_metrics.JSON_DIR, "AAA", f"AAA_{date}.json")
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(doc, f)
+    return path
+
+
+def _computed(date):
+    with open(os.path.join(derived_metrics.JSON_DIR, "AAA", f"AAA_{date}.json"), encoding="utf-8") as f:
+        return json.load(f)["computed"]
+
+
+def test_ttm_rolls_over_quarters_and_fiscal_years():
+    for date, doc in _filings({2022: 10.0, 2023: 10.0, 2024: 15.0}).items():
+        derived_metrics.update_filing("AAA", _save(date, doc))
+
+    assert _computed("2022-09-30")["TTM Net Income"] is None  # fewer than four quarters
+    year_end = _computed("2023-12-31")
+    assert year_end["TTM Net Income"] == 40.0  # Q4 = FY - Q1..Q3
+    assert year_end["TTM Revenue"] == 400.0
+    assert year_end["TTM Operating Cash Flow"] == 80.0  # quarters from year-to-date differences
+    assert year_end["TTM FCF"] == 60.0
+    assert year_end["P/E (TTM)"] == 10.0 * 100.0 / 40.0
+    assert _computed("2024-03-31")["TTM Net Income"] == 45.0  # three 2023 quarters + Q1 2024
+    assert _computed("2024-12-31")["Net Income YoY"] == pytest.approx(50.0)
+    assert _computed("2024-12-31")["Revenue YoY"] == pytest.approx(50.0)
+
+
+def test_late_filing_refreshes_later_derived_values():
+    docs = _filings({2022: 10.0, 2023: 10.0, 2024: 15.0})
+    late = "2023-06-30"
+    for date, doc in docs.items():
+        if date != late:
+            derived_metrics.update_filing("AAA", _save(date, doc))
+    assert _computed("2023-12-31")["TTM Net Income"] is None
+
+    derived_metrics.update_filing("AAA", _save(late, docs[late]))
+
+    incremental = {date: _computed(date) for date in docs}
+    derived_metrics.rebuild_ticker("AAA")
+    assert incremental == {date: _computed(date) for date in docs}
+    assert incremental["2023-12-31"]["TTM Net Income"] == 40.0
+    assert not [f for f in os.listdir(os.path.join(derived_metrics.JSON_DIR, "AAA")) if f.endswith(".tmp")]
+
+
+def test_price_update_reprices_from_stored_ttm():
+    for date, doc in _filings({2023: 10.0}).items():
+        derived_metrics.update_filing("AAA", _save(date, doc))
+
+    assert derived_metrics.update_prices("AAA", {"2023-12-31": 20.0, "2030-01-01": 1.0}) == {
+        "2023-12-31": {"P/E (TTM)": 20.0 * 100.0 / 40.0}}
+    derived_metrics._series_cache.clear()
+    assert derived_metrics.load_series("AAA")[-1]["price"] == 20.0
+
+
+def test_reported_zero_diluted_shares_is_not_missing():
+    entry = derived_metrics._entry_from_json({"date": "2023-12-31", "base": {DILUTED: 0, BASIC: 50.0}}, "x.json")
+    assert entry["shares"] == 0.0
+    entry = derived_metrics._entry_from_json({"date": "2023-12-31", "base": {BASIC: 50.0}}, "x.json")
+    assert entry["shares"] == 50.0
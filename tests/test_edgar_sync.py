@@ -0,0 +1,124 @@
+import functools
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from types import SimpleNamespace
+
+import pytest
+import requests
+
+import data_sources
+import edgar_sync
+import info_picker_2
+from ingest_pipeline import IngestPipeline
+
+COMPANY = SimpleNamespace(ticker="AAA", cik=1, title="Aaa Inc")
+
+FILINGS = [
+    ("0000000001-24-000001", "2024-01-10", "2023-12-31"),
+    ("0000000001-24-000002", "2024-04-10", "2024-03-31"),
+    ("0000000001-24-000003", "2024-07-10", "2024-06-30"),
+]
+
+
+def _submissions(filings):
+    return {"filings": {"recent": {
+        "accessionNumber": [f[0] for f in filings],
+        "filingDate": [f[1] for f in filings],
+        "reportDate": [f[2] for f in filings],
+        "form": ["10-Q"] * len(filings),
+        "isXBRL": [1] * len(filings),
+    }}}
+
+
+@pytest.fixture
+def submissions_server():
+    """Serves /submissions/CIK##########.json from `server.submissions` (cik -> JSON)."""
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            cik = int(self.path.rsplit("CIK", 1)[-1].split(".")[0])
+            body = json.dumps(self.server.submissions.get(cik, {})).encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    server.submissions = {}
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def ingest(monkeypatch, tmp_path):
+    """Inline parsing; ingest_financials only records the accession in the filing index."""
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(edgar_sync, "IngestPipeline", functools.partial(IngestPipeline, parse_workers=0))
+    monkeypatch.setattr(edgar_sync, "parse_statements", lambda raw: {"facts": raw})
+
+    def ingest_financials(company, statements, meta, filing_index, mapping_variables=None):
+        filing_index[meta["accession_no"]] = {"filing_date": meta["filing_date"], "form": meta["form"]}
+        return meta["accession_no"]
+
+    monkeypatch.setattr(info_picker_2, "ingest_financials", ingest_financials)
+
+
+def _client(server, failing):
+    client = edgar_sync.EdgarSubmissionsClient(
+        base_url=f"http://127.0.0.1:{server.server_port}", session=requests.Session(),
+        rate_limiter=edgar_sync.RateLimiter(0))
+    client.fetch_raw_xbrl = lambda company, meta: (
+        None if meta["accession_no"] in failing else {"instance": meta["accession_no"]})
+    return client
+
+
+def test_mark_stops_before_failed_filing_and_retries_it(submissions_server, ingest):
+    submissions_server.submissions[1] = _submissions(FILINGS)
+    mark = {"last_filing_date": "2024-01-01", "last_accession": None}
+
+    mark = edgar_sync.sync_company(COMPANY, _client(submissions_server, failing={FILINGS[1][0]}), mark)
+    assert mark["last_accession"] == FILINGS[0][0]
+    assert mark["last_filing_date"] == FILINGS[0][1]
+    assert set(info_picker_2.load_filing_index("AAA")) == {FILINGS[0][0], FILINGS[2][0]}
+
+    # Next run: the failed filing is picked up again, the mark reaches the newest one
+    mark = edgar_sync.sync_company(COMPANY, _client(submissions_server, failing=set()), mark)
+    assert mark["last_accession"] == FILINGS[2][0]
+    assert set(info_picker_2.load_filing_index("AAA")) == {f[0] for f in FILINGS}
+
+
+def test_unparsable_report_date_falls_back_to_filing_date(submissions_server, ingest):
+    filings = [FILINGS[0], (FILINGS[1][0], FILINGS[1][1], "not-a-date"), FILINGS[2]]
+    submissions_server.submissions[1] = _submissions(filings)
+
+    mark = edgar_sync.sync_company(COMPANY, _client(submissions_server, failing=set()),
+                                   {"last_filing_date": "2024-01-01"})
+    assert mark["last_accession"] == FILINGS[2][0]
+    assert set(info_picker_2.load_filing_index("AAA")) == {f[0] for f in FILINGS}
+
+
+def test_nothing_ingested_keeps_mark(submissions_server, ingest):
+    submissions_server.submissions[1] = _submissions(FILINGS)
+    mark = {"last_filing_date": "2024-01-01", "last_accession": None}
+
+    failing = {f[0] for f in FILINGS}
+    assert edgar_sync.sync_company(COMPANY, _client(submissions_server, failing), mark) is mark
+
+
+def test_submissions_without_session_come_from_data_source(monkeypatch, tmp_path):
+    url = f"{edgar_sync.SEC_SUBMISSIONS_URL.rstrip('/')}/submissions/CIK{1:010d}.json"
+    data_sources.FixtureStore(str(tmp_path)).save_text(url, json.dumps(_submissions(FILINGS)))
+    monkeypatch.setattr(data_sources, "_source", data_sources.ReplaySource(str(tmp_path), strict=True))
+
+    client = edgar_sync.EdgarSubmissionsClient(rate_limiter=edgar_sync.RateLimiter(0))
+    filings = client.list_filings(1)
+    assert [f["accession_no"] for f in filings] == [f[0] for f in FILINGS]
+    assert filings[0]["report_date"] == FILINGS[0][2]
@@ -0,0 +1,136 @@
+import os
+import subprocess
+import sys
+import threading
+
+import pandas as pd
+import pytest
+
+import fact_store
+
+
+@pytest.fixture(autouse=True)
+def scratch(monkeypatch, tmp_path):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(fact_store, "_tables", {})
+
+
+def _balance(concept: str, period_end: str, value: float) -> pd.DataFrame:
+    return pd.DataFrame({
+        "concept": [concept],
+        "period_start": [pd.NaT],
+        "period_end": [pd.Timestamp(period_end)],
+        "duration": ["instant"],
+        "value": [value],
+        "units": ["USD"],
+    })
+
+
+def test_concurrent_filings_keep_all_facts():
+    def add(i):
+        fact_store.add_filing_facts("AAA", _balance(f"Concept{i}", "2024-03-31", float(i)),
+                                    accession_no=f"acc-{i}", filed="2024-05-01", form="10-Q", cik="1")
+
+    threads = [threading.Thread(target=add, args=(i,)) for i in range(16)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    fact_store._tables.clear()
+    assert sorted(fact_store.load_facts("AAA")["concept"]) == sorted(f"Concept{i}" for i in range(16))
+
+
+def test_table_written_by_another_process_is_reloaded():
+    fact_store.add_filing_facts("AAA", _balance("Assets", "2024-03-31", 1.0),
+                                accession_no="acc-1", filed="2024-05-01", form="10-Q", cik="1")
+    assert len(fact_store.load_facts("AAA")) == 1
+
+    script = (
+        "import sys, pandas as pd; sys.path.insert(0, sys.argv[1]); import fact_store;"
+        "fact_store.add_filing_facts('AAA', pd.DataFrame({'concept': ['Cash'], 'period_start': [pd.NaT],"
+        " 'period_end': [pd.Timestamp('2024-03-31')], 'duration': ['instant'], 'value': [2.0],"
+        " 'units': ['USD']}), accession_no='acc-2', filed='2024-05-01', form='10-Q', cik='1')"
+    )
+    repo_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    subprocess.run([sys.executable, "-c", script, repo_dir], check=True)
+
+    assert sorted(fact_store.load_facts("AAA")["concept"]) == ["Assets", "Cash"]
+
+
+def _flows(concept: str, rows) -> pd.DataFrame:
+    starts = pd.Series([pd.Timestamp(start) for start, _, _ in rows])
+    ends = pd.Series([pd.Timestamp(end) for _, end, _ in rows])
+    return pd.DataFrame({
+        "concept": [concept] * len(rows),
+        "period_start": starts,
+        "period_end": ends,
+        "duration": fact_store.duration_label(starts, ends),
+        "value": [value for _, _, value in rows],
+        "units": ["USD"] * len(rows),
+    })
+
+
+def test_latest_filed_value_wins():
+    def add(value, accession_no, filed):
+        fact_store.add_filing_facts("AAA", _balance("Assets", "2023-12-31", value),
+                                    accession_no=accession_no, filed=filed, form="10-K", cik="1")
+
+    add(1.0, "acc-original", "2024-02-01")
+    add(2.0, "acc-restated", "2025-02-01")
+    add(3.0, "acc-older", "2023-11-01")  # merged later, filed earlier: not a restatement
+
+    facts = fact_store.load_facts("AAA")
+    assert len(facts) == 1
+    assert facts.iloc[0]["value"] == 2.0
+    assert facts.iloc[0]["accession_no"] == "acc-restated"
+
+
+def test_facts_from_statements_keeps_comparative_periods():
+    statements = {
+        "income": {
+            "concept": {"0": "us-gaap_NetIncomeLoss"},
+            "units": {"0": "USD"},
+            "Mar 31, 2024": {"0": 10.0},
+            "Mar 31, 2023": {"0": 8.0},
+        },
+        "balance_sheet": {
+            "concept": {"0": "us-gaap_Assets"},
+            "Mar 31, 2024": {"0": 500.0},
+            "Dec 31, 2023": {"0": 450.0},
+        },
+    }
+    facts = fact_store.facts_from_statements(statements, "2024-03-31", "10-Q")
+    facts = facts.set_index(["concept", "period_end"])
+
+    income = facts.loc["us-gaap_NetIncomeLoss"]
+    assert income.loc[pd.Timestamp("2023-03-31"), "value"] == 8.0
+    assert set(income["duration"]) == {"3 months"}
+    assert income.loc[pd.Timestamp("2024-03-31"), "period_start"] == pd.Timestamp("2024-01-01")
+    assets = facts.loc["us-gaap_Assets"]
+    assert assets.loc[pd.Timestamp("2023-12-31"), "value"] == 450.0
+    assert set(assets["duration"]) == {"instant"}
+
+
+def test_q4_is_derived_from_fiscal_year_and_three_quarters():
+    fact_store.add_filing_facts("AAA", _flows("us-gaap_NetIncomeLoss", [
+        ("2023-01-01", "2023-03-31", 10.0),
+        ("2023-04-01", "2023-06-30", 20.0),
+        ("2023-07-01", "2023-09-30", 30.0),
+    ]), accession_no="acc-q3", filed="2023-11-01", form="10-Q", cik="1")
+    fact_store.add_filing_facts("AAA", _flows("us-gaap_NetIncomeLoss", [
+        ("2023-01-01", "2023-12-31", 100.0),
+    ]), accession_no="acc-fy", filed="2024-02-01", form="10-K", cik="1")
+
+    facts = fact_store.load_facts("AAA")
+    q4 = facts[facts["derived"].astype(bool)]
+    assert len(q4) == 1
+    assert q4.iloc[0]["value"] == 40.0
+    assert q4.iloc[0]["period_start"] == pd.Timestamp("2023-10-01")
+    assert q4.iloc[0]["accession_no"] == "acc-fy"
+    assert q4.iloc[0]["calendar_period"] == "CY2023Q4"
+
+    _, values = fact_store.period_series("AAA", "us-gaap_NetIncomeLoss")
+    assert list(values) == [10.0, 20.0, 30.0, 40.0]  # the quarter, not the fiscal year
+    assert fact_store.filing_values("AAA", ["us-gaap_NetIncomeLoss"], "2023-12-31", "10-K") == {
+        "us-gaap_NetIncomeLoss": 100.0}
@@ -0,0 +1,139 @@
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+import http_client
+
+
+class StubServer:
+    """Local HTTP server answering GETs with `respond(request_headers) -> (status, headers, body)`."""
+
+    def __init__(self, respond):
+        self.respond = respond
+        self.requests = []
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self._lock = threading.Lock()
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                with stub._lock:
+                    stub.requests.append(dict(self.headers))
+                    stub.in_flight += 1
+                    stub.max_in_flight = max(stub.max_in_flight, stub.in_flight)
+                try:
+                    status, headers, body = stub.respond(self.headers)
+                finally:
+                    with stub._lock:
+                        stub.in_flight -= 1
+                self.send_response(status)
+                for name, value in headers.items():
+                    self.send_header(name, value)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.host = f"127.0.0.1:{self.server.server_port}"
+        self.url = f"http://{self.host}/data.json"
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+@pytest.fixture
+def stub():
+    servers = []
+
+    def start(respond):
+        servers.append(StubServer(respond))
+        return servers[-1]
+
+    yield start
+    for server in servers:
+        server.close()
+
+
+@pytest.fixture
+def sleeps():
+    return []
+
+
+@pytest.fixture
+def client(tmp_path, sleeps):
+    return http_client.HttpClient(cache_dir=str(tmp_path / "http"), sleep=sleeps.append, backoff=0.01)
+
+
+def _sequence(*responses):
+    """Respond with `responses` in order, then repeat the last one."""
+    queue = list(responses)
+    return lambda headers: queue.pop(0) if len(queue) > 1 else queue[0]
+
+
+@pytest.mark.parametrize("status", [429, 500, 502, 503, 504])
+def test_retries_retryable_statuses(stub, client, sleeps, status):
+    server = stub(_sequence((status, {}, b"busy"), (status, {}, b"busy"), (200, {}, b"ok")))
+    response = client.get(server.url)
+    assert response.status_code == 200 and response.content == b"ok"
+    assert len(server.requests) == 3
+    assert len(sleeps) == 2
+
+
+def test_gives_up_after_max_retries(stub, client, sleeps):
+    server = stub(_sequence((503, {}, b"down")))
+    response = client.get(server.url)
+    assert response.status_code == 503
+    assert len(server.requests) == client.max_retries + 1
+
+
+def test_does_not_retry_client_errors(stub, client, sleeps):
+    server = stub(_sequence((404, {}, b"missing")))
+    assert client.get(server.url).status_code == 404
+    assert len(server.requests) == 1 and sleeps == []
+
+
+def test_honours_retry_after(stub, client, sleeps):
+    server = stub(_sequence((429, {"Retry-After": "3"}, b"slow down"), (200, {}, b"ok")))
+    assert client.get(server.url).status_code == 200
+    assert sleeps == [3.0]
+
+
+def test_not_modified_is_served_from_cache(stub, client):
+    def respond(headers):
+        if headers.get("If-None-Match") == '"v1"':
+            return 304, {"ETag": '"v1"'}, b""
+        return 200, {"ETag": '"v1"', "Content-Type": "application/json"}, b'{"a": 1}'
+
+    server = stub(respond)
+    first = client.get(server.url, conditional=True)
+    second = client.get(server.url, conditional=True)
+
+    assert first.json() == second.json() == {"a": 1}
+    assert second.status_code == 200
+    assert "If-None-Match" not in server.requests[0]
+    assert server.requests[1]["If-None-Match"] == '"v1"'
+
+
+def test_limits_requests_in_flight_per_host(stub, tmp_path):
+    def respond(headers):
+        time.sleep(0.1)
+        return 200, {}, b"ok"
+
+    server = stub(respond)
+    client = http_client.HttpClient(cache_dir=str(tmp_path / "http"), host_concurrency={server.host: 2})
+    threads = [threading.Thread(target=client.get, args=(server.url,)) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(server.requests) == 8
+    assert server.max_in_flight == 2
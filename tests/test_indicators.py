@@ -0,0 +1,65 @@
+import pandas as pd
+import pytest
+
+import fact_store
+import indicators
+from indicators import FilingContext, parse_factor_spec, score_universe
+
+
+@pytest.fixture(autouse=True)
+def scratch(monkeypatch, tmp_path):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(fact_store, "_tables", {})
+
+
+def _flows(concept, rows):
+    return pd.DataFrame({
+        "concept": [concept] * len(rows),
+        "period_start": [pd.Timestamp(start) for start, _, _ in rows],
+        "period_end": [pd.Timestamp(end) for _, end, _ in rows],
+        "duration": fact_store.duration_label(
+            pd.Series([pd.Timestamp(start) for start, _, _ in rows]),
+            pd.Series([pd.Timestamp(end) for _, end, _ in rows])),
+        "value": [value for _, _, value in rows],
+        "units": ["USD"] * len(rows),
+    })
+
+
+def test_compacted_filing_resolves_concepts_from_fact_table():
+    fact_store.add_filing_facts("AAA", _flows("us-gaap_NetIncomeLoss", [
+        ("2023-01-01", "2023-12-31", 400.0),
+        ("2023-10-01", "2023-12-31", 120.0),
+    ]), accession_no="acc-1", filed="2024-02-01", form="10-K", cik="1")
+
+    annual = {"ticker": "AAA", "date": "2023-12-31", "form": "10-K", "base": {"us-gaap_Assets": 1.0}}
+    assert FilingContext.from_filing(annual).first(["us-gaap_NetIncomeLoss"]) == 400.0
+
+    quarter = dict(annual, form="10-Q")
+    assert FilingContext.from_filing(quarter).first(["us-gaap_NetIncomeLoss"]) == 120.0
+
+
+def test_concept_missing_from_fact_table_is_none():
+    ctx = FilingContext.from_filing({"ticker": "AAA", "date": "2023-12-31", "form": "10-K", "base": {}})
+    assert ctx.first(["us-gaap_Revenues"]) is None
+
+
+def _snapshot():
+    return pd.DataFrame({"CIK": ["1", "2", "3"], "ROE": [0.1, 0.3, 0.2], "P/E": [30.0, 10.0, 20.0]})
+
+
+def test_score_universe_returns_copies_of_cached_results():
+    factors = parse_factor_spec("ROE, -P/E")
+    first = score_universe(_snapshot(), factors, version=1)
+    first["Score"] = -1.0
+    second = score_universe(_snapshot(), factors, version=1)
+    assert list(second["CIK"]) == ["2", "3", "1"]
+    assert (second["Score"] > 0).all()
+
+
+def test_score_universe_keys_cache_on_given_version(monkeypatch):
+    factors = parse_factor_spec("ROE")
+    monkeypatch.setattr(indicators, "data_version", lambda df: pytest.fail("snapshot hashed"))
+    score_universe(_snapshot(), factors, version=2)
+    changed = _snapshot().assign(ROE=[0.9, 0.1, 0.2])
+    assert list(score_universe(changed, factors, version=2)["CIK"]) == ["2", "3", "1"]
+    assert list(score_universe(changed, factors, version=3)["CIK"]) == ["1", "3", "2"]
@@ -0,0 +1,52 @@
+import time
+
+import pytest
+
+import ingest_pipeline
+from ingest_pipeline import IngestPipeline
+
+
+def _parse(raw):
+    if raw == "stuck":
+        time.sleep(3600)
+    return raw.upper()
+
+
+@pytest.fixture(autouse=True)
+def fresh_pool():
+    yield
+    pool = ingest_pipeline._parse_pool
+    if pool is not None:
+        ingest_pipeline.recycle_parse_pool(pool)
+
+
+def _pipeline(**kwargs):
+    return IngestPipeline(fetch_fn=lambda item: item, parse_fn=_parse,
+                          write_fn=lambda item, parsed: parsed, fetch_workers=1, **kwargs)
+
+
+def test_parses_in_the_shared_pool():
+    assert sorted(_pipeline(parse_workers=2).run(["a", "b", "c"])) == ["A", "B", "C"]
+
+
+def test_timed_out_parse_kills_its_worker_and_others_finish():
+    pool = ingest_pipeline.start_parse_pool(2)
+    workers = list(pool._processes.values())
+    pipeline = _pipeline(parse_workers=2, parse_timeout=1.0)
+
+    started = time.perf_counter()
+    results = pipeline.run(["a", "stuck", "b", "c"])
+
+    assert sorted(results) == ["A", "B", "C"]
+    assert pipeline.stats["parse"].errors == 1
+    assert time.perf_counter() - started < 30
+    assert ingest_pipeline._parse_pool is not pool
+    for process in workers:
+        process.join(timeout=5)
+        assert not process.is_alive()
+
+
+def test_start_parse_pool_starts_workers_up_front():
+    pool = ingest_pipeline.start_parse_pool(2)
+    assert ingest_pipeline.get_parse_pool(2) is pool
+    assert len(pool._processes) == 2
@@ -0,0 +1,50 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+import price_metrics
+
+
+def _closes(rows=700, tickers=5, seed=0):
+    rng = np.random.default_rng(seed)
+    dates = pd.date_range("2020-01-01", periods=rows, freq="D").to_numpy(dtype="datetime64[D]")
+    closes = 100 * np.exp(np.cumsum(rng.normal(0, 0.03, (rows, tickers)), axis=0))
+    closes[rng.random((rows, tickers)) < 0.1] = np.nan         # short gaps, carried forward
+    closes[:40, 1] = np.nan                                     # listed later
+    closes[300:320, 2] = np.nan                                 # stale for longer than MAX_STALE_DAYS
+    return closes, dates
+
+
+def _reference_drawdown(closes, dates):
+    """Naive pandas max drawdown: one window slice per row and ticker."""
+    frame = pd.DataFrame(closes, index=pd.DatetimeIndex(dates))
+    filled = frame.ffill(limit=price_metrics.MAX_STALE_DAYS)    # daily rows: limit in rows == days
+    out = np.full(closes.shape, np.nan)
+    for i, day in enumerate(frame.index):
+        start = frame.index.searchsorted(day - pd.Timedelta(days=price_metrics.RISK_WINDOW_DAYS), side="right") - 1
+        if start < 0:
+            continue
+        window = filled.iloc[start:i + 1]
+        covered = window.iloc[0].notna()
+        drawdown = ((window / window.cummax()).min() - 1) * 100
+        out[i] = np.where(covered, drawdown, np.nan)
+    return out
+
+
+@pytest.mark.parametrize("seed", [0, 1])
+def test_drawdown_matches_pandas_reference(seed):
+    closes, dates = _closes(seed=seed)
+    computed = price_metrics.compute_metrics(closes, dates)["Max drawdown 12M"]
+    expected = _reference_drawdown(closes, dates)
+    np.testing.assert_array_equal(np.isnan(computed), np.isnan(expected))
+    np.testing.assert_allclose(computed, expected, rtol=1e-5, atol=1e-4, equal_nan=True)
+
+
+def test_incremental_rows_match_full_computation():
+    closes, dates = _closes()
+    first = 500
+    lo = int(np.searchsorted(dates, dates[first] - np.timedelta64(price_metrics._LOOKBACK_DAYS, "D")))
+    full = price_metrics.compute_metrics(closes, dates)
+    tail = price_metrics.compute_metrics(closes[lo:], dates[lo:], first - lo)
+    for name in price_metrics.PRICE_METRICS:
+        np.testing.assert_allclose(tail[name], full[name][first:], rtol=1e-5, equal_nan=True)
@@ -0,0 +1,56 @@
+import os
+import subprocess
+import sys
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import price_store
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+WRITER = """
+import sys
+import pandas as pd
+sys.path.insert(0, sys.argv[1])
+import price_store
+days = pd.date_range("2024-01-01", periods=20, freq="B")
+for i in range(int(sys.argv[3])):
+    ticker = f"{sys.argv[2]}{i}"
+    price_store.update_matrix({ticker: pd.Series(range(1, 21), index=days, dtype="float64")})
+"""
+
+
+@pytest.fixture(autouse=True)
+def scratch(monkeypatch, tmp_path):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(price_store, "_matrix", None)
+
+
+def _series(start, periods, value):
+    return pd.Series(float(value), index=pd.date_range(start, periods=periods, freq="B"))
+
+
+def test_concurrent_writers_keep_every_ticker():
+    price_store.update_matrix({"SEED": _series("2024-01-01", 20, 1)})
+    writers = [subprocess.Popen([sys.executable, "-c", WRITER, REPO_DIR, prefix, "8"]) for prefix in "ABCD"]
+    for writer in writers:
+        assert writer.wait() == 0
+
+    matrix = price_store.open_matrix()
+    expected = {"SEED"} | {f"{p}{i}" for p in "ABCD" for i in range(8)}
+    assert set(matrix.tickers) == expected
+    assert not np.isnan(matrix.frame(sorted(expected)).to_numpy()).any()
+
+
+def test_rebuild_fails_when_current_matrix_is_unreadable():
+    price_store.update_matrix({"AAA": _series("2024-02-01", 10, 1)})
+    meta = price_store._read_matrix_meta()
+    os.remove(price_store._matrix_paths(meta["generation"])[0])
+    price_store._matrix = None
+
+    with pytest.raises(RuntimeError):
+        # Earlier history forces a rebuild, which needs the current values
+        price_store.update_matrix({"BBB": _series("2024-01-01", 10, 2)})
+    assert price_store._read_matrix_meta()["tickers"] == ["AAA"]
@@ -0,0 +1,113 @@
+from types import SimpleNamespace
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import visualizer
+
+
+class FakeCompanies:
+    def __init__(self, rows):
+        self.companies = {cik: SimpleNamespace(ticker=ticker, title=title) for cik, ticker, title in rows}
+        self._by_ticker = {c.ticker.upper(): cik for cik, c in self.companies.items()}
+
+    def cik_for_ticker(self, ticker):
+        return self._by_ticker.get(str(ticker).upper())
+
+
+@pytest.fixture
+def companies(monkeypatch):
+    fake = FakeCompanies([
+        ("1", "XAPP", "Apple Hospitality REIT"),
+        ("2", "APPN", "Appian Corp"),
+        ("3", "SNAP", "Snap Apps Inc"),
+        ("4", "APP", "AppLovin Corp"),
+        ("5", "APPF", "AppFolio Inc"),
+        ("6", "MSFT", "Microsoft Corp"),
+    ])
+    monkeypatch.setattr(visualizer, "companies", fake)
+    return fake
+
+
+def _company_values(options):
+    return [o["value"] for o in options if not str(o["value"]).startswith("__SEP__")
+            and o["value"] not in {m["shortcut"] for m in visualizer.PRESET_SOURCES.values()}]
+
+
+def test_ticker_prefix_hits_come_before_title_hits(companies):
+    values = _company_values(visualizer.build_company_dropdown_options("app"))
+    # exact ticker, other ticker prefixes, then title substrings
+    assert values == ["4", "2", "5", "1", "3"]
+
+
+def test_limit_is_filled_with_prefix_hits_first(companies, monkeypatch):
+    monkeypatch.setattr(visualizer, "COMPANY_OPTIONS_LIMIT", 3)
+    assert _company_values(visualizer.build_company_dropdown_options("app")) == ["4", "2", "5"]
+
+
+def test_selected_companies_stay_listed(companies):
+    assert _company_values(visualizer.build_company_dropdown_options("msft", selected=["3"])) == ["3", "6"]
+
+
+@pytest.fixture
+def stores(monkeypatch, tmp_path):
+    """Empty fact, price and JSON stores in a scratch directory."""
+    import fact_store
+    import price_metrics
+    import price_store
+
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(fact_store, "_tables", {})
+    monkeypatch.setattr(price_store, "_matrix", None)
+    monkeypatch.setattr(price_metrics, "_state", None)
+    visualizer.graph_series.invalidate()
+    return SimpleNamespace(fact_store=fact_store, price_store=price_store)
+
+
+RANGE = (np.datetime64("2023-01-01", "ns"), np.datetime64("2025-01-01", "ns"))
+
+
+def _assets(stores, ticker, values):
+    ends = pd.to_datetime(["2023-03-31", "2023-06-30", "2023-09-30", "2023-12-31"])
+    stores.fact_store.add_filing_facts(ticker, pd.DataFrame({
+        "concept": "us-gaap_Assets", "period_start": pd.NaT, "period_end": ends,
+        "duration": "instant", "value": values, "units": "USD",
+    }), accession_no=f"{ticker}-1", filed="2024-02-01", form="10-K", cik=ticker)
+
+
+def test_aggregate_without_values_is_empty(stores):
+    for variable in ["Total assets"] + visualizer.PRICE_METRICS:
+        stats = visualizer.aggregate_series(["AAA", "BBB"], variable, *RANGE)
+        assert stats.empty and list(stats.columns) == ["count", "q25", "median", "q75"]
+    assert visualizer.aggregate_series([], "Total assets", *RANGE, cap_weighted=True).empty
+
+
+def test_aggregate_reads_gaap_values_from_fact_table(stores):
+    _assets(stores, "AAA", [1.0, 2.0, 3.0, 4.0])
+    _assets(stores, "BBB", [3.0, 4.0, 5.0, 6.0])
+    stats = visualizer.aggregate_series(["AAA", "BBB", "CCC"], "Total assets", *RANGE)
+    assert list(stats.index) == list(pd.to_datetime(["2023-03-31", "2023-06-30", "2023-09-30", "2023-12-31"]))
+    assert list(stats["count"]) == [2, 2, 2, 2]
+    assert list(stats["median"]) == [2.0, 3.0, 4.0, 5.0]
+
+
+def test_aggregate_reads_price_metrics_from_price_arrays(stores):
+    days = pd.bdate_range("2023-01-02", "2024-12-31")
+    growth = np.linspace(100.0, 200.0, len(days))
+    stores.price_store.update_matrix({
+        "AAA": pd.Series(growth, index=days),
+        "BBB": pd.Series(growth[::-1].copy(), index=days),
+    })
+    stats = visualizer.aggregate_series(["AAA", "BBB"], "Return 3M", *RANGE)
+    assert not stats.empty
+    assert (stats["count"] == 2).all()
+    assert stats.index.min() >= pd.Timestamp("2023-06-30")
+
+
+def test_aggregate_graph_mode_handles_missing_data(stores, companies, monkeypatch):
+    monkeypatch.setattr(visualizer.info_picker_2, "SecTools_export_important_data",
+                        lambda *args, **kwargs: pytest.fail("aggregate mode must not fetch filings"))
+    fig = visualizer.generate_graph(["1", "2"], ["Total assets", "Return 3M"], [], 2023, 2024, True,
+                                    mode="aggregate")
+    assert len(fig.data) == 0
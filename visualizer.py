@@ -1,51 +1,73 @@
 import os
-import json
 import sys
 from datetime import datetime
 from typing import List, Optional, Dict
 import dash_bootstrap_components as dbc
 
 import dash
+import numpy as np
 import pandas as pd
 from dash import dcc, html, dash_table, callback_context, no_update
 from dash.dependencies import Input, Output, State
 import plotly.graph_objects as go
 
+import fact_store
 import info_picker_2
-from helper import human_format, extract_selected_indexes
+import ingest_pipeline
+from company_metadata import UNKNOWN_SECTOR
+import metrics
+import price_metrics
+from series_cache import SeriesCache
+from cross_section import CrossSectionStats, referenced_stats, rewrite_filter, stat_column
+from derived_metrics import DERIVED_VARIABLES
+from helper import human_format, human_format_array, fixed_format_array, extract_selected_indexes, first_numeric, \
+    read_json
+from price_metrics import PRICE_METRICS
+from indicators import CONCEPTS, MAPPING_VARIABLE, RATIOS, evaluate_filing, latest_snapshot, parse_factor_spec, \
+    score_universe
 
 # ----------------------------- CONSTANTS -----------------------------------
-# GAAP/base variables only (mapped to us-gaap codes)
-MAPPING_VARIABLE: Dict[str, str] = {
-    "Total assets": "us-gaap_Assets",
-    "Total liabilities": "us-gaap_Liabilities",
-    "Cash": "us-gaap_CashAndCashEquivalentsAtCarryingValue",
-    "Net income": "us-gaap_NetIncomeLoss",
-    "Total shareholders’ equity": "us-gaap_StockholdersEquity",
-    "Shares diluted": "us-gaap_EarningsPerShareDiluted",
-    "Shares basic": "us-gaap_EarningsPerShareBasic",
-}
+# GAAP/base variables only (mapped to us-gaap codes) – shared with ingestion, see indicators.py
 
 # Computed-only variables (never stored in 'base', only in 'computed')
-RATIO_VARIABLES: List[str] = [
-    "ROE",
-    "P/E",
-    "P/FCF",
-    "P/CF",
-    "D/E",
-    "Pretax Profit Margin"
-]
+RATIO_VARIABLES: List[str] = list(RATIOS) + DERIVED_VARIABLES  # registry in indicators.py; TTM / YoY, see derived_metrics.py
 
 # Special variables (neither GAAP nor ratio) read directly from JSON
 SPECIAL_VARIABLES: List[str] = [
     "Stock value",  # reads json["yf_value"]
-]
+] + PRICE_METRICS  # returns / volatility / drawdown from the close matrix, see price_metrics.py
 
 # Combined for UI dropdowns
 VARIABLES: List[str] = list(MAPPING_VARIABLE.keys()) + RATIO_VARIABLES + SPECIAL_VARIABLES
 
 YEAR_RANGE = {"start": 2018, "end": datetime.now().year - 7}
 
+# Above this many companies the graph merges traces per variable and uses WebGL (Scattergl)
+LARGE_SELECTION_THRESHOLD = 25
+# Legend entries shown in the per-company mode; further traces are drawn without a legend entry
+LEGEND_MAX_ENTRIES = 30
+
+# Graph modes: one line per company, or per-period median / IQR (+ cap-weighted mean) across the selection
+GRAPH_MODES = {
+    "companies": "Jednotlivé společnosti",
+    "aggregate": "Medián a IQR",
+    "aggregate_cap": "Medián, IQR a průměr vážený kapitalizací",
+}
+DEFAULT_GRAPH_MODE = "companies"
+
+# Internal graph series (not offered in the UI): Yahoo close x diluted (else basic) weighted average shares
+MARKET_CAP = "_market_cap"
+SHARE_COUNT_CODES = [
+    "us-gaap_WeightedAverageNumberOfDilutedSharesOutstanding",
+    "us-gaap_WeightedAverageNumberOfSharesOutstandingDiluted",
+    "us-gaap_WeightedAverageNumberOfSharesOutstandingBasic",
+    "us-gaap_WeightedAverageNumberOfSharesOutstanding",
+]
+
+# Multi-factor score panel defaults ("-" = lower is better, ":w" = weight)
+DEFAULT_SCORE_SPEC = "-P/E:1, ROE:1, -D/E:1"
+DEFAULT_SCORE_TOP_N = 20
+
 PRESET_SOURCES = {
     "sp500": {
         "label": "S&P 500",
@@ -62,7 +84,12 @@ PRESET_SOURCES = {
 # ----------------------------- LOAD COMPANY DATA ---------------------------
 companies = info_picker_2.CompanyData()
 companies.load_saved_companies()
-TICKER_TO_CIK = {v.ticker.upper(): k for k, v in companies.companies.items()}
+# SIC / sector metadata (SEC submissions.zip or company_metadata.json fixture, cached)
+companies.load_metadata()
+
+# Company dropdown options are served on demand from the search box (see
+# `update_company_options`) instead of shipping ~10k options with the layout.
+COMPANY_OPTIONS_LIMIT = 50
 
 
 # ----------------------------- HELPERS -------------------------------------
@@ -99,15 +126,6 @@ def build_table_variable_options():
     return [{"label": v, "value": v} for v in final]
 
 
-def _read_json(filepath: str) -> Optional[dict]:
-    try:
-        with open(filepath, "r", encoding="utf-8") as f:
-            return json.load(f)
-    except Exception as e:
-        print(f"[ERROR] Failed to read JSON {filepath}: {e}")
-        return None
-
-
 def extract_from_base_or_computed(json_dict: dict, human_variable: str) -> Optional[float]:
     """
     Read a variable from JSON 'base'/'computed' or (for specials) from top-level JSON.
@@ -120,9 +138,11 @@ def extract_from_base_or_computed(json_dict: dict, human_variable: str) -> Optio
     base = json_dict.get("base", {}) or {}
     computed = json_dict.get("computed", {}) or {}
 
-    # Ratios → computed only
+    # Ratios → computed (registered ratios missing there are evaluated from 'base')
     if human_variable in RATIO_VARIABLES:
         val = computed.get(human_variable)
+        if human_variable not in computed and human_variable in RATIOS:
+            val = evaluate_filing(json_dict, [human_variable])[human_variable]
         try:
             return float(val) if val is not None else None
         except Exception:
@@ -147,8 +167,46 @@ def extract_from_base_or_computed(json_dict: dict, human_variable: str) -> Optio
     return None
 
 
+def _graph_value(json_data: dict, human_var: str, filing_dt: pd.Timestamp) -> Optional[float]:
+    """Value of a graph variable in one filing (computed ratios, Yahoo price or GAAP value)."""
+    if human_var in RATIO_VARIABLES:
+        computed = json_data.get("computed") or {}
+        if human_var not in computed and human_var in RATIOS:
+            # Ratio registered after the filing was saved: evaluate just this one
+            return evaluate_filing(json_data, [human_var])[human_var]
+        return computed.get(human_var)
+    if human_var == "Stock value":
+        return json_data.get("yf_value")
+    if human_var == MARKET_CAP:
+        price = json_data.get("yf_value")
+        base = json_data.get("base") or {}
+        shares = next((base[c] for c in SHARE_COUNT_CODES if base.get(c) is not None), None)
+        return price * shares if price is not None and shares is not None else None
+    code = MAPPING_VARIABLE.get(human_var, human_var)
+    base = json_data.get("base") or {}
+    if base.get(code) is not None:
+        return base[code]
+    if base:
+        # Same metric in another taxonomy (IFRS filers, see indicators.GAAP_PREFIXES)
+        value = first_numeric(base, CONCEPTS.equivalents(code)[1:])
+        if value is not None:
+            return value
+    # Older JSONs without 'base': resolve from the statements
+    return info_picker_2.get_file_variable(code, json_data, year=filing_dt.year)
+
+
+# Pre-sorted date/value arrays per (ticker, variable), rebuilt when a ticker's filings change
+graph_series = SeriesCache([v for v in VARIABLES if v not in PRICE_METRICS] + [MARKET_CAP], _graph_value, read_json=read_json)
+
+
 # ----------------------------- SUMMARY TABLE --------------------------------
+@metrics.timed("table_build")
 def load_summary_table(selected_variables=None):
+    """
+    One row per filing with the selected variables. `df.attrs["version"]` identifies
+    its inputs (variables, filing files with their mtimes, price matrix version) for
+    caches keyed on the summary, e.g. score_universe.
+    """
     if not selected_variables:
         vars_to_use = list(VARIABLES)
     else:
@@ -158,19 +216,23 @@ def load_summary_table(selected_variables=None):
         )]
         if not vars_to_use:
             vars_to_use = list(VARIABLES)
+    # Price metrics are joined for all rows at once below, not read per filing
+    filing_vars = [v for v in vars_to_use if v not in PRICE_METRICS]
+    price_vars = [v for v in vars_to_use if v in PRICE_METRICS]
 
     records = []
+    sources = []
     for cik, company in companies.companies.items():
         ticker, name = company.ticker, company.title
         json_dir = f"xbrl_data_json/{ticker}"
         if not os.path.exists(json_dir):
             continue
 
-        for file in os.listdir(json_dir):
-            if not file.endswith(".json"):
-                continue
-            filepath = os.path.join(json_dir, file)
-            data = _read_json(filepath)
+        with os.scandir(json_dir) as entries:
+            files = [(entry.path, entry.stat().st_mtime_ns) for entry in entries if entry.name.endswith(".json")]
+        for filepath, mtime in files:
+            sources.append((filepath, mtime))
+            data = read_json(filepath)
             if not data:
                 continue
             report_date = pd.to_datetime(data.get("date", None))
@@ -178,7 +240,7 @@ def load_summary_table(selected_variables=None):
                 continue
 
             row = {"CIK": cik, "Ticker": ticker, "Company": name, "Date": report_date.strftime("%Y-%m-%d")}
-            for var in vars_to_use:
+            for var in filing_vars:
                 val = extract_from_base_or_computed(data, var)
                 try:
                     row[var] = int(val) if val is not None and float(val).is_integer() else val
@@ -188,16 +250,255 @@ def load_summary_table(selected_variables=None):
 
     columns = ["CIK", "Ticker", "Company", "Date"] + vars_to_use
     df = pd.DataFrame(records, columns=columns)
+    # Sector joined per column (indexed lookup), usable in group-bys and `Sector == "Technology"`
+    df.insert(3, "Sector", df["CIK"].map(companies.sector_by_cik).fillna(UNKNOWN_SECTOR))
+    prices_version = None
+    if price_vars and not df.empty:
+        # As of each report date (last trading day on/before it)
+        df[price_vars] = price_metrics.lookup(df["Ticker"], df["Date"], price_vars).to_numpy()
+        state = price_metrics.refresh()
+        prices_version = state.version if state is not None else None
     if not df.empty:
         df.sort_values(["Company", "Date"], inplace=True)
     else:
         print("[WARNING] No records loaded for summary.")
+    df.attrs["version"] = hash((tuple(vars_to_use), tuple(sources), prices_version))
     return df
 
 
 # ----------------------------- GRAPH GENERATION -----------------------------
-def generate_graph(selected_ciks, selected_variables, selected_indexes, start_year, end_year, use_yahoo):
+def _format_values(human_var: str, values: np.ndarray) -> np.ndarray:
+    """Tooltip strings of a variable's values."""
+    if human_var in RATIO_VARIABLES or human_var in PRICE_METRICS:
+        return fixed_format_array(values)
+    if human_var == "Stock value":
+        return fixed_format_array(values, " $")
+    return human_format_array(values)
+
+
+def _company_series(ticker: str, ts, human_var: str, range_start, range_end):
+    """
+    (dates, values) of one company variable in [range_start, range_end): GAAP values from
+    the fact table (every reported period, one range scan), the rest from the filing JSONs
+    (`ts`, or graph_series when None).
+    """
+    if human_var in PRICE_METRICS:
+        # Daily values from the close matrix, not per filing
+        return price_metrics.series(ticker, human_var, range_start, range_end)
+    code = MAPPING_VARIABLE.get(human_var)
+    if code:
+        dates, values = fact_store.period_series(ticker, code, range_start, range_end - np.timedelta64(1, "D"))
+        keep = ~np.isnan(values)
+        if keep.any():
+            return dates[keep], values[keep]
+    ts = ts if ts is not None else graph_series.get(ticker)
+    if ts is None:
+        return np.array([], dtype="datetime64[ns]"), np.array([], dtype="float64")
+    return ts.slice(human_var, range_start, range_end)
+
+
+def _aggregate_points(tickers: List[str], human_var: str, range_start, range_end) -> pd.DataFrame:
+    """
+    (ticker, period, value) of `human_var` per calendar quarter, one value per ticker and
+    quarter. Price metrics are read as of each quarter end from the price_metrics arrays
+    (one lookup for all tickers), the rest from the stores `_company_series` reads.
+    """
+    if human_var in PRICE_METRICS:
+        quarters = pd.period_range(pd.Timestamp(range_start), pd.Timestamp(range_end) - pd.Timedelta(days=1), freq="Q")
+        ends = quarters.to_timestamp(how="end").normalize()
+        values = price_metrics.lookup(np.repeat(tickers, len(ends)), np.tile(ends, len(tickers)), [human_var])
+        return pd.DataFrame({
+            "ticker": np.repeat(tickers, len(ends)),
+            "period": np.tile(quarters, len(tickers)),
+            "value": values[human_var].to_numpy(),
+        })
+    parts = []
+    for ticker in tickers:
+        dates, values = _company_series(ticker, None, human_var, range_start, range_end)
+        if len(dates):
+            parts.append(pd.DataFrame({"ticker": ticker, "period": fact_store.calendar_quarters(dates),
+                                       "value": values}))
+    if not parts:
+        return pd.DataFrame({"ticker": pd.Series(dtype="object"), "period": pd.Series(dtype="period[Q-DEC]"),
+                             "value": pd.Series(dtype="float64")})
+    return pd.concat(parts, ignore_index=True).drop_duplicates(["ticker", "period"], keep="last")
+
+
+def _quarter_caps(tickers: List[str], range_start, range_end) -> pd.DataFrame:
+    """(ticker, period, cap): last market cap per ticker and calendar quarter."""
+    parts = []
+    for ticker in tickers:
+        ts = graph_series.get(ticker)
+        if ts is None:
+            continue
+        dates, caps = ts.slice(MARKET_CAP, range_start, range_end)
+        if len(dates):
+            parts.append(pd.DataFrame({"ticker": ticker, "period": fact_store.calendar_quarters(dates), "cap": caps}))
+    if not parts:
+        return pd.DataFrame(columns=["ticker", "period", "cap"])
+    return pd.concat(parts, ignore_index=True).drop_duplicates(["ticker", "period"], keep="last")
+
+
+def aggregate_series(tickers: List[str], human_var: str, range_start, range_end,
+                     cap_weighted: bool = False) -> pd.DataFrame:
+    """
+    Per calendar quarter statistics of `human_var` across `tickers` (fiscal quarters
+    aligned by fact_store.calendar_quarters): count, q25, median, q75 (and cap_mean,
+    weighted by market cap, if `cap_weighted`). Indexed by the quarter end date; empty
+    when no ticker has a value in the range.
+    """
+    columns = ["count", "q25", "median", "q75"] + (["cap_mean"] if cap_weighted else [])
+    frame = _aggregate_points(list(tickers), human_var, range_start, range_end)
+    frame = frame[frame["value"].notna()]
+    if frame.empty:
+        return pd.DataFrame(columns=columns)
+
+    grouped = frame.groupby("period")["value"]
+    out = grouped.quantile([0.25, 0.5, 0.75]).unstack()
+    out.columns = ["q25", "median", "q75"]
+    out.insert(0, "count", grouped.size())
+    if cap_weighted:
+        caps = _quarter_caps(list(tickers), range_start, range_end)
+        frame = frame.merge(caps, on=["ticker", "period"], how="left") if not caps.empty else frame.assign(cap=np.nan)
+        weights = pd.to_numeric(frame["cap"], errors="coerce").to_numpy(dtype="float64")
+        valid = weights > 0
+        frame["weighted"] = np.where(valid, frame["value"].to_numpy() * weights, np.nan)
+        frame["weight"] = np.where(valid, weights, np.nan)
+        sums = frame.groupby("period")[["weighted", "weight"]].sum(min_count=1)
+        out["cap_mean"] = sums["weighted"] / sums["weight"]
+    out.index = out.index.to_timestamp(how="end").normalize()
+    return out[columns]
+
+
+def _aggregate_traces(human_var: str, stats: pd.DataFrame, cap_weighted: bool) -> List[dict]:
+    """IQR band, median line and optional cap-weighted mean of one variable."""
+    x = stats.index.to_numpy()
+    count = stats["count"].to_numpy()
+    band = dict(type="scatter", x=x, mode="lines", line=dict(width=0), legendgroup=human_var,
+                showlegend=False, hoverinfo="skip")
+    traces = [
+        dict(band, y=stats["q75"].to_numpy(), name=f"{human_var} - Q3"),
+        dict(band, y=stats["q25"].to_numpy(), name=f"{human_var} - IQR", fill="tonexty", showlegend=True),
+        dict(
+            type="scatter", x=x, y=stats["median"].to_numpy(), mode="lines+markers",
+            name=f"{human_var} - medián", legendgroup=human_var,
+            customdata=np.column_stack([_format_values(human_var, stats["median"].to_numpy()),
+                                        _format_values(human_var, stats["q25"].to_numpy()),
+                                        _format_values(human_var, stats["q75"].to_numpy()),
+                                        count.astype(str)]),
+            hovertemplate=(
+                f"{human_var} - medián<br>"
+                "Kvartál končící: %{x|%Y-%m-%d}<br>"
+                "Medián: %{customdata[0]}<br>"
+                "IQR: %{customdata[1]} – %{customdata[2]}<br>"
+                "Společností: %{customdata[3]}<extra></extra>"
+            ),
+        ),
+    ]
+    if cap_weighted:
+        traces.append(dict(
+            type="scatter", x=x, y=stats["cap_mean"].to_numpy(), mode="lines",
+            name=f"{human_var} - průměr vážený kapitalizací", legendgroup=human_var, line=dict(dash="dot"),
+            customdata=_format_values(human_var, stats["cap_mean"].to_numpy())[:, None],
+            hovertemplate=f"{human_var} - vážený průměr<br>" + "Kvartál končící: %{x|%Y-%m-%d}<br>"
+                                                                 "Hodnota: %{customdata[0]}<extra></extra>",
+        ))
+    return traces
+
+
+def _merged_trace(human_var: str, segments: list) -> dict:
+    """
+    One Scattergl trace for all companies of a variable. Segments (title, x, y, pretty, prices)
+    are separated by a NaN point so lines don't join across companies; the company title of
+    every point is carried in customdata for the tooltip.
+    """
+    with_prices = any(prices is not None for *_, prices in segments)
+    xs, ys, rows = [], [], []
+    for title, x, y, pretty, prices in segments:
+        n = len(x)
+        # Plain string columns: plotly deep-copies object arrays element by element
+        columns = [np.full(n + 1, title), np.append(pretty, "")]
+        if with_prices:
+            p = prices if prices is not None else np.full(n, np.nan)
+            columns.append(np.append(np.where(np.isnan(p), "", fixed_format_array(p, " $")), ""))
+        xs.append(np.append(x, x[-1]))
+        ys.append(np.append(y, np.nan))
+        rows.append(np.column_stack(columns))
+
+    tooltip = (
+        "%{customdata[0]} - " + human_var + "<br>"
+        "Date: %{x|%Y-%m-%d}<br>"
+        "Value: %{customdata[1]}<br>"
+    )
+    if with_prices:
+        tooltip += "Yahoo close: %{customdata[2]}<br>"
+    tooltip += "<extra></extra>"
+
+    return dict(
+        type="scattergl",
+        x=np.concatenate(xs),
+        y=np.concatenate(ys),
+        mode="lines+markers",
+        name=f"{human_var} ({len(segments)} společností)",
+        customdata=np.concatenate(rows),
+        hovertemplate=tooltip,
+        connectgaps=False,
+        marker=dict(size=4),
+        line=dict(width=1),
+    )
+
+
+def _add_company_traces(company, ts, selected_variables, range_start, range_end, use_yahoo,
+                        yahoo_dates, yahoo_values, traces: List[dict], segments: Dict[str, list],
+                        large_selection: bool) -> None:
+    """Traces of one company (or its segments of the merged traces for large selections)."""
+    for human_var in selected_variables:
+        x_sorted, y_sorted = _company_series(company.ticker, ts, human_var, range_start, range_end)
+        if len(x_sorted) == 0:
+            continue
+
+        pretty = _format_values(human_var, y_sorted)
+
+        # Yahoo price per filing date (skip duplication if we're already plotting Stock value)
+        prices = None
+        if use_yahoo and human_var != "Stock value" and yahoo_dates is not None and len(yahoo_dates):
+            pos = np.minimum(np.searchsorted(yahoo_dates, x_sorted), len(yahoo_dates) - 1)
+            prices = np.where(yahoo_dates[pos] == x_sorted, yahoo_values[pos], np.nan)
+            if np.isnan(prices).all():
+                prices = None
+
+        if large_selection:
+            segments.setdefault(human_var, []).append((company.title, x_sorted, y_sorted, pretty, prices))
+            continue
+
+        customdata = pretty.astype(object)[:, None]
+        tooltip = (
+            f"{company.title} - {human_var}<br>"
+            "Date: %{x|%Y-%m-%d}<br>"
+            "Value: %{customdata[0]}<br>"
+        )
+        if prices is not None:
+            customdata = np.column_stack([customdata[:, 0], np.where(np.isnan(prices), None, prices)])
+            tooltip += "Yahoo close: %{customdata[1]:.2f} $<br>"
+        tooltip += "<extra></extra>"
+
+        traces.append(dict(
+            type="scatter",
+            x=x_sorted,
+            y=y_sorted,
+            mode='lines+markers',
+            name=f"{company.title} - {human_var}",
+            customdata=customdata,
+            hovertemplate=tooltip,
+            showlegend=len(traces) < LEGEND_MAX_ENTRIES
+        ))
+
+
+@metrics.timed("graph_build")
+def generate_graph(selected_ciks, selected_variables, selected_indexes, start_year, end_year, use_yahoo,
+                   mode: str = DEFAULT_GRAPH_MODE):
     fig = go.Figure()
+    aggregate = mode in ("aggregate", "aggregate_cap")
 
     if not selected_ciks and not selected_indexes:
         fig.update_layout(title="Vyberte alespoň jednu společnost nebo index.",
@@ -215,127 +516,74 @@ def generate_graph(selected_ciks, selected_variables, selected_indexes, start_ye
         return fig
 
     # --- company filings (primary axis) ---
-    for cik in (selected_ciks or []):
-        company = companies.companies.get(cik)
-        if not company:
-            continue
-
-        json_dir = f"xbrl_data_json/{company.ticker}"
-        filings_loaded = []
-        if os.path.exists(json_dir):
-            for file in os.listdir(json_dir):
-                if file.endswith(".json") and company.ticker in file:
-                    filepath = os.path.join(json_dir, file)
-                    data = _read_json(filepath)
-                    if not data:
-                        continue
-                    dt = pd.to_datetime(data.get("date")).normalize()
-                    if start_year <= dt.year <= end_year:
-                        filings_loaded.append((dt, data))
-
-        # Optionally ensure SEC fetch if too few filings per year
-        for year in range(start_year, end_year + 1):
-            # skip if we already have >=4 items that year
-            if sum(1 for d, _ in filings_loaded if d.year == year) < 4:
-                updated_company = info_picker_2.SecTools_export_important_data(
-                    company, companies, year, mapping_variables=MAPPING_VARIABLE
-                )
-                if updated_company:
-                    # load any new jsons added by the fetch
-                    if os.path.exists(json_dir):
-                        for file in os.listdir(json_dir):
-                            if file.endswith(".json") and company.ticker in file:
-                                filepath = os.path.join(json_dir, file)
-                                data = _read_json(filepath)
-                                if not data:
-                                    continue
-                                dt = pd.to_datetime(data.get("date")).normalize()
-                                if start_year <= dt.year <= end_year and (dt, data) not in filings_loaded:
-                                    filings_loaded.append((dt, data))
-
+    range_start = np.datetime64(f"{start_year}-01-01", "ns")
+    range_end = np.datetime64(f"{end_year + 1}-01-01", "ns")
+    traces = []
+    # Index-sized selections: one WebGL trace per variable instead of one SVG trace per company
+    large_selection = len(selected_ciks or []) > LARGE_SELECTION_THRESHOLD
+    segments: Dict[str, list] = {}
+    if aggregate:
+        # Quantiles straight from the stores: no per-company fetching or trace building
+        tickers = [companies.companies[cik].ticker for cik in (selected_ciks or []) if cik in companies.companies]
+        cap_weighted = mode == "aggregate_cap"
         for human_var in selected_variables:
-            xs, ys, customdata = [], [], []
-
-            is_ratio = human_var in RATIO_VARIABLES
-            is_special_stock = (human_var == "Stock value")
-            code = MAPPING_VARIABLE.get(human_var, human_var)
-
-            for filing_dt, json_data in filings_loaded:
-                if is_ratio:
-                    # Read from computed
-                    comp = (json_data.get("computed") or {})
-                    value = comp.get(human_var)
-                elif is_special_stock:
-                    # Read saved Yahoo price directly from JSON
-                    value = json_data.get("yf_value")
-                else:
-                    # GAAP variable: use helper to extract from base sheets
-                    try:
-                        value = info_picker_2.get_file_variable(code, json_data, year=filing_dt.year)
-                    except Exception as e:
-                        print(f"[ERROR] get_file_variable({code}) failed for {company.ticker}: {e}")
-                        value = None
-
-                y_num = None
-                try:
-                    y_num = float(value) if value is not None else None
-                except Exception:
-                    pass
-
-                xs.append(filing_dt)
-                ys.append(y_num)
-
-                pretty_val = None
-                if y_num is not None:
-                    if is_ratio:
-                        pretty_val = f"{y_num:.2f}"
-                    elif is_special_stock:
-                        pretty_val = f"{y_num:.2f} $"
-                    else:
-                        pretty_val = human_format(y_num)
-                row = [pretty_val]
-                customdata.append(row)
-
-            # sort & filter out None
-            combined = [(d, v, cd) for d, v, cd in zip(xs, ys, customdata) if v is not None]
-            combined.sort(key=lambda x: x[0])
-            if not combined:
+            stats = aggregate_series(tickers, human_var, range_start, range_end, cap_weighted)
+            if not stats.empty:
+                traces.extend(_aggregate_traces(human_var, stats, cap_weighted))
+    else:
+        for cik in (selected_ciks or []):
+            company = companies.companies.get(cik)
+            if not company:
+                continue
+            if large_selection:
+                # Index-sized selections plot what is stored; fetching ~500 companies per callback
+                # is left to edgar_sync / the price download
+                ts = graph_series.get(company.ticker)
+                yahoo_dates = yahoo_values = None
+                if use_yahoo and ts is not None:
+                    yahoo_dates, yahoo_values = ts.slice("Stock value", range_start, range_end, dropna=False)
+                _add_company_traces(company, ts, selected_variables, range_start, range_end, use_yahoo,
+                                    yahoo_dates, yahoo_values, traces, segments, large_selection)
                 continue
-            x_sorted, y_sorted, cd_sorted = zip(*combined)
-
-            tooltip = (
-                f"{company.title} - {human_var}<br>"
-                "Date: %{x|%Y-%m-%d}<br>"
-                "Value: %{customdata[0]}<br>"
-            )
-
-            # Attach Yahoo price per filing date (skip duplication if we're already plotting Stock value)
-            if use_yahoo and human_var != "Stock value":
-                yf_map = info_picker_2.yf_get_stock_data(company.ticker, start_year, end_year) or {}
-                yf_by_date = {pd.to_datetime(d).date(): v for d, v in yf_map.items() if v is not None}
-
-                new_cd, has_any = [], False
-                for d, row in zip(x_sorted, cd_sorted):
-                    v = yf_by_date.get(d.date())
-                    row = list(row)
-                    row.append(v if v is not None else None)
-                    if v is not None:
-                        has_any = True
-                    new_cd.append(row)
-                cd_sorted = tuple(new_cd)
-                if has_any:
-                    tooltip += "Yahoo close: %{customdata[1]:.2f} $<br>"
-
-            tooltip += "<extra></extra>"
 
-            fig.add_trace(go.Scatter(
-                x=list(x_sorted),
-                y=[float(v) for v in y_sorted],
-                mode='lines+markers',
-                name=f"{company.title} - {human_var}",
-                customdata=list(cd_sorted),
-                hovertemplate=tooltip
-            ))
+            # Optionally ensure SEC fetch if too few periods per year. Periods come from the fact
+            # table (comparative columns included), JSON filings only for not yet backfilled tickers.
+            # Newest year first: its comparatives cover older periods, whose downloads are then skipped.
+            year_counts = fact_store.year_counts(company.ticker)
+            if not year_counts:
+                ts = graph_series.get(company.ticker)
+                year_counts = ts.year_counts() if ts is not None else {}
+            for year in range(end_year, start_year - 1, -1):
+                # skip if the year has every calendar quarter whose filing is already due
+                # (Q4 comes from the 10-K, the current year is not complete yet)
+                if year_counts.get(year, 0) < fact_store.expected_quarters(year):
+                    info_picker_2.SecTools_export_important_data(
+                        company, companies, year, mapping_variables=MAPPING_VARIABLE
+                    )
+                    year_counts = fact_store.year_counts(company.ticker) or year_counts
+
+            # Yahoo close per filing date (only hits Yahoo / rewrites JSONs when prices are missing)
+            yahoo_dates = yahoo_values = None
+            if use_yahoo:
+                yahoo_dates, yahoo_values = graph_series.series(company.ticker, "Stock value", range_start, range_end,
+                                                                dropna=False)
+                if np.isnan(yahoo_values).any():
+                    info_picker_2.yf_get_stock_data(company.ticker, start_year, end_year)
+                    yahoo_dates, yahoo_values = graph_series.series(company.ticker, "Stock value", range_start,
+                                                                    range_end, dropna=False)
+
+            ts = graph_series.get(company.ticker)
+            if ts is None:
+                continue
+            _add_company_traces(company, ts, selected_variables, range_start, range_end, use_yahoo,
+                                yahoo_dates, yahoo_values, traces, segments, large_selection)
+
+        if large_selection:
+            traces = [_merged_trace(human_var, segments[human_var]) for human_var in selected_variables
+                      if human_var in segments]
+
+    # one add_traces call validates each trace once (go.Scatter + add_trace would validate twice)
+    fig.add_traces(traces)
 
     # --- Yahoo index overlay (secondary axis) ---
     if selected_indexes:
@@ -362,7 +610,7 @@ def generate_graph(selected_ciks, selected_variables, selected_indexes, start_ye
         template="plotly_dark",
         paper_bgcolor="rgba(0,0,0,0)",
         plot_bgcolor="rgba(0,0,0,0)",
-        hovermode="x unified",
+        hovermode="closest" if large_selection and not aggregate else "x unified",
         hoverlabel=dict(
             bgcolor="black",  # solid white background
             font_size=14,  # adjust to taste
@@ -383,26 +631,69 @@ def generate_graph(selected_ciks, selected_variables, selected_indexes, start_ye
     return fig
 
 
-def filter_summary_table(n_clicks, filter_value):
+def filter_summary_table(n_clicks, filter_value, df: Optional[pd.DataFrame] = None):
+    """
+    Apply a DataFrame.query filter. Cross-sectional stats can be used as functions,
+    e.g. `pct(ROE) > 0.9 and z(`P/E`) < 0` (see cross_section.py); they are computed
+    per report period over all loaded companies.
+    """
+    df = summary_df if df is None else df
     if not filter_value or filter_value.strip() == "":
-        return summary_df.to_dict("records")
+        return df.to_dict("records")
     try:
-        filtered_df = summary_df.query(filter_value)
+        stats = referenced_stats(filter_value)
+        if stats:
+            variables = list(dict.fromkeys(v for _, v in stats))
+            df = pd.concat([df, cross_section_stats.update(df, variables)], axis=1)
+        filtered_df = df.query(rewrite_filter(filter_value))
         return filtered_df.to_dict("records")
     except Exception as e:
         print(f"[FILTER ERROR] {e}")
-        return summary_df.to_dict("records")
+        return df.to_dict("records")
 
 
 # --------- Dropdown options incl. index shortcuts --------------------------
-def build_company_dropdown_options():
+def _company_option(cik: str, comp) -> dict:
+    return {"label": f"{comp.title} [{comp.ticker}] ({cik})", "value": cik}
+
+
+def build_company_dropdown_options(search_value: Optional[str] = None, selected=None):
+    """
+    Index presets + companies matching `search_value` (ticker prefix first, then title
+    substring), capped at COMPANY_OPTIONS_LIMIT. Already selected companies are always
+    included so the dropdown keeps showing them.
+    """
     options = []
     options.append({"label": "— Indexes —", "value": "__SEP__IDX__", "disabled": True})
     for key, meta in PRESET_SOURCES.items():
         options.append({"label": meta["label"], "value": meta["shortcut"]})
     options.append({"label": "— All companies —", "value": "__SEP__ALL__", "disabled": True})
-    for cik, comp in companies.companies.items():
-        options.append({"label": f"{comp.title} [{comp.ticker}] ({cik})", "value": cik})
+
+    chosen = []
+    for val in (selected or []):
+        comp = companies.companies.get(str(val))
+        if comp is not None:
+            chosen.append(str(val))
+
+    matches = []
+    query = (search_value or "").strip().lower()
+    if query:
+        ticker_cik = companies.cik_for_ticker(query)
+        prefix_hits = [ticker_cik] if ticker_cik is not None else []
+        title_hits = []
+        for cik, comp in companies.companies.items():
+            if len(prefix_hits) >= COMPANY_OPTIONS_LIMIT:
+                break
+            if cik == ticker_cik:
+                continue
+            if str(comp.ticker).lower().startswith(query):
+                prefix_hits.append(cik)
+            elif len(title_hits) < COMPANY_OPTIONS_LIMIT and query in str(comp.title).lower():
+                title_hits.append(cik)
+        matches = (prefix_hits + title_hits)[:COMPANY_OPTIONS_LIMIT]
+
+    for cik in dict.fromkeys(chosen + matches):
+        options.append(_company_option(cik, companies.companies[cik]))
     return options
 
 def build_variable_dropdown_options():
@@ -443,7 +734,7 @@ def expand_selected_values(values):
                 print(f"[ERROR] loader preset for {val}: {e} (continuing without expansion)")
                 tickers = []
             for t in tickers:
-                cik = TICKER_TO_CIK.get(str(t).upper())
+                cik = companies.cik_for_ticker(t)
                 if cik:
                     expanded.add(cik)
         else:
@@ -457,8 +748,15 @@ app = dash.Dash(
     external_stylesheets=[dbc.themes.CYBORG]
 )
 
+# Prometheus-style /metrics on the Flask server: opt-in with SCREENER_METRICS_ENDPOINT=1
+# (never in no-op mode, SCREENER_METRICS=0)
+if metrics.endpoint_enabled():
+    metrics.register_endpoint(app.server)
+
 # Initial table
 summary_df = load_summary_table()
+# Percentile ranks / z-scores / medians per report period, refreshed incrementally
+cross_section_stats = CrossSectionStats()
 summary_columns = [{"name": col, "id": col} for col in summary_df.columns]
 summary_data = summary_df.to_dict("records")
 
@@ -471,12 +769,13 @@ summary_data = summary_df.to_dict("records")
      State('year-start-input', 'value'),
      State('year-end-input', 'value'),
      State('filing-graph', 'figure'),
-     State('yahoo-checkbox', 'value')]
+     State('yahoo-checkbox', 'value'),
+     State('graph-mode', 'value')]
 )
 def unified_callback(draw_clicks,
                      selected_values, selected_variables,
                      start_year, end_year, current_fig,
-                      yahoo_state):
+                      yahoo_state, graph_mode=DEFAULT_GRAPH_MODE):
     triggered = callback_context.triggered[0]["prop_id"].split(".")[0]
 
     if triggered == "draw-button":
@@ -506,13 +805,26 @@ def unified_callback(draw_clicks,
             selected_indexes=selected_indexes,
             start_year=start_year,
             end_year=end_year,
-            use_yahoo=use_yahoo
+            use_yahoo=use_yahoo,
+            mode=graph_mode or DEFAULT_GRAPH_MODE
         )
         return fig, ""
 
     return no_update, no_update
 
 
+@app.callback(
+    Output('company-dropdown', 'options'),
+    Input('company-dropdown', 'search_value'),
+    State('company-dropdown', 'value')
+)
+def update_company_options(search_value, selected_values):
+    if search_value is None:
+        return no_update
+    selected = selected_values if isinstance(selected_values, list) else [selected_values]
+    return build_company_dropdown_options(search_value, [v for v in selected if v])
+
+
 # ----------------------------- APP LAYOUT ----------------------------------
 app.layout = (
     html.Div([
@@ -570,6 +882,18 @@ app.layout = (
                         ], style={'display': 'flex', 'alignItems': 'center'}),
                     ], style={'marginBottom': '20px'}),
 
+                    html.Div([
+                        html.H6("Zobrazení:"),
+                        dcc.RadioItems(
+                            id='graph-mode',
+                            options=[{'label': label, 'value': value} for value, label in GRAPH_MODES.items()],
+                            value=DEFAULT_GRAPH_MODE,
+                            inline=True,
+                            inputStyle={"marginRight": "5px", "marginLeft": "20px"},
+                            style={"color": "white"}
+                        ),
+                    ], style={'marginBottom': '20px'}),
+
                     html.Button("Aktualizuj období", id='draw-button', n_clicks=0, style={
                         "backgroundColor": "#2D8CFF",
                         "color": "white",
@@ -606,6 +930,17 @@ app.layout = (
                         ),
                     ], style={'marginBottom': '10px'}),
 
+                    html.Div([
+                        html.H6("Filtr (např. pct(ROE) > 0.9 and `P/E` < 20):"),
+                        dcc.Input(
+                            id='filter-input',
+                            type='text',
+                            debounce=True,
+                            placeholder="pct(ROE) > 0.9, z(`D/E`) < 0, ROE > median(ROE)",
+                            style={'width': '100%'}
+                        ),
+                    ], style={'marginBottom': '10px'}),
+
                     html.Button(
                         "Aktualizuj tabulku",
                         id='update-table-button',
@@ -636,6 +971,39 @@ app.layout = (
                                     'color': '#e9ecef', 'border': '1px solid #444'},
                         style_header={'backgroundColor': '#2a2a2a', 'color': '#e9ecef', 'fontWeight': 'bold',
                                       'border': '1px solid #444'},
+                    ),
+
+                    html.H3("Multi-faktorové skóre", style={"marginTop": "40px", "color": "white"}),
+                    html.Div([
+                        dcc.Input(id='score-spec', type='text', value=DEFAULT_SCORE_SPEC,
+                                  placeholder="Faktory, např. -P/E:1, ROE:2, -D/E:1",
+                                  style={'marginRight': '20px', 'width': '400px'}),
+                        dcc.Input(id='score-top-n', type='number', step=1, min=1, value=DEFAULT_SCORE_TOP_N,
+                                  placeholder="Top N", style={'marginRight': '20px', 'width': '100px'}),
+                        dcc.Input(id='score-date', type='text', placeholder="K datu (YYYY-MM-DD)",
+                                  style={'marginRight': '20px', 'width': '180px'}),
+                        html.Button("Spočítej skóre", id='score-button', n_clicks=0, style={
+                            "backgroundColor": "#2D8CFF",
+                            "color": "white",
+                            "border": "none",
+                            "padding": "10px 20px",
+                            "borderRadius": "5px",
+                            "cursor": "pointer"
+                        }),
+                    ], style={'display': 'flex', 'alignItems': 'center', 'marginBottom': '10px'}),
+                    html.Div(id='score-error', style={'color': 'red', 'marginBottom': '10px'}),
+                    dash_table.DataTable(
+                        id='score-table',
+                        columns=[],
+                        data=[],
+                        sort_action='native',
+                        page_action='none',
+                        style_table={'maxHeight': '500px', 'overflowY': 'auto', 'overflowX': 'auto',
+                                     'border': '1px solid #444'},
+                        style_cell={'textAlign': 'left', 'padding': '6px', 'backgroundColor': '#222',
+                                    'color': '#e9ecef', 'border': '1px solid #444'},
+                        style_header={'backgroundColor': '#2a2a2a', 'color': '#e9ecef', 'fontWeight': 'bold',
+                                      'border': '1px solid #444'},
                     )
                 ], style={'maxWidth': '1200px', 'margin': '40px auto'})
             ]
@@ -648,18 +1016,23 @@ app.layout = (
 @app.callback(
     [Output('summary-table', 'columns'),
      Output('summary-table', 'data')],
-    Input('update-table-button', 'n_clicks'),
-    State('table-variables-dropdown', 'value')
+    [Input('update-table-button', 'n_clicks'),
+     Input('filter-input', 'n_submit')],
+    [State('table-variables-dropdown', 'value'),
+     State('filter-input', 'value')]
 )
-def update_summary_table(n_clicks, selected_vars):
+def update_summary_table(n_clicks, n_submit, selected_vars, filter_value):
     if not selected_vars:
         selected_vars = list(VARIABLES)
     else:
         selected_vars = [v for v in selected_vars if v not in {"__SEP__BASE__", "__SEP__COM__", "__SEP__SPE__"}]
 
-    df = load_summary_table(selected_vars)
+    # Variables used only by the filter (e.g. pct(ROE)) must be loaded too
+    stats = referenced_stats(filter_value)
+    extra_vars = [v for _, v in stats if v in VARIABLES and v not in selected_vars]
+    df = load_summary_table(selected_vars + list(dict.fromkeys(extra_vars)))
 
-    base_cols = ["CIK", "Ticker", "Company", "Date"]
+    base_cols = ["CIK", "Ticker", "Company", "Sector", "Date"]
     columns = []
     for col in df.columns:
         if col in base_cols:
@@ -671,12 +1044,54 @@ def update_summary_table(n_clicks, selected_vars):
             else:
                 columns.append({"name": col.title(), "id": col})
 
-    data = df.to_dict("records")
+    # Show the stats the filter refers to
+    for func, var in dict.fromkeys(stats):
+        columns.append({"name": stat_column(func, var), "id": stat_column(func, var)})
+
+    data = filter_summary_table(n_clicks, filter_value, df)
     return columns, data
 
 
+
+# ----------------------------- SCORE CALLBACK ------------------------------
+@app.callback(
+    [Output('score-table', 'columns'),
+     Output('score-table', 'data'),
+     Output('score-error', 'children')],
+    Input('score-button', 'n_clicks'),
+    [State('score-spec', 'value'),
+     State('score-top-n', 'value'),
+     State('score-date', 'value')],
+    prevent_initial_call=True
+)
+def update_score_table(n_clicks, spec, top_n, as_of):
+    try:
+        factors = parse_factor_spec(spec)
+    except ValueError as e:
+        return no_update, no_update, str(e)
+    if not factors:
+        return no_update, no_update, "Zadejte alespoň jeden faktor."
+    unknown = [name for name, _, _ in factors if name not in VARIABLES]
+    if unknown:
+        return no_update, no_update, f"Neznámé proměnné: {', '.join(unknown)}"
+
+    df = load_summary_table([name for name, _, _ in factors])
+    if df.empty:
+        return [], [], "Žádná data."
+    try:
+        snapshot = latest_snapshot(df, as_of or None)
+        version = hash((df.attrs.get("version"), as_of or None))
+        result = score_universe(snapshot, factors, top_n=int(top_n) if top_n else None, version=version)
+    except Exception as e:
+        return no_update, no_update, f"Chyba výpočtu skóre: {e}"
+
+    columns = [{"name": col, "id": col} for col in result.columns]
+    return columns, result.to_dict("records"), ""
+
 # ----------------------------- RUN SERVER ----------------------------------
 if __name__ == '__main__':
     if "WindowsApps" in sys.executable:
         raise RuntimeError("Debugger používá python.exe z WindowsApps – nepodporováno.")
+    # XBRL parse workers start before the server threads, not inside a graph callback
+    ingest_pipeline.start_parse_pool()
     app.run(debug=True, use_reloader=False)
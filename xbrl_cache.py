@@ -0,0 +1,64 @@
+"""
+Local cache of raw XBRL documents, keyed by accession number.
+
+Each filing is stored once as gzip-compressed JSON {doc_type: xml_text} under
+    xbrl_data/<filer id>/<accession>.json.gz
+An accession number identifies an immutable SEC submission, so a cached blob never
+needs revalidation: re-deriving statements (e.g. after ratio logic changes) is a
+local CPU job with no network.
+"""
+import gzip
+import json
+import os
+from typing import Dict, Iterable, List, Optional
+
+XBRL_CACHE_DIR = "xbrl_data"
+COMPRESS_LEVEL = 6
+
+
+def _blob_path(accession_no: str) -> str:
+    accession_no = str(accession_no).strip()
+    # Shard by filer id (first part of the accession) to keep directories small
+    shard = accession_no.split("-")[0] or "_"
+    return os.path.join(XBRL_CACHE_DIR, shard, f"{accession_no}.json.gz")
+
+
+def has_raw_xbrl(accession_no: Optional[str]) -> bool:
+    return bool(accession_no) and os.path.exists(_blob_path(accession_no))
+
+
+def load_raw_xbrl(accession_no: Optional[str]) -> Optional[Dict[str, str]]:
+    """Return the cached {doc_type: text} of a filing, or None if not cached."""
+    if not accession_no:
+        return None
+    path = _blob_path(accession_no)
+    if not os.path.exists(path):
+        return None
+    try:
+        with gzip.open(path, "rt", encoding="utf-8") as f:
+            return json.load(f)
+    except Exception as e:
+        print(f"[ERROR] Corrupt XBRL cache entry {path}: {e}")
+        return None
+
+
+def save_raw_xbrl(accession_no: Optional[str], raw: Dict[str, str]) -> Optional[str]:
+    """Store raw documents of a filing (atomic write). Returns the blob path."""
+    if not accession_no or not raw:
+        return None
+    path = _blob_path(accession_no)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    try:
+        with gzip.open(tmp_path, "wt", encoding="utf-8", compresslevel=COMPRESS_LEVEL) as f:
+            json.dump(raw, f)
+        os.replace(tmp_path, path)
+    except Exception as e:
+        print(f"[ERROR] Failed to cache XBRL {accession_no}: {e}")
+        return None
+    return path
+
+
+def cached_accessions(accessions: Iterable[str]) -> List[str]:
+    """Subset of `accessions` available in the cache."""
+    return [a for a in accessions if has_raw_xbrl(a)]